@@ -1,21 +1,149 @@
-from flask import Flask, request, jsonify
+from flask import Blueprint, Flask, Response, request, jsonify, g
 from flask_cors import CORS
-from db.connection import database
+from werkzeug.middleware.proxy_fix import ProxyFix
+from db.connection import Database, database, metricas_pool
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 import os
+import threading
+import time
+import logging
 from dotenv import load_dotenv
-from services.chat_service import chat_service
-import bcrypt
+from services.cardapio_cache import CardapioCache
+from db.models.pedidos import listar_pedidos_com_usuario, ORDENACAO_PEDIDOS
+from services.paginacao import ler_parametros, filtro_apos, codificar_cursor, resposta_paginada, resposta_em_stream, CursorInvalido, LIMITE_MAXIMO, TAMANHO_LOTE_STREAM
+from services.senhas import password_hasher, FilaDeSenhasCheia
+from services.tokens import token_service
+from services.auth import requer_token, usuario_da_requisicao
+from services.limites import LimitadorDeTaxa, limitar
+from services.totais import calcular_totais
+from services.eventos import barramento, publicar_mudanca, EventosDoBanco, EVENTOS_FONTE
+from services.resumos import registrar_venda, registrar_mudanca_status, vendas_por_dia, pedidos_por_status, dia_do_pedido
+from services.logs import configurar_logging, logs_descartados, AMOSTRA_LOGS, TemposFormatados
+from services import logs, metricas
+from services.preguicoso import Preguicoso, criado, descartar
 import re
 from bson.objectid import ObjectId
 
 load_dotenv()
 
-app = Flask(__name__)
-CORS(app)
+logger = logging.getLogger(__name__)
+
+rotas = Blueprint("polichat", __name__)
+
+
+def _criar_chat_service():
+    # Import adiado: o ChatService traz thefuzz, babel e pytz e monta o índice de intenções.
+    from services.chat_service import chat_service
+    return chat_service
+
+
+# Criados na primeira requisição que precisa deles, não no import do módulo.
+chat_service = Preguicoso(_criar_chat_service)
+cardapio_cache = Preguicoso(lambda: CardapioCache(
+    database.cardapio,
+    ttl=float(os.getenv("CARDAPIO_CACHE_TTL", 60)),
+    versoes=database.versoes,
+    intervalo_versao=float(os.getenv("CARDAPIO_VERSAO_INTERVALO", 5))
+))
+
+# Leituras independentes do /chat rodam em paralelo neste pool.
+def _criar_chat_executor():
+    return ThreadPoolExecutor(max_workers=int(os.getenv("CHAT_IO_WORKERS", 8)), thread_name_prefix="chat-io")
+
+chat_executor = _criar_chat_executor()
+
+# Fonte dos eventos de pedidos (SSE): com EVENTOS_FONTE=change_stream o Mongo avisa todos os processos.
+# O change stream só começa com o primeiro assinante do feed, nunca no import: no mestre do
+# gunicorn (preload) ninguém assina, e uma thread lá dentro poderia segurar locks no fork.
+SSE_KEEPALIVE = float(os.getenv("SSE_KEEPALIVE", 15))
+_eventos_do_banco = None
+_lock_eventos_do_banco = threading.Lock()
+
+# --- Limites de taxa (token bucket por chave) ---
+# Rajada = requisições seguidas permitidas; por minuto = ritmo sustentado depois dela.
+
+def _limitador(nome, rajada, por_minuto):
+    return LimitadorDeTaxa(
+        nome,
+        rajada=int(os.getenv(f"LIMITE_{nome.upper()}_RAJADA", rajada)),
+        por_segundo=float(os.getenv(f"LIMITE_{nome.upper()}_POR_MINUTO", por_minuto)) / 60,
+        max_chaves=int(os.getenv("LIMITE_MAX_CHAVES", 10000))
+    )
+
+limite_chat = _limitador("chat", 10, 30)
+limite_login_email = _limitador("login_email", 5, 10)
+# O limite por e-mail é o controle principal contra tentativa de senhas; o por IP só segura
+# abusos grosseiros, com folga para muitos alunos atrás do mesmo NAT da escola.
+limite_login_ip = _limitador("login_ip", 100, 300)
+LIMITADORES = (limite_chat, limite_login_email, limite_login_ip)
+
+def _email_do_login():
+    dados = request.get_json(silent=True)
+    email = dados.get("email") if isinstance(dados, dict) else None
+    return email.strip().lower() if isinstance(email, str) and email.strip() else None
+
+def _ip_da_requisicao():
+    # Com PROXIES_CONFIAVEIS > 0 o ProxyFix já trocou remote_addr pelo IP do cliente.
+    return request.remote_addr
+
+# Proxies reversos (nginx, balanceador) à frente do app: quantos valores de X-Forwarded-For
+# e X-Forwarded-Proto, da direita para a esquerda, são confiáveis. 0 ignora esses cabeçalhos.
+PROXIES_CONFIAVEIS = int(os.getenv("PROXIES_CONFIAVEIS", 0))
+
+# --- Métricas ---
+
+metricas.registro.gauge(
+    "polichat_senhas", "Estado do pool de hashing de senhas.",
+    lambda: {(chave,): valor for chave, valor in password_hasher.estatisticas().items()}, ("estatistica",))
+metricas.registro.gauge(
+    "polichat_mongo_pool", "Conexões do pool do MongoDB: abertas, em uso e operações esperando por uma.",
+    lambda: {(chave,): valor for chave, valor in metricas_pool.estatisticas().items()}, ("estatistica",))
+metricas.registro.gauge(
+    "polichat_limite_chaves", "Chaves (usuários, e-mails, IPs) com balde em memória, por limite.",
+    lambda: {(limitador.nome,): len(limitador) for limitador in LIMITADORES}, ("limite",))
+metricas.registro.contador_lido(
+    "polichat_logs_descartados_total", "Registros de log descartados por fila cheia.",
+    lambda: {(): logs_descartados()})
+metricas.registro.gauge(
+    "polichat_eventos_assinantes", "Conexões abertas no feed de eventos de pedidos.",
+    lambda: {(): barramento.assinantes})
+metricas.registro.gauge(
+    "polichat_cardapio_versao", "Versão do cardápio em cache.",
+    lambda: {(): cardapio_cache.versao} if criado(cardapio_cache) else {})
+
+@rotas.before_app_request
+def iniciar_cronometro():
+    g.inicio_requisicao = time.perf_counter()
+
+@rotas.after_app_request
+def registrar_metricas(response):
+    inicio = g.pop("inicio_requisicao", None)
+    if inicio is not None:
+        # A regra ("/admin/usuarios/<user_id>") mantém a cardinalidade dos labels baixa.
+        rota = request.url_rule.rule if request.url_rule else "nao_encontrada"
+        metricas.http_latencia.observar(time.perf_counter() - inicio, rota=rota, metodo=request.method)
+        metricas.http_requisicoes.inc(rota=rota, metodo=request.method, status=response.status_code)
+    return response
+
+@rotas.route("/metrics", methods=["GET"])
+def exportar_metricas():
+    return Response(metricas.registro.exposicao(), mimetype="text/plain; version=0.0.4; charset=utf-8")
 
 # --- Rotas Usuários ---
 
+def servidor_ocupado():
+    return jsonify({"erro": "Servidor ocupado, tente novamente em instantes"}), 503, {"Retry-After": "1"}
+
+def atualizar_hash_se_necessario(colecao, documento, senha):
+    # Hash gerado com outro cost factor: regrava com o BCRYPT_ROUNDS atual, aproveitando a senha em texto do login.
+    if not password_hasher.precisa_rehash(documento["senha"]):
+        return
+    try:
+        colecao.update_one({"_id": documento["_id"]}, {"$set": {"senha": password_hasher.gerar_hash(senha)}})
+    except FilaDeSenhasCheia:
+        pass  # fica para o próximo login
+
 def validar_email(email):
     email_regex = r"^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$"
     
@@ -30,7 +158,9 @@ def validar_email(email):
             
     return False, "E-mail não pertence a um domínio permitido."
 
-@app.route("/usuarios/login", methods=["POST"])
+@rotas.route("/usuarios/login", methods=["POST"])
+@limitar(limite_login_ip, _ip_da_requisicao)
+@limitar(limite_login_email, _email_do_login)
 def login():
     try:
         dados = request.get_json()
@@ -57,23 +187,34 @@ def login():
         if senha_hash is None:
             return jsonify({"erro": "Erro de configuração do usuário"}), 500
 
-        if isinstance(senha_hash, bytes):
-            valido = bcrypt.checkpw(senha.encode('utf-8'), senha_hash)
-        else:
-            valido = bcrypt.checkpw(senha.encode('utf-8'), senha_hash.encode('utf-8'))
+        valido = password_hasher.verificar(senha, senha_hash)
 
         if valido:
+            atualizar_hash_se_necessario(database.usuarios, usuario, senha)
             usuario["_id"] = str(usuario["_id"])
             usuario.pop("senha", None)
+            usuario["token"] = token_service.emitir(usuario["_id"], usuario.get("role", "user"))
             return jsonify(usuario), 200
 
         return jsonify({"erro": "Credenciais inválidas"}), 401
 
+    except FilaDeSenhasCheia:
+        return servidor_ocupado()
     except Exception as e:
-        print(f"Erro no login: {str(e)}")
+        logger.exception("Erro no login: %s", e)
         return jsonify({"erro": "Erro interno no servidor"}), 500
 
-@app.route("/usuarios/cadastro", methods=["POST"])
+@rotas.route("/usuarios/logout", methods=["POST"])
+@requer_token()
+def logout():
+    try:
+        token_service.revogar(g.claims)
+        return jsonify({"mensagem": "Sessão encerrada"}), 200
+    except Exception as e:
+        logger.exception("Erro no logout: %s", e)
+        return jsonify({"erro": "Erro interno no servidor"}), 500
+
+@rotas.route("/usuarios/cadastro", methods=["POST"])
 def cadastrar_usuario():
     try:
         dados = request.get_json()
@@ -95,7 +236,7 @@ def cadastrar_usuario():
         if database.usuarios.find_one({"email": email}):
             return jsonify({"erro": "Usuário já existe"}), 409
 
-        senha_hash = bcrypt.hashpw(senha.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+        senha_hash = password_hasher.gerar_hash(senha)
 
         database.usuarios.insert_one({
             "email": email,
@@ -105,68 +246,98 @@ def cadastrar_usuario():
 
         return jsonify({"mensagem": "Usuário cadastrado com sucesso"}), 201
 
+    except FilaDeSenhasCheia:
+        return servidor_ocupado()
     except Exception as e:
-        print(f"Erro no cadastro: {str(e)}")
+        logger.exception("Erro no cadastro: %s", e)
         return jsonify({"erro": "Erro interno no servidor"}), 500
 
 # ----------------------------------------------------------------------------
 
-@app.route("/admins/login", methods=["POST"])
+@rotas.route("/admins/login", methods=["POST"])
+@limitar(limite_login_ip, _ip_da_requisicao)
+@limitar(limite_login_email, _email_do_login)
 def admin_login():
     try:
         dados = request.get_json()
         email = dados.get("email")
         senha = dados.get("senha")
 
-        print(f"DEBUG BACKEND: Tentativa de login admin - Email: {email}, Senha Recebida (nao hash): {senha}")
+        logger.debug("Tentativa de login admin - Email: %s", email)
 
         admin = database.admins.find_one({"email": email})
         if not admin:
-            print(f"DEBUG BACKEND: Admin com email '{email}' NAO ENCONTRADO.")
+            logger.debug("Admin com email '%s' NAO ENCONTRADO.", email)
             return jsonify({"erro": "Credenciais de administrador inválidas"}), 401
 
         senha_hash_admin = admin.get("senha")
-        print(f"DEBUG BACKEND: Hash do DB (parcial): {senha_hash_admin[:10]}...")
 
         if senha_hash_admin is None:
-            print("DEBUG BACKEND: Campo 'senha' ausente para o admin no DB.")
+            logger.debug("Campo 'senha' ausente para o admin no DB.")
             return jsonify({"erro": "Erro de configuração do administrador"}), 500
 
-        senha_recebida_bytes = senha.encode('utf-8')
-        senha_hash_db_bytes = senha_hash_admin.encode('utf-8') if isinstance(senha_hash_admin, str) else senha_hash_admin
-
-        print(f"DEBUG BACKEND: Chamando bcrypt.checkpw com senha_recebida_bytes e senha_hash_db_bytes.")
-        valido = bcrypt.checkpw(senha_recebida_bytes, senha_hash_db_bytes)
+        logger.debug("Verificando senha no pool de hashing.")
+        valido = password_hasher.verificar(senha, senha_hash_admin)
         
         if valido:
-            print(f"DEBUG BACKEND: Senha VALIDADA com sucesso para email: {email}.")
+            logger.debug("Senha VALIDADA com sucesso para email: %s.", email)
+            atualizar_hash_se_necessario(database.admins, admin, senha)
             admin["_id"] = str(admin["_id"])
             admin.pop("senha", None)
+            admin["token"] = token_service.emitir(admin["_id"], "admin")
             return jsonify(admin), 200
         else:
-            print(f"DEBUG BACKEND: Senha INAVALIDA para email: {email}. bcrypt.checkpw retornou False.")
+            logger.debug("Senha INAVALIDA para email: %s. bcrypt.checkpw retornou False.", email)
             return jsonify({"erro": "Credenciais de administrador inválidas"}), 401
 
+    except FilaDeSenhasCheia:
+        return servidor_ocupado()
     except Exception as e:
-        print(f"ERRO CRÍTICO no login do administrador: {str(e)}")
+        logger.exception("Erro crítico no login do administrador: %s", e)
         return jsonify({"erro": "Erro interno no servidor"}), 500
     
+# --- Paginação das listagens administrativas ---
+#
+# ?limit=N&after=<cursor> pagina por keyset (o próximo cursor vem no header
+# X-Proximo-Cursor); ?stream=1 gera a resposta direto do cursor do Mongo.
+
+def listar_paginado(buscar, ordenacao, formatar):
+    try:
+        limite, apos, stream = ler_parametros(request.args)
+        filtro = filtro_apos(apos, ordenacao) if apos else {}
+    except (ValueError, CursorInvalido):
+        return jsonify({"erro": "Parâmetros de paginação inválidos"}), 400
+
+    documentos = buscar(filtro, limite, stream)
+    if stream:
+        return resposta_em_stream(documentos, formatar)
+    return resposta_paginada(documentos, ordenacao, formatar, limite), 200
+
 # --- Rotas de Gerenciamento de Usuário (Administrador) ---
-    
-@app.route('/admin/usuarios/todos', methods=['GET'])
 
+ORDENACAO_USUARIOS = [("_id", 1)]
+
+def _formatar_usuario(user):
+    user['_id'] = str(user['_id'])
+    return user
+
+def _buscar_usuarios(filtro, limite, stream):
+    cursor = database.usuarios.find(filtro, {"senha": 0}).sort(ORDENACAO_USUARIOS)
+    if stream:
+        cursor = cursor.batch_size(TAMANHO_LOTE_STREAM)
+    return cursor.limit(limite) if limite else cursor
+    
+@rotas.route('/admin/usuarios/todos', methods=['GET'])
+@requer_token("admin")
 def get_all_users_admin():
     try:
-        users = list(database.usuarios.find({}, {"senha": 0}))
-        for user in users:
-            user['_id'] = str(user['_id'])
-        return jsonify(users), 200
+        return listar_paginado(_buscar_usuarios, ORDENACAO_USUARIOS, _formatar_usuario)
     except Exception as e:
-        print(f"ERRO ao buscar todos os usuários: {str(e)}")
+        logger.exception("Erro ao buscar todos os usuários: %s", e)
         return jsonify({"erro": "Erro interno ao buscar usuários"}), 500
 
-@app.route('/admin/usuarios', methods=['POST'])
-
+@rotas.route('/admin/usuarios', methods=['POST'])
+@requer_token("admin")
 def add_user_admin():
     try:
         dados = request.get_json()
@@ -185,7 +356,7 @@ def add_user_admin():
         if database.usuarios.find_one({"email": email}):
             return jsonify({"erro": "Usuário já existe"}), 409
 
-        senha_hash = bcrypt.hashpw(senha.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+        senha_hash = password_hasher.gerar_hash(senha)
 
         database.usuarios.insert_one({
             "email": email,
@@ -194,23 +365,28 @@ def add_user_admin():
             "criado_em": datetime.utcnow()
         })
         return jsonify({"mensagem": "Usuário adicionado com sucesso!", "email": email, "role": role}), 201
+    except FilaDeSenhasCheia:
+        return servidor_ocupado()
     except Exception as e:
-        print(f"ERRO ao adicionar usuário: {str(e)}")
+        logger.exception("Erro ao adicionar usuário: %s", e)
         return jsonify({"erro": "Erro interno ao adicionar usuário"}), 500
 
-@app.route('/admin/usuarios/<user_id>', methods=['DELETE'])
+@rotas.route('/admin/usuarios/<user_id>', methods=['DELETE'])
+@requer_token("admin")
 def delete_user_admin(user_id):
     try:
         result = database.usuarios.delete_one({"_id": ObjectId(user_id)})
         if result.deleted_count > 0:
+            token_service.revogar_usuario(user_id)
             return jsonify({"mensagem": "Usuário excluído com sucesso!"}), 200
         else:
             return jsonify({"erro": "Usuário não encontrado"}), 404
     except Exception as e:
-        print(f"ERRO ao excluir usuário: {str(e)}")
+        logger.exception("Erro ao excluir usuário: %s", e)
         return jsonify({"erro": "Erro interno ao excluir usuário"}), 500
 
-@app.route('/admin/usuarios/<user_id>', methods=['PUT'])
+@rotas.route('/admin/usuarios/<user_id>', methods=['PUT'])
+@requer_token("admin")
 def update_user_admin(user_id):
     try:
         dados = request.get_json()
@@ -229,7 +405,7 @@ def update_user_admin(user_id):
             update_fields['email'] = dados['email']
         
         if 'senha' in dados:
-            senha_hash = bcrypt.hashpw(dados['senha'].encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+            senha_hash = password_hasher.gerar_hash(dados['senha'])
             update_fields['senha'] = senha_hash
         
         if 'role' in dados:
@@ -243,16 +419,26 @@ def update_user_admin(user_id):
         result = database.usuarios.update_one({"_id": ObjectId(user_id)}, {"$set": update_fields})
 
         if result.modified_count > 0:
+            # Papel, e-mail ou senha mudaram: tokens já emitidos para esse usuário deixam de valer.
+            token_service.revogar_usuario(user_id)
             return jsonify({"mensagem": "Usuário atualizado com sucesso!"}), 200
         else:
             return jsonify({"erro": "Usuário não encontrado ou nenhum dado para atualizar"}), 404
+    except FilaDeSenhasCheia:
+        return servidor_ocupado()
     except Exception as e:
-        print(f"ERRO ao atualizar usuário: {str(e)}")
+        logger.exception("Erro ao atualizar usuário: %s", e)
         return jsonify({"erro": "Erro interno ao atualizar usuário"}), 500
     
+@rotas.route('/admin/metricas/senhas', methods=['GET'])
+@requer_token("admin")
+def get_password_hashing_metrics():
+    return jsonify(password_hasher.estatisticas()), 200
+    
 # --- Rotas de Gerenciamento de Cardápio (Administrador) ---
 
-@app.route('/admin/cardapio', methods=['POST'])
+@rotas.route('/admin/cardapio', methods=['POST'])
+@requer_token("admin")
 def add_menu_item():
     try:
         dados = request.get_json()
@@ -261,12 +447,14 @@ def add_menu_item():
             return jsonify({"erro": "Campos obrigatórios faltando"}), 400
 
         result = database.cardapio.insert_one(dados)
+        cardapio_cache.invalidar()
         return jsonify({"mensagem": "Item adicionado com sucesso!", "item_id": str(result.inserted_id)}), 201
     except Exception as e:
-        print(f"ERRO ao adicionar item do cardápio: {str(e)}")
+        logger.exception("Erro ao adicionar item do cardápio: %s", e)
         return jsonify({"erro": "Erro interno ao adicionar item do cardápio"}), 500
 
-@app.route('/admin/cardapio/<item_id>', methods=['PUT'])
+@rotas.route('/admin/cardapio/<item_id>', methods=['PUT'])
+@requer_token("admin")
 def update_menu_item(item_id):
     try:
         dados = request.get_json()
@@ -276,78 +464,88 @@ def update_menu_item(item_id):
         result = database.cardapio.update_one({"_id": ObjectId(item_id)}, {"$set": dados})
 
         if result.modified_count > 0:
+            cardapio_cache.invalidar()
             return jsonify({"mensagem": "Item atualizado com sucesso!"}), 200
         else:
             return jsonify({"erro": "Item não encontrado ou nenhum dado para atualizar"}), 404
     except Exception as e:
-        print(f"ERRO ao atualizar item do cardápio: {str(e)}")
+        logger.exception("Erro ao atualizar item do cardápio: %s", e)
         return jsonify({"erro": "Erro interno ao atualizar item do cardápio"}), 500
 
-@app.route('/admin/cardapio/<item_id>', methods=['DELETE'])
+@rotas.route('/admin/cardapio/<item_id>', methods=['DELETE'])
+@requer_token("admin")
 def delete_menu_item(item_id):
     try:
         result = database.cardapio.delete_one({"_id": ObjectId(item_id)})
         if result.deleted_count > 0:
+            cardapio_cache.invalidar()
             return jsonify({"mensagem": "Item excluído com sucesso!"}), 200
         else:
             return jsonify({"erro": "Item não encontrado"}), 404
     except Exception as e:
-        print(f"ERRO ao excluir item do cardápio: {str(e)}")
+        logger.exception("Erro ao excluir item do cardápio: %s", e)
         return jsonify({"erro": "Erro interno ao excluir item do cardápio"}), 500
 
-@app.route('/admin/cardapio/todos', methods=['GET'])
+ORDENACAO_CARDAPIO_ADMIN = [("categoria", 1), ("nome", 1), ("_id", 1)]
+
+def _formatar_item_cardapio(item):
+    item['_id'] = str(item['_id'])
+    return item
+
+def _buscar_itens_cardapio(filtro, limite, stream):
+    cursor = database.cardapio.find(filtro).sort(ORDENACAO_CARDAPIO_ADMIN)
+    if stream:
+        cursor = cursor.batch_size(TAMANHO_LOTE_STREAM)
+    return cursor.limit(limite) if limite else cursor
+
+@rotas.route('/admin/cardapio/todos', methods=['GET'])
+@requer_token("admin")
 def get_all_menu_items():
     try:
-        itens = list(database.cardapio.find({}).sort([("categoria", 1), ("nome", 1)]))
-        for item in itens:
-            item['_id'] = str(item['_id'])
-        return jsonify(itens), 200
+        return listar_paginado(_buscar_itens_cardapio, ORDENACAO_CARDAPIO_ADMIN, _formatar_item_cardapio)
     except Exception as e:
-        print(f"ERRO ao buscar todos os itens do cardápio: {str(e)}")
+        logger.exception("Erro ao buscar todos os itens do cardápio: %s", e)
         return jsonify({"erro": "Erro interno ao buscar itens do cardápio"}), 500
 
 # --- Rotas de Gerenciamento de Pedidos (Administrador) ---
 
-@app.route('/admin/pedidos/todos', methods=['GET'])
-def get_all_orders():
-    try:
-        pedidos_cursor = database.pedidos.find().sort("data", -1)
-        pedidos_formatados = []
-        for pedido in pedidos_cursor:
-            pedido['_id'] = str(pedido['_id'])
-            if 'data' in pedido and isinstance(pedido['data'], datetime):
-                pedido['data_pedido'] = pedido['data'].isoformat() + 'Z'
-            else:
-                pedido['data_pedido'] = datetime.utcnow().isoformat() + 'Z'
-            
-            processo_itens = []
-            total_calculado_pedido = 0
-            for item in pedido.get('itens', []):
-                if isinstance(item, dict):
-                    item['_id'] = str(item.get('_id', ObjectId()))
-                    item_preco = float(item.get('preco', 0.00))
-                    item_quantidade = int(item.get('quantidade', 1))
-                    
-                    total_calculado_pedido += (item_preco * item_quantidade)
-                    processo_itens.append(item)
-                else:
-                    print(f"AVISO: Item de pedido mal formatado encontrado: {item} no pedido {pedido['_id']}")
-                    processo_itens.append({"nome": str(item), "quantidade": 1, "preco": 0.00, "_id": str(ObjectId())})
-            
-            pedido['itens'] = processo_itens
-            pedido['total'] = total_calculado_pedido 
+def _formatar_pedido_admin(pedido):
+    pedido['_id'] = str(pedido['_id'])
+    if 'data' in pedido and isinstance(pedido['data'], datetime):
+        pedido['data_pedido'] = pedido['data'].isoformat() + 'Z'
+    else:
+        pedido['data_pedido'] = datetime.utcnow().isoformat() + 'Z'
+    
+    processo_itens = []
+    for item in pedido.get('itens', []):
+        if isinstance(item, dict):
+            item['_id'] = str(item.get('_id', ObjectId()))
+            processo_itens.append(item)
+        else:
+            logger.warning("Item de pedido mal formatado encontrado: %s no pedido %s", item, pedido['_id'])
+            processo_itens.append({"nome": str(item), "quantidade": 1, "preco": 0.00, "_id": str(ObjectId())})
+    
+    pedido['itens'] = processo_itens
 
-            usuario = database.usuarios.find_one({"_id": ObjectId(pedido['usuario_id'])})
-            pedido['usuario_info'] = {"nome": usuario.get("email"), "id": str(usuario["_id"])} if usuario else {"nome": "Desconhecido", "id": pedido['usuario_id']}
+    usuario_email = pedido.pop('usuario_email', None)
+    pedido['usuario_info'] = {"nome": usuario_email, "id": pedido['usuario_id']} if usuario_email else {"nome": "Desconhecido", "id": pedido['usuario_id']}
+    return pedido
 
-            pedidos_formatados.append(pedido)
-            
-        return jsonify(pedidos_formatados), 200
+def _buscar_pedidos_admin(filtro, limite, stream):
+    # Uma única agregação traz os pedidos com o usuário ($lookup) e o total já somado.
+    return listar_pedidos_com_usuario(filtro, limite, TAMANHO_LOTE_STREAM if stream else None)
+
+@rotas.route('/admin/pedidos/todos', methods=['GET'])
+@requer_token("admin")
+def get_all_orders():
+    try:
+        return listar_paginado(_buscar_pedidos_admin, ORDENACAO_PEDIDOS, _formatar_pedido_admin)
     except Exception as e:
-        print(f"ERRO ao buscar todos os pedidos: {str(e)}")
+        logger.exception("Erro ao buscar todos os pedidos: %s", e)
         return jsonify({"erro": "Erro interno ao buscar todos os pedidos"}), 500
 
-@app.route('/admin/pedidos/<pedido_id>/status', methods=['PUT'])
+@rotas.route('/admin/pedidos/<pedido_id>/status', methods=['PUT'])
+@requer_token("admin")
 def update_order_status(pedido_id):
     try:
         dados = request.get_json()
@@ -359,126 +557,237 @@ def update_order_status(pedido_id):
         if novo_status not in allowed_statuses:
             return jsonify({"erro": f"Status inválido. Use um de: {', '.join(allowed_statuses)}"}), 400
 
-        result = database.pedidos.update_one(
-            {"_id": ObjectId(pedido_id)},
-            {"$set": {"status": novo_status, "data_atualizacao_status": datetime.utcnow()}}
+        # O documento anterior traz o status antigo, que sai da contagem de pedidos_por_status.
+        anterior = database.pedidos.find_one_and_update(
+            {"_id": ObjectId(pedido_id), "status": {"$ne": novo_status}},
+            {"$set": {"status": novo_status, "data_atualizacao_status": datetime.utcnow()}},
+            projection={"status": 1}
         )
 
-        if result.modified_count > 0:
+        if anterior is not None:
+            registrar_mudanca_status(database, anterior.get("status"), novo_status)
+            publicar_mudanca("status_alterado", {"_id": pedido_id, "status": novo_status})
             return jsonify({"mensagem": "Status do pedido atualizado com sucesso!", "novo_status": novo_status}), 200
         else:
             return jsonify({"erro": "Pedido não encontrado ou status já é o mesmo"}), 404
     except Exception as e:
-        print(f"ERRO ao atualizar status do pedido: {str(e)}")
+        logger.exception("Erro ao atualizar status do pedido: %s", e)
         return jsonify({"erro": "Erro interno ao atualizar status do pedido"}), 500
 
-@app.route('/admin/pedidos/<pedido_id>', methods=['DELETE'])
+@rotas.route('/admin/pedidos/<pedido_id>', methods=['DELETE'])
+@requer_token("admin")
 def delete_order(pedido_id):
     try:
-        result = database.pedidos.delete_one({"_id": ObjectId(pedido_id)})
-        if result.deleted_count > 0:
+        pedido = database.pedidos.find_one_and_delete(
+            {"_id": ObjectId(pedido_id)},
+            projection={"itens": 1, "data": 1, "status": 1}
+        )
+        if pedido is not None:
+            registrar_venda(database, pedido, sinal=-1)
+            publicar_mudanca("pedido_removido", {"_id": pedido_id})
             return jsonify({"mensagem": "Pedido excluído com sucesso!"}), 200
         else:
             return jsonify({"erro": "Pedido não encontrado"}), 404
     except Exception as e:
-        print(f"ERRO ao excluir pedido: {str(e)}")
+        logger.exception("Erro ao excluir pedido: %s", e)
         return jsonify({"erro": "Erro interno ao excluir pedido"}), 500 
 
+# Telas da cozinha e do administrador: novos pedidos e mudanças de status via Server-Sent Events.
+# O EventSource do navegador não envia cabeçalhos, então o token pode vir em ?token=.
+@rotas.route('/admin/pedidos/eventos', methods=['GET'])
+@requer_token("admin", aceitar_na_url=True)
+def stream_order_events():
+    ultimo_id = request.headers.get("Last-Event-ID") or request.args.get("ultimo_evento")
+    if EVENTOS_FONTE == "change_stream":
+        _iniciar_eventos_do_banco()
+
+    def gerar():
+        yield "retry: 3000\n\n"
+        for evento in barramento.assinar(ultimo_id, espera=SSE_KEEPALIVE):
+            yield ": keepalive\n\n" if evento is None else evento.formatar()
+
+    resposta = Response(gerar(), mimetype="text/event-stream")
+    resposta.headers["Cache-Control"] = "no-cache"
+    resposta.headers["X-Accel-Buffering"] = "no"
+    return resposta
+
+# --- Relatórios (Administrador) ---
+
+@rotas.route('/admin/relatorios/vendas', methods=['GET'])
+@requer_token("admin")
+def get_sales_report():
+    # Lê só os resumos mantidos no checkout: o custo depende do período, não do número de pedidos.
+    hoje = dia_do_pedido(datetime.utcnow())
+    de = request.args.get('de', hoje)
+    ate = request.args.get('ate', de)
+    try:
+        for dia in (de, ate):
+            datetime.strptime(dia, "%Y-%m-%d")
+    except ValueError:
+        return jsonify({"erro": "Datas devem estar no formato AAAA-MM-DD"}), 400
+
+    try:
+        vendas = vendas_por_dia(database, de, ate)
+        return jsonify({
+            "de": de,
+            "ate": ate,
+            "vendas": vendas,
+            "receita_total": round(sum(linha["receita"] for linha in vendas), 2)
+        }), 200
+    except Exception as e:
+        logger.exception("Erro ao gerar relatório de vendas: %s", e)
+        return jsonify({"erro": "Erro interno ao gerar relatório de vendas"}), 500
+
+@rotas.route('/admin/relatorios/status', methods=['GET'])
+@requer_token("admin")
+def get_status_report():
+    try:
+        return jsonify(pedidos_por_status(database)), 200
+    except Exception as e:
+        logger.exception("Erro ao gerar relatório de status: %s", e)
+        return jsonify({"erro": "Erro interno ao gerar relatório de status"}), 500
+
 # --- Rotas do Chat ---
 
-@app.route("/chat", methods=["POST"])
+def _cronometrar(funcao, *args):
+    inicio = time.perf_counter()
+    resultado = funcao(*args)
+    return resultado, (time.perf_counter() - inicio) * 1000
+
+def _buscar_pedidos_finalizados(usuario_id):
+    return list(database.pedidos.find({"usuario_id": usuario_id}))
+
+@rotas.route("/chat", methods=["POST"])
+@requer_token()
+@limitar(limite_chat, lambda: g.usuario_id)
 def enviar_mensagem():
     try:
         dados = request.get_json()
-        usuario_id = dados.get("usuario_id")
+        usuario_id = usuario_da_requisicao(dados.get("usuario_id"))
         mensagem = dados.get("mensagem")
 
-        print(f"DEBUG: Mensagem recebida para usuario_id: {usuario_id}")
+        if usuario_id is None:
+            return jsonify({"erro": "Acesso negado"}), 403
+
+        logger.debug("Mensagem recebida para usuario_id: %s", usuario_id, extra={"amostra": AMOSTRA_LOGS})
 
         if not usuario_id or not mensagem:
             return jsonify({"erro": "Dados incompletos"}), 400
 
-        if 'mensagens' not in database.list_collection_names():
-            database.create_collection('mensagens')
-            print("Coleção 'mensagens' criada")
-
-        # 1. Obter o pedido em aberto para o usuário específico
-        pedido_em_aberto_usuario = database.pedidos_em_aberto.find_one({"usuario_id": usuario_id})
+        data_mensagem = datetime.utcnow()
+        tempos = {}
+        inicio = time.perf_counter()
 
-        # 2. Obter todos os pedidos finalizados para o histórico
-        todos_os_pedidos_finalizados = list(database.pedidos.find({"usuario_id": usuario_id}))
+        # 1-3. Pedido em aberto, pedidos finalizados e cardápio (cache) são lidos em paralelo
+        futuro_pedido_aberto = chat_executor.submit(_cronometrar, database.pedidos_em_aberto.find_one, {"usuario_id": usuario_id})
+        futuro_pedidos_finalizados = chat_executor.submit(_cronometrar, _buscar_pedidos_finalizados, usuario_id)
+        futuro_cardapio = chat_executor.submit(_cronometrar, cardapio_cache.obter)
 
-        # 3. Obter o cardápio disponível
-        cardapio_disponivel = list(database.cardapio.find({"disponibilidade": True}))
+        pedido_em_aberto_usuario, tempos["pedido_aberto"] = futuro_pedido_aberto.result()
+        todos_os_pedidos_finalizados, tempos["pedidos_finalizados"] = futuro_pedidos_finalizados.result()
+        cardapio_disponivel, tempos["cardapio"] = futuro_cardapio.result()
+        tempos["leituras"] = (time.perf_counter() - inicio) * 1000
 
         # 4. Passar todos os dados necessários para o chat_service.processar_mensagem
+        inicio = time.perf_counter()
         resposta = chat_service.processar_mensagem(
             usuario_id, 
             mensagem, 
             pedido_em_aberto_usuario,
             todos_os_pedidos_finalizados,
-            cardapio_disponivel,
+            cardapio_disponivel.itens,
             database.pedidos_em_aberto,
-            database.pedidos
+            database.pedidos,
+            versao_cardapio=cardapio_disponivel.versao
         )
+        tempos["processamento"] = (time.perf_counter() - inicio) * 1000
 
-        result_usuario = database.mensagens.insert_one({
-            "usuario_id": usuario_id,
-            "mensagem": mensagem,
-            "origem": "usuario",
-            "data": datetime.utcnow()
-        })
-
-        result_bot = database.mensagens.insert_one({
-            "usuario_id": usuario_id,
-            "mensagem": resposta,
-            "origem": "bot",
-            "data": datetime.utcnow()
-        })
+        # 5. Mensagem do usuário e resposta do bot gravadas numa única ida ao banco
+        inicio = time.perf_counter()
+        result = database.mensagens.insert_many([
+            {
+                "usuario_id": usuario_id,
+                "mensagem": mensagem,
+                "origem": "usuario",
+                "data": data_mensagem
+            },
+            {
+                "usuario_id": usuario_id,
+                "mensagem": resposta,
+                "origem": "bot",
+                "data": datetime.utcnow()
+            }
+        ])
+        tempos["gravacao"] = (time.perf_counter() - inicio) * 1000
 
-        print(f"Mensagens salvas - Usuário: {result_usuario.inserted_id}, Bot: {result_bot.inserted_id}")
+        logger.debug("Mensagens salvas - Usuário: %s, Bot: %s", result.inserted_ids[0], result.inserted_ids[1], extra={"amostra": AMOSTRA_LOGS})
+        logger.info("Tempos /chat usuario_id=%s: %s", usuario_id, TemposFormatados(tempos), extra={"amostra": AMOSTRA_LOGS})
 
         return jsonify({"resposta": resposta}), 200
 
     except Exception as e:
-        print(f"ERRO GRAVE em /chat: {str(e)}")
+        logger.exception("Erro grave em /chat: %s", e)
         return jsonify({"erro": "Erro interno no servidor"}), 500
 
-@app.route("/chat/historico", methods=["GET"])
+# Histórico do chat: páginas das mensagens mais recentes para as mais antigas, pelo cursor (data, _id).
+ORDENACAO_MENSAGENS = [("data", -1), ("_id", -1)]
+CAMPOS_MENSAGEM = {"mensagem": 1, "origem": 1, "remetente": 1, "data": 1, "timestamp": 1}
+TAMANHO_PAGINA_HISTORICO = int(os.getenv("HISTORICO_PAGINA", 50))
+
+def _formatar_mensagem(msg):
+    return {
+        "_id": str(msg["_id"]),
+        "mensagem": msg["mensagem"],
+        "origem": msg.get("origem") or msg.get("remetente"),
+        # Adicione 'Z' ao final para indicar que é UTC
+        "data": (msg.get("data") or msg.get("timestamp")).isoformat() + 'Z'
+    }
+
+@rotas.route("/chat/historico", methods=["GET"])
+@requer_token()
 def historico_mensagens():
+    """Página com as `limit` mensagens mais recentes anteriores ao cursor `before`.
+
+    Dentro da página as mensagens vêm em ordem cronológica, prontas para desenhar a
+    conversa; se houver mensagens mais antigas, o cursor delas vem em X-Proximo-Cursor.
+    """
     try:
-        usuario_id = request.args.get("usuario_id")
-        print(f"DEBUG: Requisitando histórico para usuario_id: {usuario_id}")
+        usuario_id = usuario_da_requisicao(request.args.get("usuario_id"))
+        logger.debug("Requisitando histórico para usuario_id: %s", usuario_id, extra={"amostra": AMOSTRA_LOGS})
         if not usuario_id:
-            return jsonify({"erro": "ID do usuário é obrigatório"}), 400
-
-        historico = list(database.mensagens.find(
-            {"usuario_id": usuario_id},
-            sort=[("data", 1)],
-            limit=100
-        ))
-        print(f"DEBUG: Histórico de mensagens encontrado para {usuario_id}: {historico}")
-
-        return jsonify([
-            {
-                "_id": str(msg["_id"]),
-                "mensagem": msg["mensagem"],
-                "origem": msg.get("origem") or msg.get("remetente"),
-                # Adicione 'Z' ao final para indicar que é UTC
-                "data": (msg.get("data") or msg.get("timestamp")).isoformat() + 'Z' # <-- MUDANÇA AQUI
-            } for msg in historico
-        ]), 200
+            return jsonify({"erro": "Acesso negado"}), 403
+
+        try:
+            limite = int(request.args.get("limit", TAMANHO_PAGINA_HISTORICO))
+            if limite <= 0:
+                raise ValueError("limit deve ser positivo")
+            limite = min(limite, LIMITE_MAXIMO)
+            filtro = {"usuario_id": usuario_id}
+            if request.args.get("before"):
+                filtro.update(filtro_apos(request.args["before"], ORDENACAO_MENSAGENS))
+        except (ValueError, CursorInvalido):
+            return jsonify({"erro": "Parâmetros de paginação inválidos"}), 400
+
+        # Uma leitura de intervalo no índice (usuario_id, data desc, _id desc), só com os campos exibidos.
+        pagina = list(database.mensagens.find(filtro, CAMPOS_MENSAGEM, sort=ORDENACAO_MENSAGENS, limit=limite))
+
+        resposta = jsonify([_formatar_mensagem(msg) for msg in reversed(pagina)])
+        if len(pagina) == limite:
+            mais_antiga = pagina[-1]
+            resposta.headers["X-Proximo-Cursor"] = codificar_cursor([mais_antiga.get("data"), mais_antiga["_id"]])
+        return resposta, 200
 
     except Exception as e:
-        print(f"Erro ao buscar histórico: {str(e)}")
+        logger.exception("Erro ao buscar histórico: %s", e)
         return jsonify({"erro": "Erro ao carregar histórico"}), 500
 
-@app.route("/chat/limpar_historico", methods=["DELETE"])
+@rotas.route("/chat/limpar_historico", methods=["DELETE"])
+@requer_token()
 def limpar_historico():
     try:
-        usuario_id = request.args.get("usuario_id")
+        usuario_id = usuario_da_requisicao(request.args.get("usuario_id"))
         if not usuario_id:
-            return jsonify({"erro": "ID do usuário é obrigatório"}), 400
+            return jsonify({"erro": "Acesso negado"}), 403
 
         resultado = database.mensagens.delete_many({"usuario_id": usuario_id})
 
@@ -488,46 +797,48 @@ def limpar_historico():
         }), 200
 
     except Exception as e:
-        print(f"Erro ao limpar histórico: {str(e)}")
+        logger.exception("Erro ao limpar histórico: %s", e)
         return jsonify({"erro": "Falha ao limpar histórico"}), 500
 
 # --- Rota do Cardápio ---
 
-@app.route('/cardapio', methods=['GET'])
+@rotas.route('/cardapio', methods=['GET'])
 def get_cardapio():
     try:
-        if 'cardapio' not in database.list_collection_names():
-            return jsonify({"erro": "Coleção 'cardapio' não encontrada no banco de dados."}), 500
-
-        itens = list(database.cardapio.find(
-            {"disponibilidade": True},
-            {"_id": 1, "nome": 1, "preco": 1, "categoria": 1, "descricao": 1, "disponibilidade": 1} 
-        ).sort([("categoria", 1), ("nome", 1)]))
-
-        for item in itens:
-            item['_id'] = str(item['_id'])
+        cardapio = cardapio_cache.obter()
 
-        if not itens:
+        if not cardapio.itens:
             return jsonify({"aviso": "Cardápio vazio ou sem itens disponíveis."}), 200
 
-        print(f"Retornando {len(itens)} itens do cardapio")
-        return jsonify(itens), 200
+        # O front-end reenvia o ETag recebido; se o cardápio não mudou, não há corpo a enviar.
+        if cardapio.etag in request.if_none_match:
+            resposta = Response(status=304)
+        else:
+            logger.debug("Retornando %s itens do cardapio (versão %s)", len(cardapio.itens), cardapio.versao, extra={"amostra": AMOSTRA_LOGS})
+            resposta = Response(cardapio.corpo, status=200, mimetype="application/json")
+
+        resposta.set_etag(cardapio.etag)
+        resposta.headers["Cache-Control"] = "no-cache"
+        return resposta
 
     except Exception as e:
-        print(f"ERRO no cardápio: {str(e)}")
+        logger.exception("Erro no cardápio: %s", e)
         return jsonify({"erro": "Erro interno ao buscar cardápio"}), 500
     
-@app.route('/pedidos/historico', methods=['GET'])
+CAMPOS_HISTORICO_PEDIDOS = {"usuario_id": 1, "itens": 1, "data": 1, "status": 1, "total": 1}
+
+@rotas.route('/pedidos/historico', methods=['GET'])
+@requer_token()
 def get_historico_pedidos():
     try:
-        usuario_id = request.args.get('usuario_id')
+        usuario_id = usuario_da_requisicao(request.args.get('usuario_id'))
         if not usuario_id:
-            return jsonify({"erro": "ID do usuário é obrigatório"}), 400
-
-        cardapio_map = {item['nome']: item for item in database.cardapio.find({"disponibilidade": True})}
+            return jsonify({"erro": "Acesso negado"}), 403
 
+        # Preços, subtotais e total foram gravados no fechamento: nada de cardápio nem recálculo aqui.
         pedidos_cursor = database.pedidos.find(
-            {"usuario_id": usuario_id}
+            {"usuario_id": usuario_id},
+            projection=CAMPOS_HISTORICO_PEDIDOS
         ).sort("data", -1)
 
         pedidos_formatados = []
@@ -539,33 +850,24 @@ def get_historico_pedidos():
             else:
                 pedido['data_pedido'] = datetime.utcnow().isoformat() + 'Z'
 
-            total_pedido_calculado = 0
-            itens_processados = []
+            if 'total' not in pedido or any(isinstance(item, dict) and 'subtotal' not in item for item in pedido.get('itens', [])):
+                # Pedido anterior ao backfill (python -m db.backfill_totais): calcula com os preços gravados nele.
+                pedido['itens'], pedido['total'] = calcular_totais(pedido.get('itens'))
 
+            itens_processados = []
             for item_pedido_original in pedido.get('itens', []):
                 if not isinstance(item_pedido_original, dict):
-                    print(f"AVISO: Item de pedido mal formatado encontrado (não é um dicionário): '{item_pedido_original}' no pedido ID: {pedido['_id']}. Pulando este item.")
+                    logger.warning("Item de pedido mal formatado encontrado (não é um dicionário): '%s' no pedido ID: %s. Pulando este item.", item_pedido_original, pedido['_id'])
                     continue
 
-                nome_item = item_pedido_original.get('nome') 
-                quantidade_item = item_pedido_original.get('quantidade', 1) 
-
-                preco_item = 0.00
-                
-                if nome_item in cardapio_map:
-                    preco_item = cardapio_map[nome_item].get('preco', 0.00)
-                else:
-                    preco_item = item_pedido_original.get('preco', 0.00)
-
                 itens_processados.append({
                     "_id": str(item_pedido_original.get('_id', ObjectId())),
-                    "nome": nome_item,
-                    "preco": preco_item,
-                    "quantidade": quantidade_item
+                    "nome": item_pedido_original.get('nome'),
+                    "preco": item_pedido_original.get('preco', 0.00),
+                    "quantidade": item_pedido_original.get('quantidade', 1),
+                    "subtotal": item_pedido_original['subtotal']
                 })
-                total_pedido_calculado += (preco_item * quantidade_item)
 
-            pedido['total'] = total_pedido_calculado
             pedido['itens'] = itens_processados
             
             pedidos_formatados.append(pedido)
@@ -573,14 +875,63 @@ def get_historico_pedidos():
         if not pedidos_formatados:
             return jsonify({"aviso": "Nenhum pedido encontrado para este usuário."}), 200
 
-        print(f"DEBUG: Retornando {len(pedidos_formatados)} pedidos formatados para o usuário {usuario_id}")
+        logger.debug("Retornando %s pedidos formatados para o usuário %s", len(pedidos_formatados), usuario_id, extra={"amostra": AMOSTRA_LOGS})
         return jsonify(pedidos_formatados), 200
 
     except Exception as e:
-        print(f"ERRO ao buscar histórico de pedidos: {str(e)}")
+        logger.exception("Erro ao buscar histórico de pedidos: %s", e)
         return jsonify({"erro": "Erro interno ao buscar histórico de pedidos"}), 500
 
 # --- Inicialização ---
 
+def create_app():
+    """Cria a aplicação Flask com as rotas do PoliChat.
+
+    Não conecta ao MongoDB nem carrega o ChatService: isso acontece na primeira
+    requisição que precisar deles, para o processo subir rápido.
+    """
+    configurar_logging()
+
+    aplicacao = Flask(__name__)
+    if PROXIES_CONFIAVEIS > 0:
+        aplicacao.wsgi_app = ProxyFix(aplicacao.wsgi_app, x_for=PROXIES_CONFIAVEIS, x_proto=PROXIES_CONFIAVEIS)
+    CORS(aplicacao, expose_headers=["ETag", "X-Proximo-Cursor"])
+    aplicacao.register_blueprint(rotas)
+    return aplicacao
+
+
+def _iniciar_eventos_do_banco():
+    global _eventos_do_banco
+    if _eventos_do_banco is not None:
+        return
+    with _lock_eventos_do_banco:
+        if _eventos_do_banco is None:
+            eventos = EventosDoBanco(Preguicoso(lambda: database.pedidos), barramento)
+            eventos.iniciar()
+            _eventos_do_banco = eventos
+
+
+def apos_fork():
+    """Refaz o estado do processo num worker recém-forkado (hook post_fork do serve.py).
+
+    Threads, sockets e locks do mestre não servem no filho: abre um MongoClient próprio,
+    recria o logging, o pool de hashing, o barramento de eventos, o pool do /chat, o cache
+    do cardápio (ligado ao MongoClient do mestre) e os locks das métricas. O change stream
+    de pedidos, se houver, começa no primeiro assinante do feed neste worker.
+    """
+    global chat_executor, _eventos_do_banco, _lock_eventos_do_banco
+    metricas.registro.apos_fork()
+    Database.apos_fork()
+    logs.apos_fork()
+    password_hasher.apos_fork()
+    barramento.apos_fork()
+    chat_executor = _criar_chat_executor()
+    descartar(cardapio_cache)
+    _eventos_do_banco = None
+    _lock_eventos_do_banco = threading.Lock()
+
+
+app = create_app()
+
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=int(os.getenv("PORT", 5000)))
\ No newline at end of file
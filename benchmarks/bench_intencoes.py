@@ -0,0 +1,79 @@
+# Micro-benchmark da detecção de intenções do ChatService.
+#
+# Compara a cadeia antiga de _mensagem_similar (um scorer atrás do outro, padrões
+# normalizados de novo a cada mensagem) com o IntentIndex montado no __init__.
+#
+# Uso: python -m benchmarks.bench_intencoes [--repeticoes N]
+import argparse
+import time
+
+from thefuzz import fuzz
+
+from services.chat_service import INTENCOES
+from services.intent_index import IntentIndex
+
+MENSAGENS = [
+    "oi tudo bem",
+    "bom dia",
+    "quero ver o cardapio",
+    "meus pedidos",
+    "quero cancelar",
+    "só isso",
+    "quero dois pães de queijo",
+    "valeu",
+    "qual a senha do wifi da escola?",
+    "asdkjh qwe zxc",
+]
+
+
+def _mensagem_similar_legado(mensagem, padroes, limiar=70):
+    mensagem = mensagem.lower()
+    for padrao in padroes:
+        score_partial = fuzz.partial_ratio(mensagem, padrao.lower())
+        score_ratio = fuzz.ratio(mensagem, padrao.lower())
+        score_token_set = fuzz.token_set_ratio(mensagem, padrao.lower())
+
+        if score_partial >= limiar or score_ratio >= limiar or score_token_set >= limiar:
+            return True
+    return False
+
+
+def detectar_legado(mensagem):
+    for nome, padroes, limiar in INTENCOES:
+        if _mensagem_similar_legado(mensagem, padroes, limiar):
+            return nome
+    return None
+
+
+def medir(funcao, mensagens, repeticoes):
+    inicio = time.perf_counter()
+    for _ in range(repeticoes):
+        for mensagem in mensagens:
+            funcao(mensagem)
+    duracao = time.perf_counter() - inicio
+    return (repeticoes * len(mensagens)) / duracao
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark da detecção de intenções")
+    parser.add_argument("--repeticoes", type=int, default=200)
+    args = parser.parse_args()
+
+    indice = IntentIndex(INTENCOES)
+    mensagens = [m.lower().strip() for m in MENSAGENS]
+
+    for mensagem in mensagens:
+        antes, depois = detectar_legado(mensagem), indice.detectar(mensagem)
+        if antes != depois:
+            raise SystemExit(f"Divergência em '{mensagem}': legado={antes} índice={depois}")
+
+    antes = medir(detectar_legado, mensagens, args.repeticoes)
+    depois = medir(indice.detectar, mensagens, args.repeticoes)
+
+    print(f"antes  (cadeia _mensagem_similar): {antes:10.0f} mensagens/s")
+    print(f"depois (IntentIndex):              {depois:10.0f} mensagens/s")
+    print(f"ganho: {depois / antes:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
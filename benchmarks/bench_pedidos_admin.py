@@ -0,0 +1,100 @@
+# Benchmark de /admin/pedidos/todos: busca de usuário por pedido (N+1) x agregação com $lookup.
+#
+# Popula um banco descartável com usuários e pedidos sintéticos, conta os comandos
+# enviados ao servidor com um CommandListener e mede a latência das duas estratégias.
+#
+# Uso: MONGODB_URL=mongodb://localhost:27017 python -m benchmarks.bench_pedidos_admin --pedidos 3000
+import argparse
+import os
+import random
+import time
+from datetime import datetime, timedelta
+
+from bson.objectid import ObjectId
+from pymongo import MongoClient, monitoring
+
+from db.models.pedidos import pipeline_pedidos_com_usuario
+
+
+class ContadorDeComandos(monitoring.CommandListener):
+    def __init__(self):
+        self.total = 0
+
+    def started(self, event):
+        self.total += 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+def popular(db, n_usuarios, n_pedidos):
+    db.usuarios.drop()
+    db.pedidos.drop()
+
+    usuarios = [{"_id": ObjectId(), "email": f"aluno{i}@p4ed.com", "senha": "x"} for i in range(n_usuarios)]
+    db.usuarios.insert_many(usuarios)
+
+    agora = datetime.utcnow()
+    pedidos = []
+    for i in range(n_pedidos):
+        pedidos.append({
+            "usuario_id": str(random.choice(usuarios)["_id"]),
+            "itens": [
+                {"_id": ObjectId(), "nome": f"Item {j}", "preco": round(random.uniform(2, 30), 2), "quantidade": random.randint(1, 3)}
+                for j in range(random.randint(1, 4))
+            ],
+            "data": agora - timedelta(minutes=i),
+            "status": "em preparo"
+        })
+    db.pedidos.insert_many(pedidos)
+    db.pedidos.create_index([("data", -1)])
+
+
+def legado(db):
+    resultado = []
+    for pedido in db.pedidos.find().sort("data", -1):
+        total = 0
+        for item in pedido.get('itens', []):
+            total += float(item.get('preco', 0.00)) * int(item.get('quantidade', 1))
+        pedido['total'] = total
+        usuario = db.usuarios.find_one({"_id": ObjectId(pedido['usuario_id'])})
+        pedido['usuario_info'] = {"nome": usuario.get("email")} if usuario else {"nome": "Desconhecido"}
+        resultado.append(pedido)
+    return resultado
+
+
+def agregado(db):
+    return list(db.pedidos.aggregate(pipeline_pedidos_com_usuario()))
+
+
+def medir(nome, funcao, db, contador):
+    contador.total = 0
+    inicio = time.perf_counter()
+    pedidos = funcao(db)
+    duracao = time.perf_counter() - inicio
+    print(f"{nome:10s} {len(pedidos):6d} pedidos  {contador.total:6d} comandos  {duracao * 1000:9.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de /admin/pedidos/todos")
+    parser.add_argument("--usuarios", type=int, default=500)
+    parser.add_argument("--pedidos", type=int, default=3000)
+    parser.add_argument("--banco", default="polichat_bench")
+    args = parser.parse_args()
+
+    contador = ContadorDeComandos()
+    cliente = MongoClient(os.getenv("MONGODB_URL"), event_listeners=[contador])
+    db = cliente[args.banco]
+
+    popular(db, args.usuarios, args.pedidos)
+    medir("legado", legado, db, contador)
+    medir("$lookup", agregado, db, contador)
+
+    cliente.drop_database(args.banco)
+
+
+if __name__ == "__main__":
+    main()
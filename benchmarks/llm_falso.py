@@ -0,0 +1,111 @@
+# Servidor local que imita a API de chat da OpenAI/OpenRouter (POST /v1/chat/completions).
+#
+# Serve para testar o chat.py sem rede e sem custo: streaming token a token, lentidão
+# e falhas controladas para exercitar o timeout, o limite de chamadas e o circuit breaker.
+#
+# Uso:
+#   python -m benchmarks.llm_falso --porta 8099 --atraso 0.05 --atraso-inicial 1 --taxa-falhas 0.2
+#   LLM_BASE_URL=http://localhost:8099/v1 OPENROUTER_API_KEY=x python ...
+import argparse
+import json
+import random
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class LLMFalso(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    config = None  # argparse.Namespace, definido em servir()
+
+    def log_message(self, formato, *args):
+        if not self.config.silencioso:
+            super().log_message(formato, *args)
+
+    def _responder_json(self, status, corpo):
+        dados = json.dumps(corpo).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(dados)))
+        self.end_headers()
+        self.wfile.write(dados)
+
+    def _texto_da_resposta(self, pedido):
+        if self.config.resposta:
+            return self.config.resposta
+        ultima = next((m.get("content", "") for m in reversed(pedido.get("messages", [])) if m.get("role") == "user"), "")
+        return f"Resposta de teste para: {ultima}"
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            return self._responder_json(404, {"error": {"message": "rota não encontrada"}})
+
+        tamanho = int(self.headers.get("Content-Length") or 0)
+        pedido = json.loads(self.rfile.read(tamanho) or b"{}")
+
+        time.sleep(self.config.atraso_inicial)
+        if random.random() < self.config.taxa_falhas:
+            return self._responder_json(500, {"error": {"message": "falha simulada", "type": "server_error"}})
+
+        id_resposta = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        modelo = pedido.get("model", "falso")
+        texto = self._texto_da_resposta(pedido)
+
+        if not pedido.get("stream"):
+            return self._responder_json(200, {
+                "id": id_resposta, "object": "chat.completion", "created": int(time.time()), "model": modelo,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": texto}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": 0, "completion_tokens": len(texto.split()), "total_tokens": len(texto.split())}
+            })
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        def enviar(delta, fim=None):
+            pedaco = {
+                "id": id_resposta, "object": "chat.completion.chunk", "created": int(time.time()), "model": modelo,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": fim}]
+            }
+            self.wfile.write(f"data: {json.dumps(pedaco)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+
+        try:
+            enviar({"role": "assistant", "content": ""})
+            palavras = texto.split(" ")
+            for i, palavra in enumerate(palavras):
+                time.sleep(self.config.atraso)
+                enviar({"content": palavra if i == len(palavras) - 1 else palavra + " "})
+            enviar({}, fim="stop")
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # o cliente desistiu (timeout ou desconexão)
+
+
+def servir(config):
+    LLMFalso.config = config
+    servidor = ThreadingHTTPServer(("127.0.0.1", config.porta), LLMFalso)
+    servidor.daemon_threads = True
+    return servidor
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Servidor falso compatível com a API de chat da OpenAI")
+    parser.add_argument("--porta", type=int, default=8099)
+    parser.add_argument("--atraso", type=float, default=0.02, help="segundos entre tokens no streaming")
+    parser.add_argument("--atraso-inicial", type=float, default=0.0, help="segundos antes do primeiro byte")
+    parser.add_argument("--taxa-falhas", type=float, default=0.0, help="fração das chamadas que respondem 500")
+    parser.add_argument("--resposta", help="texto fixo da resposta (padrão: ecoa a última mensagem)")
+    parser.add_argument("--silencioso", action="store_true", help="não registra cada requisição")
+    args = parser.parse_args()
+
+    servidor = servir(args)
+    print(f"LLM falso em http://127.0.0.1:{args.porta}/v1 (Ctrl+C para parar)")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        servidor.shutdown()
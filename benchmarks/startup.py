@@ -0,0 +1,118 @@
+# Benchmark de inicialização: quanto tempo um processo novo leva para importar o app.py
+# e para responder às primeiras requisições.
+#
+# Cada medição roda num processo Python novo (caches de import frios do interpretador),
+# que mede:
+#   - import_app: `import app` (módulos, create_app e registro das rotas);
+#   - primeira_metrics: GET /metrics, que não depende do banco;
+#   - primeira_cardapio: GET /cardapio, que inicializa o Database (coleções, índices) e o cache;
+#   - primeira_chat: POST /chat, que carrega o ChatService (thefuzz, babel, índice de intenções);
+#   - segunda_chat: POST /chat de novo, já com tudo carregado, como referência.
+#
+# Por padrão usa o mongomock; com --mongodb-url mede contra um MongoDB de verdade, onde a
+# criação de índices na primeira requisição pesa bem mais.
+#
+# Uso: python -m benchmarks.startup [--execucoes 10] [--saida benchmarks/resultados_startup.json]
+#                                   [--mongodb-url mongodb://localhost:27017]
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+ETAPAS = ("import_app", "primeira_metrics", "primeira_cardapio", "primeira_chat", "segunda_chat")
+
+
+def _medir_processo_filho(mongo_real):
+    """Roda dentro do processo novo e imprime os tempos de cada etapa em JSON."""
+    if not mongo_real:
+        import mongomock
+        import pymongo
+        pymongo.MongoClient = mongomock.MongoClient
+        import db.connection
+        db.connection.MongoClient = mongomock.MongoClient
+
+    tempos = {}
+    inicio = time.perf_counter()
+    import app as aplicacao
+    tempos["import_app"] = time.perf_counter() - inicio
+
+    from services.tokens import token_service
+    cliente = aplicacao.app.test_client()
+    cabecalhos = {"Authorization": "Bearer " + token_service.emitir("benchmark-startup", "usuario")}
+
+    def cronometrar(etapa, requisicao):
+        inicio = time.perf_counter()
+        resposta = requisicao()
+        tempos[etapa] = time.perf_counter() - inicio
+        if resposta.status_code >= 500:
+            raise SystemExit(f"{etapa} respondeu {resposta.status_code}")
+
+    cronometrar("primeira_metrics", lambda: cliente.get("/metrics"))
+    cronometrar("primeira_cardapio", lambda: cliente.get("/cardapio"))
+    cronometrar("primeira_chat", lambda: cliente.post("/chat", json={"mensagem": "oi"}, headers=cabecalhos))
+    cronometrar("segunda_chat", lambda: cliente.post("/chat", json={"mensagem": "oi"}, headers=cabecalhos))
+
+    if mongo_real:
+        aplicacao.database.mensagens.delete_many({"usuario_id": "benchmark-startup"})
+    print(json.dumps(tempos))
+
+
+def _resumir(valores):
+    valores = sorted(valores)
+    return {
+        "media_ms": round(statistics.mean(valores) * 1000, 3),
+        "p50_ms": round(statistics.median(valores) * 1000, 3),
+        "max_ms": round(valores[-1] * 1000, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tempo de import do app e das primeiras requisições")
+    parser.add_argument("--execucoes", type=int, default=10, help="processos novos medidos")
+    parser.add_argument("--saida", default="benchmarks/resultados_startup.json")
+    parser.add_argument("--mongodb-url", help="mede contra este MongoDB em vez do mongomock")
+    parser.add_argument("--filho", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.filho:
+        _medir_processo_filho(mongo_real=not os.getenv("STARTUP_MONGOMOCK"))
+        return
+
+    ambiente = dict(os.environ, LOG_LEVEL="WARNING", JWT_SECRET=os.getenv("JWT_SECRET", "benchmark"))
+    if args.mongodb_url:
+        ambiente["MONGODB_URL"] = args.mongodb_url
+    else:
+        ambiente.setdefault("MONGODB_URL", "mongodb://localhost:27017")
+        ambiente["STARTUP_MONGOMOCK"] = "1"
+
+    medicoes = []
+    for i in range(args.execucoes):
+        processo = subprocess.run([sys.executable, "-m", "benchmarks.startup", "--filho"],
+                                  env=ambiente, capture_output=True, text=True)
+        if processo.returncode != 0:
+            sys.exit(f"Execução {i + 1} falhou:\n{processo.stderr}")
+        medicoes.append(json.loads(processo.stdout.strip().splitlines()[-1]))
+
+    resultados = {etapa: _resumir([m[etapa] for m in medicoes]) for etapa in ETAPAS}
+    for etapa, resumo in resultados.items():
+        print(f"{etapa:<20} média {resumo['media_ms']:>9.2f} ms   p50 {resumo['p50_ms']:>9.2f} ms   máx {resumo['max_ms']:>9.2f} ms")
+
+    with open(args.saida, "w", encoding="utf-8") as arquivo:
+        json.dump({
+            "gerado_em": datetime.utcnow().isoformat() + "Z",
+            "python": platform.python_version(),
+            "plataforma": platform.platform(),
+            "execucoes": args.execucoes,
+            "banco": "mongodb" if args.mongodb_url else "mongomock",
+            "resultados": resultados,
+        }, arquivo, ensure_ascii=False, indent=2)
+    print(f"\nResultados gravados em {args.saida}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,272 @@
+# Suíte de micro-benchmarks do ChatService e das rotas do app.py, sem servidor Mongo.
+#
+# Usa cardápios sintéticos (10, 100 e 1000 itens), usuários com 0 a 5000 pedidos
+# finalizados e o mongomock no lugar do MongoDB. Mede:
+#   - processar_mensagem por intenção, para cada tamanho de cardápio;
+#   - _consultar_pedidos (formatação do histórico) por quantidade de pedidos;
+#   - as rotas pelo test client do Flask (/chat, /chat/historico, /cardapio, /pedidos/historico).
+#
+# Os resultados vão para um JSON, para comparar execuções antes/depois de uma mudança.
+# A agregação de /admin/pedidos/todos usa $convert, que o mongomock não implementa;
+# para ela existe o benchmarks.bench_pedidos_admin, que roda contra um Mongo de verdade.
+# O benchmarks.mongomock_compat cobre o que o checkout e o carrinho usam e o mongomock não
+# suporta (bulk_write com o pymongo recente, update com pipeline); sem ele esses casos
+# mediriam um caminho de exceção.
+#
+# Requer: pip install mongomock
+# Uso: python -m benchmarks.suite [--saida benchmarks/resultados.json] [--repeticoes 200] [--rapido]
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+try:
+    import mongomock
+except ImportError:
+    sys.exit("A suíte precisa do mongomock como Mongo em memória: pip install mongomock")
+
+import pymongo
+
+from benchmarks import mongomock_compat
+
+mongomock_compat.aplicar()
+
+# O Database singleton cria o MongoClient no import: troca pelo mongomock antes de importar o app.
+pymongo.MongoClient = mongomock.MongoClient
+os.environ.setdefault("MONGODB_URL", "mongodb://localhost:27017")
+os.environ.setdefault("JWT_SECRET", "benchmark")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+# Os benchmarks mandam milhares de /chat do mesmo usuário: sem isso o limite de taxa responderia 429.
+os.environ.setdefault("LIMITE_CHAT_RAJADA", "1000000000")
+
+import db.connection  # noqa: E402
+
+db.connection.MongoClient = mongomock.MongoClient
+
+from bson.objectid import ObjectId  # noqa: E402
+
+TAMANHOS_CARDAPIO = (10, 100, 1000)
+QUANTIDADES_PEDIDOS = (0, 10, 100, 1000, 5000)
+
+PRODUTOS = ["pão de queijo", "coxinha", "suco de laranja", "sanduíche natural", "bolo de cenoura",
+            "pastel de carne", "café com leite", "refrigerante", "empada de frango", "misto quente",
+            "tapioca", "açaí", "salada de frutas", "brigadeiro", "esfiha", "cookie"]
+VARIACOES = ["", " integral", " especial", " grande", " pequeno", " com queijo", " zero", " de forno"]
+CATEGORIAS = ["Salgados", "Bebidas", "Doces", "Lanches"]
+
+MENSAGENS_POR_INTENCAO = {
+    "saudacao": "oi, bom dia",
+    "agradecimento": "muito obrigado",
+    "ver_cardapio": "quero ver o cardápio",
+    "consultar_pedidos": "meus pedidos",
+    "ver_status_pedido_aberto": "o que tem no meu pedido",
+    "cancelar_pedido": "quero cancelar o pedido",
+    "finalizar_pedido": "pode finalizar",
+    "fazer_pedido": "quero dois pão de queijo e um suco de laranja",
+    "nenhuma": "qual a senha do wifi da escola?",
+}
+
+
+def gerar_cardapio(n_itens, semente=42):
+    aleatorio = random.Random(semente)
+    itens = []
+    for i in range(n_itens):
+        produto = PRODUTOS[i % len(PRODUTOS)]
+        variacao = VARIACOES[(i // len(PRODUTOS)) % len(VARIACOES)]
+        lote = i // (len(PRODUTOS) * len(VARIACOES))
+        nome = f"{produto}{variacao}" + (f" {lote + 1}" if lote else "")
+        itens.append({
+            "_id": ObjectId(),
+            "nome": nome.title(),
+            "descricao": f"Descrição de {nome}",
+            "preco": round(aleatorio.uniform(2, 30), 2),
+            "categoria": CATEGORIAS[i % len(CATEGORIAS)],
+            "disponibilidade": True,
+        })
+    return itens
+
+
+def gerar_pedidos(usuario_id, cardapio, n_pedidos, semente=42):
+    aleatorio = random.Random(semente)
+    agora = datetime.utcnow()
+    pedidos = []
+    for i in range(n_pedidos):
+        itens = []
+        for item in aleatorio.sample(cardapio, min(len(cardapio), aleatorio.randint(1, 4))):
+            itens.append({"_id": item["_id"], "nome": item["nome"], "preco": item["preco"],
+                          "quantidade": aleatorio.randint(1, 3)})
+        pedidos.append({
+            "_id": ObjectId(),
+            "usuario_id": usuario_id,
+            "itens": itens,
+            "data": agora - timedelta(hours=i),
+            "status": aleatorio.choice(["em preparo", "pronto", "entregue"]),
+        })
+    return pedidos
+
+
+def medir(funcao, repeticoes, preparar=None, aquecimento=3):
+    """Executa `funcao` repetidas vezes; `preparar` roda antes de cada chamada, fora do tempo medido."""
+    for _ in range(aquecimento):
+        if preparar:
+            preparar()
+        funcao()
+
+    tempos = []
+    for _ in range(repeticoes):
+        if preparar:
+            preparar()
+        inicio = time.perf_counter()
+        funcao()
+        tempos.append(time.perf_counter() - inicio)
+
+    tempos.sort()
+    total = sum(tempos)
+    return {
+        "repeticoes": repeticoes,
+        "total_s": round(total, 6),
+        "media_ms": round(total / repeticoes * 1000, 4),
+        "p50_ms": round(statistics.median(tempos) * 1000, 4),
+        "p95_ms": round(tempos[int(0.95 * (repeticoes - 1))] * 1000, 4),
+        "por_segundo": round(repeticoes / total, 1) if total else None,
+    }
+
+
+class Suite:
+    def __init__(self, repeticoes):
+        self.repeticoes = repeticoes
+        self.resultados = []
+
+    def registrar(self, grupo, caso, parametros, medicao):
+        self.resultados.append({"grupo": grupo, "caso": caso, "parametros": parametros, **medicao})
+        print(f"{grupo:<20} {caso:<28} {json.dumps(parametros, ensure_ascii=False):<36} "
+              f"{medicao['media_ms']:>10.3f} ms  {medicao['por_segundo'] or 0:>10.1f}/s")
+
+    def bench_processar_mensagem(self, tamanhos_cardapio):
+        from services.chat_service import ChatService
+
+        banco = mongomock.MongoClient()["polichat_bench"]
+        usuario_id = str(ObjectId())
+        for n_itens in tamanhos_cardapio:
+            cardapio = gerar_cardapio(n_itens)
+            pedidos = gerar_pedidos(usuario_id, cardapio, 20)
+            servico = ChatService()
+            carrinho = {"usuario_id": usuario_id, "itens": [
+                {"_id": str(cardapio[0]["_id"]), "nome": cardapio[0]["nome"], "preco": cardapio[0]["preco"], "quantidade": 1}
+            ]}
+
+            estado = {}
+
+            def preparar():
+                # Todo caso parte de um carrinho com um item, como se o usuário já tivesse pedido algo.
+                banco.pedidos_em_aberto.delete_many({})
+                banco.pedidos.delete_many({})
+                carrinho.pop("_id", None)
+                banco.pedidos_em_aberto.insert_one(carrinho)
+                estado["carrinho"] = banco.pedidos_em_aberto.find_one({"usuario_id": usuario_id})
+
+            for intencao, mensagem in MENSAGENS_POR_INTENCAO.items():
+                medicao = medir(
+                    lambda: servico.processar_mensagem(
+                        usuario_id, mensagem, estado["carrinho"], pedidos, cardapio,
+                        banco.pedidos_em_aberto, banco.pedidos, versao_cardapio=n_itens),
+                    self.repeticoes, preparar=preparar)
+                self.registrar("processar_mensagem", intencao, {"itens_cardapio": n_itens}, medicao)
+
+    def bench_consultar_pedidos(self, quantidades):
+        from services.chat_service import ChatService
+
+        servico = ChatService()
+        cardapio = gerar_cardapio(100)
+        usuario_id = str(ObjectId())
+        for n_pedidos in quantidades:
+            pedidos = gerar_pedidos(usuario_id, cardapio, n_pedidos)
+            repeticoes = max(5, min(self.repeticoes, 20000 // max(n_pedidos, 1)))
+            medicao = medir(lambda: servico._consultar_pedidos(usuario_id, pedidos), repeticoes)
+            self.registrar("consultar_pedidos", "formatacao", {"pedidos": n_pedidos}, medicao)
+
+    def bench_rotas(self, quantidades, n_itens=100):
+        import app as aplicacao
+        from services.tokens import token_service
+
+        database = aplicacao.database
+        cliente = aplicacao.app.test_client()
+
+        database.cardapio.delete_many({})
+        cardapio = gerar_cardapio(n_itens)
+        database.cardapio.insert_many([dict(item) for item in cardapio])
+        aplicacao.cardapio_cache.invalidar()
+
+        for n_pedidos in quantidades:
+            usuario_id = str(ObjectId())
+            cabecalhos = {"Authorization": "Bearer " + token_service.emitir(usuario_id, "usuario")}
+            if n_pedidos:
+                database.pedidos.insert_many(gerar_pedidos(usuario_id, cardapio, n_pedidos))
+            database.mensagens.insert_many([
+                {"usuario_id": usuario_id, "mensagem": f"mensagem {i}", "origem": "usuario",
+                 "data": datetime.utcnow() - timedelta(minutes=i)}
+                for i in range(200)
+            ])
+            parametros = {"pedidos": n_pedidos, "itens_cardapio": n_itens}
+            repeticoes = max(5, min(self.repeticoes, 20000 // max(n_pedidos, 1)))
+
+            def limpar_carrinho():
+                database.pedidos_em_aberto.delete_many({"usuario_id": usuario_id})
+
+            for intencao in ("saudacao", "ver_cardapio", "consultar_pedidos", "fazer_pedido"):
+                corpo = {"mensagem": MENSAGENS_POR_INTENCAO[intencao]}
+                medicao = medir(lambda: cliente.post("/chat", json=corpo, headers=cabecalhos),
+                                repeticoes, preparar=limpar_carrinho)
+                self.registrar("rota", f"POST /chat {intencao}", parametros, medicao)
+
+            medicao = medir(lambda: cliente.get("/chat/historico", headers=cabecalhos), repeticoes)
+            self.registrar("rota", "GET /chat/historico", parametros, medicao)
+
+            medicao = medir(lambda: cliente.get("/pedidos/historico", headers=cabecalhos), repeticoes)
+            self.registrar("rota", "GET /pedidos/historico", parametros, medicao)
+
+        etag = cliente.get("/cardapio").headers["ETag"]
+        medicao = medir(lambda: cliente.get("/cardapio"), self.repeticoes)
+        self.registrar("rota", "GET /cardapio", {"itens_cardapio": n_itens}, medicao)
+        medicao = medir(lambda: cliente.get("/cardapio", headers={"If-None-Match": etag}), self.repeticoes)
+        self.registrar("rota", "GET /cardapio 304", {"itens_cardapio": n_itens}, medicao)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmarks offline do ChatService e das rotas")
+    parser.add_argument("--saida", default="benchmarks/resultados.json")
+    parser.add_argument("--repeticoes", type=int, default=200)
+    parser.add_argument("--rapido", action="store_true", help="cardápio de até 100 itens e até 1000 pedidos")
+    parser.add_argument("--grupos", default="processar_mensagem,consultar_pedidos,rotas")
+    args = parser.parse_args()
+
+    tamanhos = TAMANHOS_CARDAPIO[:2] if args.rapido else TAMANHOS_CARDAPIO
+    quantidades = QUANTIDADES_PEDIDOS[:4] if args.rapido else QUANTIDADES_PEDIDOS
+    grupos = set(args.grupos.split(","))
+
+    suite = Suite(args.repeticoes)
+    if "processar_mensagem" in grupos:
+        suite.bench_processar_mensagem(tamanhos)
+    if "consultar_pedidos" in grupos:
+        suite.bench_consultar_pedidos(quantidades)
+    if "rotas" in grupos:
+        suite.bench_rotas(quantidades)
+
+    with open(args.saida, "w", encoding="utf-8") as arquivo:
+        json.dump({
+            "gerado_em": datetime.utcnow().isoformat() + "Z",
+            "python": platform.python_version(),
+            "plataforma": platform.platform(),
+            "repeticoes": args.repeticoes,
+            "resultados": suite.resultados,
+        }, arquivo, ensure_ascii=False, indent=2)
+    print(f"\nResultados gravados em {args.saida}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,20 +1,135 @@
-from langchain_core.messages import SystemMessage, HumanMessage, AIMessage
-from langchain_openai import ChatOpenAI
 from models import listar_cardapio, buscar_item_cardapio, salvar_pedido, obter_pedidos, obter_historico_mensagens, extrair_nome_item
+from db.connection import database
+from services.cardapio_cache import CardapioCache
+from services.chat_service import chat_service
+from services.llm import (CircuitBreaker, LLMIndisponivel, LLMProtegido, LLMStub, RespostaCache,
+                          chave_da_resposta, cortar_historico, estimar_tokens)
+from services.preguicoso import Preguicoso
 from dotenv import load_dotenv
+import logging
 import os
 
 load_dotenv()
 
-llm = ChatOpenAI(
-    model="gpt-4o-mini",
-    temperature=0.4,
-    openai_api_key=os.getenv("OPENROUTER_API_KEY"),
-    openai_api_base="https://openrouter.ai/api/v1"
+logger = logging.getLogger(__name__)
+
+SYSTEM_PROMPT = (
+    "Você é um assistente da cantina escolar chamado PoliChat. "
+    "Seja prestativo e amigável. Ajude com:\n"
+    "- Cardápio e opções\n"
+    "- Informações sobre itens\n"
+    "- Registro de pedidos\n"
+    "- Histórico de pedidos\n\n"
+    "Se não souber a resposta, sugira que o usuário peça o cardápio."
 )
 
-# chat.py
+# Teto de tokens (estimados) para histórico + mensagem atual; o system prompt é fixo.
+ORCAMENTO_TOKENS = int(os.getenv("LLM_ORCAMENTO_TOKENS", 1500))
+
+# Prazo total de cada chamada ao LLM, em segundos (também usado como timeout do cliente HTTP).
+TIMEOUT_LLM = float(os.getenv("LLM_TIMEOUT", 20))
+
+RESPOSTA_INTERROMPIDA = "(A resposta foi interrompida. Tente novamente em instantes.)"
+
+
+def _criar_llm():
+    # LLM_STUB=1 usa um LLM local e determinístico (testes, desenvolvimento offline).
+    if os.getenv("LLM_STUB") == "1":
+        return LLMStub()
+    from langchain_openai import ChatOpenAI
+    return ChatOpenAI(
+        model="gpt-4o-mini",
+        temperature=0.4,
+        openai_api_key=os.getenv("OPENROUTER_API_KEY"),
+        openai_api_base=os.getenv("LLM_BASE_URL", "https://openrouter.ai/api/v1"),
+        timeout=TIMEOUT_LLM,
+        max_retries=0,
+        streaming=True
+    )
+
+
+llm = LLMProtegido(
+    _criar_llm(),
+    max_simultaneas=int(os.getenv("LLM_MAX_SIMULTANEAS", 4)),
+    timeout=TIMEOUT_LLM,
+    breaker=CircuitBreaker(
+        falhas_para_abrir=int(os.getenv("LLM_FALHAS_PARA_ABRIR", 5)),
+        espera=float(os.getenv("LLM_CIRCUITO_ESPERA", 30))
+    )
+)
+respostas_cache = RespostaCache(
+    capacidade=int(os.getenv("LLM_CACHE_TAMANHO", 1000)),
+    ttl=float(os.getenv("LLM_CACHE_TTL", 3600))
+)
+
+# Respostas em cache deixam de valer quando o cardápio disponível muda: a chave leva o ETag
+# do cardápio em memória, que acompanha as alterações feitas pelas rotas de admin (contador
+# em `versoes`) e relê o Mongo no máximo a cada CARDAPIO_CACHE_TTL segundos. Alterações
+# feitas direto no Mongo só aparecem pelo prazo, então ele não pode ser 0 aqui.
+cardapio_cache = Preguicoso(lambda: CardapioCache(
+    database.cardapio,
+    ttl=float(os.getenv("CARDAPIO_CACHE_TTL", 60)) or 60,
+    filtro={"disponivel": True},
+    versoes=database.versoes,
+    intervalo_versao=float(os.getenv("CARDAPIO_VERSAO_INTERVALO", 5))
+))
+
+
+def _versao_cardapio():
+    return cardapio_cache.obter().etag
+
+
+def _montar_prompt(usuario_id, mensagem):
+    """Mensagens enviadas ao LLM e o histórico usado, dentro de ORCAMENTO_TOKENS."""
+    mensagem = mensagem[:ORCAMENTO_TOKENS * 4]
+    historico = cortar_historico(obter_historico_mensagens(usuario_id),
+                                 max(0, ORCAMENTO_TOKENS - estimar_tokens(mensagem)))
+    messages = [("system", SYSTEM_PROMPT)]
+    for msg in historico:
+        messages.append(("human" if msg["origem"] == "usuario" else "ai", msg["mensagem"]))
+    messages.append(("human", mensagem))
+    return messages, historico
+
+
+def _responder_com_llm(usuario_id, mensagem):
+    """Gera a resposta do LLM em pedaços; sem LLM disponível, cai na resposta por regras do ChatService."""
+    messages, historico = _montar_prompt(usuario_id, mensagem)
+    chave = chave_da_resposta(mensagem, historico, _versao_cardapio())
+    resposta = respostas_cache.obter(chave)
+    if resposta is not None:
+        yield resposta
+        return
+
+    partes = []
+    try:
+        for parte in llm.stream(messages):
+            partes.append(parte)
+            yield parte
+    except LLMIndisponivel as e:
+        logger.info("LLM indisponível para usuario_id=%s (%s); usando resposta por regras.", usuario_id, e)
+        yield "\n\n" + RESPOSTA_INTERROMPIDA if partes else chat_service.responder_sem_llm(mensagem)
+        return
+    respostas_cache.guardar(chave, "".join(partes))
+
+
+def chat_em_partes(usuario_id, mensagem):
+    """Como `chat`, mas gera a resposta aos pedaços, à medida que o LLM os envia.
+
+    Respostas por regras saem num pedaço só. Para repassar ao cliente no Flask:
+    Response(stream_with_context(chat_em_partes(usuario_id, mensagem)), mimetype="text/plain").
+    """
+    resposta = _responder_por_regras(usuario_id, mensagem)
+    if resposta is not None:
+        yield resposta
+    else:
+        yield from _responder_com_llm(usuario_id, mensagem)
+
+
 def chat(usuario_id, mensagem):
+    return "".join(chat_em_partes(usuario_id, mensagem))
+
+
+def _responder_por_regras(usuario_id, mensagem):
     mensagem_lower = mensagem.lower()
     
     # Cardápio completo
@@ -48,26 +163,5 @@ def chat(usuario_id, mensagem):
             return "📦 Seus pedidos:\n\n• " + "\n• ".join(pedidos)
         return "Você ainda não fez nenhum pedido."
 
-    # Resposta padrão com LLM
-    else:
-        system_message = SystemMessage(content=(
-            "Você é um assistente da cantina escolar chamado PoliChat. "
-            "Seja prestativo e amigável. Ajude com:\n"
-            "- Cardápio e opções\n"
-            "- Informações sobre itens\n"
-            "- Registro de pedidos\n"
-            "- Histórico de pedidos\n\n"
-            "Se não souber a resposta, sugira que o usuário peça o cardápio."
-        ))
-        
-        historico = obter_historico_mensagens(usuario_id)
-        messages = [system_message]
-        for msg in historico:
-            if msg["origem"] == "usuario":
-                messages.append(HumanMessage(content=msg["mensagem"]))
-            else:
-                messages.append(AIMessage(content=msg["mensagem"]))
-
-        messages.append(HumanMessage(content=mensagem))
-        resposta = llm.invoke(messages).content
-        return resposta
\ No newline at end of file
+    # Sem regra: resposta do LLM
+    return None
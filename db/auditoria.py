@@ -0,0 +1,86 @@
+# db/auditoria.py
+#
+# Auditoria dos planos de consulta: roda explain() no formato de cada consulta
+# usada pelas rotas e aponta quem cai em COLLSCAN ou precisa de SORT em memória.
+#
+# Uso: python -m db.auditoria
+import sys
+
+from .connection import database
+from .models.pedidos import pipeline_pedidos_com_usuario
+
+USUARIO_EXEMPLO = "000000000000000000000000"
+
+# (rota, coleção, filtro, ordenação)
+CONSULTAS = [
+    ("POST /chat (pedido em aberto)", "pedidos_em_aberto", {"usuario_id": USUARIO_EXEMPLO}, None),
+    ("POST /chat (pedidos finalizados)", "pedidos", {"usuario_id": USUARIO_EXEMPLO}, None),
+    ("GET /cardapio", "cardapio", {"disponibilidade": True}, [("categoria", 1), ("nome", 1)]),
+    ("GET /chat/historico", "mensagens", {"usuario_id": USUARIO_EXEMPLO}, [("data", -1), ("_id", -1)]),
+    ("GET /pedidos/historico", "pedidos", {"usuario_id": USUARIO_EXEMPLO}, [("data", -1)]),
+    ("GET /admin/pedidos/todos", "pedidos", {}, [("data", -1), ("_id", -1)]),
+    ("GET /admin/pedidos (por status)", "pedidos", {"status": "em preparo"}, [("data", -1)]),
+    ("GET /admin/cardapio/todos", "cardapio", {}, [("categoria", 1), ("nome", 1), ("_id", 1)]),
+    ("GET /admin/usuarios/todos", "usuarios", {}, [("_id", 1)]),
+    ("GET /admin/relatorios/vendas", "vendas_diarias", {"dia": {"$gte": "2025-01-01", "$lte": "2025-01-31"}}, [("dia", 1), ("item", 1)]),
+    ("POST /usuarios/login", "usuarios", {"email": "aluno@p4ed.com"}, None),
+    ("POST /admins/login", "admins", {"email": "admin@sistemapoliedro.com.br"}, None),
+]
+
+# (rota, coleção, pipeline)
+AGREGACOES = [
+    ("GET /admin/pedidos/todos ($lookup)", "pedidos", pipeline_pedidos_com_usuario(limite=50)),
+]
+
+ESTAGIOS_PROBLEMATICOS = {"COLLSCAN": "varredura completa da coleção", "SORT": "ordenação em memória"}
+
+
+def _estagios(plano):
+    """Todos os valores de "stage" encontrados em qualquer nível do explain."""
+    if isinstance(plano, dict):
+        if isinstance(plano.get("stage"), str):
+            yield plano["stage"]
+        for valor in plano.values():
+            yield from _estagios(valor)
+    elif isinstance(plano, list):
+        for valor in plano:
+            yield from _estagios(valor)
+
+
+def _plano_vencedor(explain):
+    # No explain de agregações o plano do find fica dentro de $cursor ou de "stages".
+    if "queryPlanner" in explain:
+        return explain["queryPlanner"].get("winningPlan", {})
+    return [estagio.get("$cursor", {}).get("queryPlanner", {}).get("winningPlan", {})
+            for estagio in explain.get("stages", [])] or explain
+
+
+def auditar():
+    problemas = 0
+    resultados = []
+
+    for rota, colecao, filtro, ordenacao in CONSULTAS:
+        cursor = database[colecao].find(filtro)
+        if ordenacao:
+            cursor = cursor.sort(ordenacao)
+        resultados.append((rota, colecao, _plano_vencedor(cursor.explain())))
+
+    for rota, colecao, pipeline in AGREGACOES:
+        explain = database.command("aggregate", colecao, pipeline=pipeline, explain=True)
+        resultados.append((rota, colecao, _plano_vencedor(explain)))
+
+    for rota, colecao, plano in resultados:
+        encontrados = [estagio for estagio in dict.fromkeys(_estagios(plano)) if estagio in ESTAGIOS_PROBLEMATICOS]
+        if encontrados:
+            problemas += 1
+            detalhes = ", ".join(f"{e} ({ESTAGIOS_PROBLEMATICOS[e]})" for e in encontrados)
+            print(f"[PROBLEMA] {rota} em '{colecao}': {detalhes}")
+        else:
+            print(f"[OK]       {rota} em '{colecao}'")
+
+    print(f"\n{len(resultados)} consultas auditadas, {problemas} com problema.")
+    return problemas
+
+
+if __name__ == "__main__":
+    sys.exit(1 if auditar() else 0)
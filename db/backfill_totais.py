@@ -0,0 +1,60 @@
+# db/backfill_totais.py
+#
+# Grava "subtotal" em cada item e "total" nos pedidos finalizados antes de os totais
+# passarem a ser gravados no fechamento. Usa os preços que já estão no pedido (não os
+# do cardápio de hoje). Percorre a coleção por _id em lotes, então pode ser interrompido
+# e rodado de novo: só os pedidos ainda sem totais são alterados.
+#
+# Uso: python -m db.backfill_totais [--lote 500] [--pausa 0.1] [--simular]
+import argparse
+import time
+
+from pymongo import UpdateOne
+
+from services.totais import calcular_totais
+from .connection import database
+
+# Pedido sem total ou com alguma linha sem subtotal.
+SEM_TOTAIS = {"$or": [
+    {"total": {"$exists": False}},
+    {"itens": {"$elemMatch": {"subtotal": {"$exists": False}}}},
+]}
+
+
+def backfill(tamanho_lote=500, pausa=0.0, simular=False):
+    ultimo_id = None
+    lidos = alterados = 0
+
+    while True:
+        filtro = dict(SEM_TOTAIS)
+        if ultimo_id is not None:
+            filtro["_id"] = {"$gt": ultimo_id}
+        lote = list(database.pedidos.find(filtro, {"itens": 1}).sort("_id", 1).limit(tamanho_lote))
+        if not lote:
+            break
+
+        operacoes = []
+        for pedido in lote:
+            itens, total = calcular_totais(pedido.get("itens"))
+            operacoes.append(UpdateOne({"_id": pedido["_id"]}, {"$set": {"itens": itens, "total": total}}))
+
+        if not simular:
+            alterados += database.pedidos.bulk_write(operacoes, ordered=False).modified_count
+        lidos += len(lote)
+        ultimo_id = lote[-1]["_id"]
+        print(f"{lidos} pedidos processados (último _id {ultimo_id})")
+
+        if pausa:
+            time.sleep(pausa)
+
+    print(f"\nConcluído: {lidos} pedidos sem totais, {alterados} atualizados{' (simulação)' if simular else ''}.")
+    return lidos
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Grava subtotais e total nos pedidos antigos")
+    parser.add_argument("--lote", type=int, default=500, help="pedidos por lote")
+    parser.add_argument("--pausa", type=float, default=0.0, help="segundos de espera entre lotes")
+    parser.add_argument("--simular", action="store_true", help="só conta, sem gravar")
+    args = parser.parse_args()
+    backfill(args.lote, args.pausa, args.simular)
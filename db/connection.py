@@ -1,33 +1,254 @@
 # db/connection.py
-from pymongo import MongoClient, ASCENDING
+from pymongo import MongoClient, ASCENDING, DESCENDING, IndexModel
 from pymongo.server_api import ServerApi
+from pymongo.errors import CollectionInvalid, OperationFailure
+import logging
 import os
+import threading
+from datetime import datetime
 from dotenv import load_dotenv
+from services.metricas import MongoCommandMetrics, MongoPoolMetrics
+from services.preguicoso import Preguicoso, descartar
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+# Índices exigidos pelas consultas das rotas, por coleção: (chaves, opções).
+# Toda coleção listada aqui também é criada na inicialização, se ainda não existir.
+INDICES = {
+    "mensagens": [
+        ([("usuario_id", ASCENDING), ("data", DESCENDING), ("_id", DESCENDING)], {}),
+    ],
+    "usuarios": [
+        ([("email", ASCENDING)], {"unique": True}),
+    ],
+    "admins": [
+        ([("email", ASCENDING)], {}),
+    ],
+    "pedidos": [
+        ([("usuario_id", ASCENDING), ("data", DESCENDING)], {}),
+        ([("data", DESCENDING), ("_id", DESCENDING)], {}),
+        ([("status", ASCENDING), ("data", DESCENDING)], {}),
+    ],
+    "pedidos_em_aberto": [
+        # Um carrinho por usuário: os upserts de _adicionar_ao_carrinho dependem disso.
+        ([("usuario_id", ASCENDING)], {"unique": True}),
+    ],
+    "vendas_diarias": [
+        ([("dia", ASCENDING), ("item", ASCENDING)], {"unique": True}),
+    ],
+    "tokens_revogados": [
+        # Revogações só importam até o token expirar: o Mongo apaga cada uma no seu `exp`.
+        ([("exp", ASCENDING)], {"expireAfterSeconds": 0}),
+        ([("criado", ASCENDING)], {}),
+    ],
+    "cardapio": [
+        ([("disponibilidade", ASCENDING), ("categoria", ASCENDING), ("nome", ASCENDING)], {}),
+        ([("categoria", ASCENDING), ("nome", ASCENDING), ("_id", ASCENDING)], {}),
+    ],
+}
+
+# Índices que versões anteriores criavam e que já foram substituídos por outros em INDICES:
+# são removidos na inicialização para não pesar em toda escrita sem servir a nenhuma consulta.
+INDICES_OBSOLETOS = {
+    # Trocado por (usuario_id, data desc, _id desc), que também atende à paginação do histórico.
+    "mensagens": [
+        [("usuario_id", ASCENDING), ("data", ASCENDING)],
+    ],
+}
+
+# Retenção do chat: com MENSAGENS_RETENCAO_DIAS > 0 o próprio Mongo apaga (índice TTL em
+# `data`) as mensagens mais antigas que o prazo. 0 mantém tudo.
+RETENCAO_MENSAGENS_DIAS = float(os.getenv("MENSAGENS_RETENCAO_DIAS", 0))
+if RETENCAO_MENSAGENS_DIAS > 0:
+    INDICES["mensagens"].append(
+        ([("data", ASCENDING)], {"expireAfterSeconds": int(RETENCAO_MENSAGENS_DIAS * 86400)})
+    )
+
+
+def _numero(valor):
+    try:
+        return int(valor)
+    except (TypeError, ValueError):
+        return 0
+
+
+def _inteiro_ou_none(variavel, padrao=0):
+    # Para opções em que 0 significa "sem limite" no .env e None no pymongo.
+    return int(os.getenv(variavel, padrao)) or None
+
+
+def opcoes_do_cliente():
+    """Opções do MongoClient compartilhado: pool, timeouts e compressão, lidas do ambiente."""
+    opcoes = {
+        "maxPoolSize": int(os.getenv("MONGO_POOL_MAX", 100)),
+        "minPoolSize": int(os.getenv("MONGO_POOL_MIN", 0)),
+        "maxConnecting": int(os.getenv("MONGO_POOL_CONECTANDO", 2)),
+        "maxIdleTimeMS": _inteiro_ou_none("MONGO_POOL_OCIOSO_MS"),
+        "waitQueueTimeoutMS": _inteiro_ou_none("MONGO_POOL_ESPERA_MS"),
+        "connectTimeoutMS": int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", 5000)),
+        "socketTimeoutMS": int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", 30000)),
+        "serverSelectionTimeoutMS": int(os.getenv("MONGO_SELECAO_TIMEOUT_MS", 30000)),
+    }
+    # Ex.: "zstd,snappy,zlib" (zstd e snappy exigem os pacotes zstandard e python-snappy).
+    compressores = os.getenv("MONGO_COMPRESSORES")
+    if compressores:
+        opcoes["compressors"] = compressores
+    return opcoes
+
+
+# Um único listener para o processo: as contagens do pool ficam disponíveis em /metrics.
+metricas_pool = MongoPoolMetrics()
+
 class Database:
     _instance = None
-    
+    _lock = threading.Lock()
+
     def __new__(cls):
         if cls._instance is None:
-            cls._instance = super().__new__(cls)
-            cls._instance._initialize()
+            with cls._lock:
+                if cls._instance is None:
+                    # Só vira o singleton depois de inicializar por completo: se o Mongo falhar
+                    # no meio (coleções, índices), a próxima requisição tenta tudo de novo.
+                    instancia = super().__new__(cls)
+                    try:
+                        instancia._initialize()
+                    except Exception:
+                        if getattr(instancia, "client", None) is not None:
+                            instancia.client.close()
+                        raise
+                    cls._instance = instancia
         return cls._instance
     
     def _initialize(self):
+        self._conectar()
+        self._create_collections()
+        self._create_indexes()
+
+    def _conectar(self):
         self.client = MongoClient(
             os.getenv("MONGODB_URL"),
             server_api=ServerApi('1'),
-            connectTimeoutMS=5000,
-            socketTimeoutMS=30000
+            event_listeners=[MongoCommandMetrics(), metricas_pool],
+            **opcoes_do_cliente()
         )
         self.db = self.client["polichat"]
-        self._create_indexes()
+
+    @classmethod
+    def apos_fork(cls):
+        # O MongoClient não é fork-safe: os sockets e as threads de monitoramento são do pai.
+        # O filho abre um cliente próprio (coleções e índices já foram criados pelo pai) e
+        # abandona o herdado sem close(), que mexeria em conexões que o pai ainda usa.
+        metricas_pool.reiniciar()
+        descartar(database)
+        if cls._instance is not None:
+            cls._instance._conectar()
+
+    def _create_collections(self):
+        existentes = set(self.db.list_collection_names())
+        for nome in INDICES:
+            if nome not in existentes:
+                try:
+                    self.db.create_collection(nome)
+                except CollectionInvalid:
+                    pass  # outro processo criou a coleção ao mesmo tempo
         
     def _create_indexes(self):
-        self.db.mensagens.create_index([("usuario_id", ASCENDING), ("data", ASCENDING)])
-        self.db.usuarios.create_index("email", unique=True)
+        try:
+            self._unificar_carrinhos_duplicados()
+        except Exception:
+            # A migração não pode impedir o app de subir: sem ela só o índice único de
+            # pedidos_em_aberto falha, e _criar_indices_um_a_um registra o porquê.
+            logger.exception("Não foi possível unir os carrinhos duplicados de pedidos_em_aberto.")
+        for nome, indices in INDICES.items():
+            colecao = self.db[nome]
+            self._drop_conflicting_indexes(colecao, indices)
+            try:
+                colecao.create_indexes([IndexModel(chaves, **opcoes) for chaves, opcoes in indices])
+            except OperationFailure:
+                # Inclui DuplicateKeyError (índice único sobre dados repetidos): cria os demais
+                # índices um a um e registra o que falhou, sem derrubar a inicialização.
+                self._criar_indices_um_a_um(colecao, indices)
+
+    def _criar_indices_um_a_um(self, colecao, indices):
+        for chaves, opcoes in indices:
+            try:
+                colecao.create_index(chaves, **opcoes)
+            except OperationFailure as e:
+                logger.error(
+                    "Não foi possível criar o índice %s em %s: %s. Se há documentos repetidos para um "
+                    "índice único, remova-os (ou una-os) e reinicie o app para criar o índice.",
+                    chaves, colecao.name, e
+                )
+
+    def _unificar_carrinhos_duplicados(self):
+        # O índice único de pedidos_em_aberto.usuario_id não é criado se algum usuário já tem
+        # mais de um carrinho (de antes do índice existir). Antes de criá-lo, junta os
+        # carrinhos de cada usuário no mais antigo, somando as quantidades por item.
+        colecao = self.db.pedidos_em_aberto
+        atual = colecao.index_information().get("usuario_id_1")
+        if atual is not None and atual.get("unique"):
+            return
+
+        grupos = colecao.aggregate([
+            {"$group": {"_id": "$usuario_id", "ids": {"$push": "$_id"}, "total": {"$sum": 1}}},
+            {"$match": {"total": {"$gt": 1}}},
+        ])
+        for grupo in grupos:
+            carrinhos = list(colecao.find({"_id": {"$in": grupo["ids"]}}).sort([("data_inicio", ASCENDING), ("_id", ASCENDING)]))
+            itens, outros = {}, []
+            for carrinho in carrinhos:
+                for item in carrinho.get("itens") or []:
+                    if not isinstance(item, dict):
+                        outros.append(item)  # itens antigos gravados como texto ficam como estão
+                    elif item.get("nome") in itens:
+                        anterior = itens[item["nome"]]
+                        anterior["quantidade"] = _numero(anterior.get("quantidade")) + _numero(item.get("quantidade"))
+                    else:
+                        itens[item.get("nome")] = dict(item)
+
+            mantido, removidos = carrinhos[0], [c["_id"] for c in carrinhos[1:]]
+            alteracoes = {"itens": list(itens.values()) + outros}
+            inicios = [c["data_inicio"] for c in carrinhos if isinstance(c.get("data_inicio"), datetime)]
+            if inicios:
+                alteracoes["data_inicio"] = min(inicios)
+            atualizacoes = [c["data_atualizacao"] for c in carrinhos if isinstance(c.get("data_atualizacao"), datetime)]
+            if atualizacoes:
+                alteracoes["data_atualizacao"] = max(atualizacoes)
+            colecao.update_one({"_id": mantido["_id"]}, {"$set": alteracoes})
+            colecao.delete_many({"_id": {"$in": removidos}})
+            logger.warning("%d carrinhos do usuário %s unidos em %s.", len(carrinhos), grupo["_id"], mantido["_id"])
+
+    def _drop_conflicting_indexes(self, colecao, indices):
+        # Um índice que mudou de opções (passou a ser único, TTL com outro prazo) não pode ser
+        # recriado por cima da versão antiga com as mesmas chaves: remove a antiga para o
+        # create_indexes recriá-la. Índices TTL que saíram do registro (retenção desligada)
+        # também são removidos, senão continuariam apagando documentos, assim como os que
+        # constam em INDICES_OBSOLETOS.
+        obsoletos = {tuple(chaves) for chaves in INDICES_OBSOLETOS.get(colecao.name, [])}
+        declarados = {
+            tuple(chaves): (bool(opcoes.get("unique")), opcoes.get("expireAfterSeconds"))
+            for chaves, opcoes in indices
+        }
+        for nome, info in colecao.index_information().items():
+            if nome == "_id_":
+                continue
+            # O servidor pode devolver a direção como 1.0; índices text, 2dsphere e hashed
+            # têm o tipo em texto no lugar dela e são comparados como estão.
+            chaves = tuple(
+                (campo, int(direcao) if isinstance(direcao, (int, float)) else direcao)
+                for campo, direcao in info["key"]
+            )
+            atual = (bool(info.get("unique")), info.get("expireAfterSeconds"))
+            if chaves in obsoletos:
+                colecao.drop_index(nome)
+            elif chaves in declarados and atual != declarados[chaves]:
+                colecao.drop_index(nome)
+            elif chaves not in declarados and atual[1] is not None:
+                colecao.drop_index(nome)
+
+# Exporta a instância do banco de dados. A conexão, as coleções e os índices só são
+# criados no primeiro uso (database.pedidos, database["mensagens"]...), não no import.
+database = Preguicoso(lambda: Database().db)
 
-# Exporta a instância do banco de dados
-database = Database().db
\ No newline at end of file
@@ -0,0 +1,54 @@
+from ..connection import database
+
+# Ordem das listagens de pedidos; também é a chave do cursor de paginação.
+ORDENACAO_PEDIDOS = [("data", -1), ("_id", -1)]
+
+
+def _total_dos_itens():
+    # Só para pedidos ainda sem "total" gravado (anteriores ao backfill): soma preço x quantidade
+    # no servidor; itens mal formatados (sem preço) valem 0.
+    return {"$sum": {"$map": {
+        "input": {"$ifNull": ["$itens", []]},
+        "as": "item",
+        "in": {"$multiply": [
+            {"$convert": {"input": "$$item.preco", "to": "double", "onError": 0, "onNull": 0}},
+            {"$convert": {"input": "$$item.quantidade", "to": "int", "onError": 1, "onNull": 1}}
+        ]}
+    }}}
+
+
+def pipeline_pedidos_com_usuario(filtro=None, limite=None):
+    """Pedidos mais recentes primeiro, já com o e-mail do usuário e o total gravado no fechamento.
+
+    Substitui o find_one em `usuarios` por pedido: o $lookup junta os usuários
+    no próprio servidor, numa única agregação.
+    """
+    pipeline = []
+    if filtro:
+        pipeline.append({"$match": filtro})
+    pipeline.append({"$sort": dict(ORDENACAO_PEDIDOS)})
+    if limite:
+        pipeline.append({"$limit": limite})
+
+    pipeline += [
+        {"$addFields": {
+            "usuario_oid": {"$convert": {"input": "$usuario_id", "to": "objectId", "onError": None, "onNull": None}}
+        }},
+        {"$lookup": {
+            "from": "usuarios",
+            "localField": "usuario_oid",
+            "foreignField": "_id",
+            "as": "usuario"
+        }},
+        {"$addFields": {
+            "usuario_email": {"$arrayElemAt": ["$usuario.email", 0]},
+            "total": {"$ifNull": ["$total", _total_dos_itens()]}
+        }},
+        {"$project": {"usuario": 0, "usuario_oid": 0}}
+    ]
+    return pipeline
+
+
+def listar_pedidos_com_usuario(filtro=None, limite=None, tamanho_lote=None):
+    opcoes = {"batchSize": tamanho_lote} if tamanho_lote else {}
+    return database.pedidos.aggregate(pipeline_pedidos_com_usuario(filtro, limite), **opcoes)
@@ -0,0 +1,100 @@
+# db/reconstruir_resumos.py
+#
+# Recalcula do zero os resumos do painel (vendas_diarias e pedidos_por_status) a partir
+# de `pedidos`, com as mesmas regras dos $inc feitos no checkout. Com --verificar só
+# compara o recálculo com o que está gravado e lista as diferenças.
+#
+# Rode com o sistema parado ou em horário de pouco movimento: pedidos finalizados
+# durante a reconstrução podem ficar de fora até a próxima execução.
+#
+# Uso: python -m db.reconstruir_resumos [--verificar]
+import argparse
+import sys
+
+from services.resumos import FUSO_RELATORIOS
+from .connection import database
+
+_QUANTIDADE = {"$ifNull": ["$itens.quantidade", 1]}
+_SUBTOTAL = {"$ifNull": ["$itens.subtotal", {"$multiply": [{"$ifNull": ["$itens.preco", 0]}, _QUANTIDADE]}]}
+
+PIPELINE_VENDAS = [
+    {"$unwind": "$itens"},
+    {"$match": {"itens.nome": {"$type": "string", "$ne": ""}}},
+    # Primeiro por pedido, para que o mesmo item repetido num pedido conte como um pedido só.
+    {"$group": {
+        "_id": {
+            "dia": {"$dateToString": {"format": "%Y-%m-%d", "date": "$data", "timezone": FUSO_RELATORIOS}},
+            "item": "$itens.nome",
+            "pedido": "$_id"
+        },
+        "quantidade": {"$sum": _QUANTIDADE},
+        "receita_centavos": {"$sum": {"$round": [{"$multiply": [_SUBTOTAL, 100]}, 0]}}
+    }},
+    {"$group": {
+        "_id": {"dia": "$_id.dia", "item": "$_id.item"},
+        "quantidade": {"$sum": "$quantidade"},
+        "pedidos": {"$sum": 1},
+        "receita_centavos": {"$sum": "$receita_centavos"}
+    }},
+    {"$project": {
+        "_id": 0, "dia": "$_id.dia", "item": "$_id.item",
+        "quantidade": 1, "pedidos": 1, "receita_centavos": {"$toLong": "$receita_centavos"}
+    }},
+]
+
+PIPELINE_STATUS = [
+    {"$group": {"_id": "$status", "quantidade": {"$sum": 1}}},
+    {"$match": {"_id": {"$ne": None}}},
+]
+
+
+def _por_chave(documentos, chave):
+    return {chave(doc): doc for doc in documentos}
+
+
+def _diferencas(nome, esperado, gravado, campos):
+    diferencas = 0
+    for chave in sorted(set(esperado) | set(gravado), key=str):
+        a, b = esperado.get(chave, {}), gravado.get(chave, {})
+        if any(a.get(campo, 0) != b.get(campo, 0) for campo in campos):
+            diferencas += 1
+            print(f"[{nome}] {chave}: recalculado {[a.get(c, 0) for c in campos]} x gravado {[b.get(c, 0) for c in campos]}")
+    return diferencas
+
+
+def reconstruir(verificar=False):
+    vendas = list(database.pedidos.aggregate(PIPELINE_VENDAS, allowDiskUse=True))
+    status = list(database.pedidos.aggregate(PIPELINE_STATUS))
+
+    diferencas = _diferencas(
+        "vendas_diarias",
+        _por_chave(vendas, lambda d: (d["dia"], d["item"])),
+        _por_chave(database.vendas_diarias.find({}, {"_id": 0}), lambda d: (d["dia"], d["item"])),
+        ("quantidade", "pedidos", "receita_centavos")
+    )
+    diferencas += _diferencas(
+        "pedidos_por_status",
+        _por_chave(status, lambda d: d["_id"]),
+        _por_chave(database.pedidos_por_status.find(), lambda d: d["_id"]),
+        ("quantidade",)
+    )
+    print(f"\n{len(vendas)} linhas de vendas, {len(status)} status, {diferencas} diferenças.")
+
+    if verificar:
+        return diferencas
+
+    database.vendas_diarias.delete_many({})
+    if vendas:
+        database.vendas_diarias.insert_many(vendas)
+    database.pedidos_por_status.delete_many({})
+    if status:
+        database.pedidos_por_status.insert_many(status)
+    print("Resumos regravados.")
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recalcula os resumos de vendas e status a partir de pedidos")
+    parser.add_argument("--verificar", action="store_true", help="só compara, sem regravar; sai com 1 se houver diferenças")
+    args = parser.parse_args()
+    sys.exit(1 if reconstruir(args.verificar) else 0)
@@ -1,24 +1,128 @@
-import pymongo
-from dotenv import load_dotenv
+# Purga de documentos antigos (por padrão, da coleção `mensagens`).
+#
+# Apaga em lotes pequenos, em ordem de _id, com limite de documentos por segundo para
+# não sobrecarregar o primário. O último _id processado fica salvo num arquivo de
+# checkpoint: se a purga for interrompida, --retomar continua de onde parou.
+#
+# Exemplos:
+#   python delete_data.py --dias 180                      # mensagens com mais de 180 dias
+#   python delete_data.py --usuario 65f0... --usuario 65f1...
+#   python delete_data.py --dias 30 --max-por-segundo 500 --simular
+#   python delete_data.py --tudo                           # apaga a coleção inteira, em lotes
+import argparse
+import json
 import os
+import time
+from datetime import datetime, timedelta
 
-load_dotenv()
+from bson import json_util
+
+from db.connection import database
+
+
+def montar_filtro(dias=None, usuarios=None, campo_data="data"):
+    filtro = {}
+    if dias is not None:
+        filtro[campo_data] = {"$lt": datetime.utcnow() - timedelta(days=dias)}
+    if usuarios:
+        filtro["usuario_id"] = {"$in": list(usuarios)}
+    return filtro
+
+
+class Checkpoint:
+    """Guarda o filtro da purga e o último _id apagado, para retomar exatamente a mesma purga.
+
+    O filtro é salvo já resolvido (com a data de corte calculada na primeira execução),
+    então retomar dias depois não apaga nada além do que a purga original apagaria.
+    """
+
+    def __init__(self, caminho, parametros):
+        self.caminho = caminho
+        self.assinatura = json.dumps(parametros, sort_keys=True)
+
+    def carregar(self):
+        """(filtro, ultimo_id) salvos, ou None se não houver checkpoint."""
+        if not os.path.exists(self.caminho):
+            return None
+        with open(self.caminho, encoding="utf-8") as arquivo:
+            salvo = json.load(arquivo)
+        if salvo.get("assinatura") != self.assinatura:
+            raise SystemExit(f"O checkpoint {self.caminho} é de outra purga (coleção ou filtros diferentes).")
+        return json_util.loads(salvo["filtro"]), json_util.loads(salvo["ultimo_id"])
+
+    def salvar(self, filtro, ultimo_id):
+        temporario = self.caminho + ".tmp"
+        with open(temporario, "w", encoding="utf-8") as arquivo:
+            json.dump({
+                "assinatura": self.assinatura,
+                "filtro": json_util.dumps(filtro),
+                "ultimo_id": json_util.dumps(ultimo_id)
+            }, arquivo)
+        os.replace(temporario, self.caminho)
+
+    def remover(self):
+        if os.path.exists(self.caminho):
+            os.remove(self.caminho)
+
+
+def purgar(colecao, filtro, tamanho_lote=1000, max_por_segundo=2000, checkpoint=None, retomar=False, simular=False):
+    ultimo_id = None
+    salvo = checkpoint.carregar() if (checkpoint and retomar) else None
+    if salvo is not None:
+        filtro, ultimo_id = salvo
+        print(f"Retomando depois do _id {ultimo_id}")
+
+    examinados = apagados = 0
+    inicio = time.monotonic()
+
+    while True:
+        consulta = dict(filtro)
+        if ultimo_id is not None:
+            consulta["_id"] = {"$gt": ultimo_id}
+        ids = [doc["_id"] for doc in colecao.find(consulta, {"_id": 1}).sort("_id", 1).limit(tamanho_lote)]
+        if not ids:
+            break
+
+        if not simular:
+            apagados += colecao.delete_many({"_id": {"$in": ids}}).deleted_count
+        examinados += len(ids)
+        ultimo_id = ids[-1]
+        if checkpoint and not simular:
+            checkpoint.salvar(filtro, ultimo_id)
+
+        decorrido = time.monotonic() - inicio
+        print(f"{examinados} encontrados, {apagados} apagados, {examinados / max(decorrido, 1e-9):.0f} docs/s (último _id {ultimo_id})")
+
+        # Limite de taxa: espera o suficiente para a média não passar de max_por_segundo.
+        if max_por_segundo:
+            atraso = examinados / max_por_segundo - (time.monotonic() - inicio)
+            if atraso > 0:
+                time.sleep(atraso)
+
+    if checkpoint and not simular:
+        checkpoint.remover()
+    sufixo = " (simulação, nada foi apagado)" if simular else ""
+    print(f"\nConcluído em {time.monotonic() - inicio:.1f}s: {examinados} documentos encontrados, {apagados} apagados{sufixo}.")
+    return apagados
 
-def apagar_todos_os_dados(uri, nome_banco, nome_collection):
-    # Conecta ao MongoDB
-    cliente = pymongo.MongoClient(uri)
-    db = cliente[nome_banco]
-    collection = db[nome_collection]
-    
-    # Apaga todos os documentos da collection
-    resultado = collection.delete_many({})
-    print(f"{resultado.deleted_count} documentos apagados da collection '{nome_collection}'.")
 
-# Exemplo de uso:
 if __name__ == "__main__":
-    # Substitua pelos seus dados de conexão
-    uri = os.getenv("MONGODB_URL")
-    nome_banco = "polichat"
-    nome_collection = "mensagens"
-    
-    apagar_todos_os_dados(uri, nome_banco, nome_collection)
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Purga em lotes, com limite de taxa e retomada")
+    parser.add_argument("--colecao", default="mensagens")
+    parser.add_argument("--dias", type=float, help="apaga só documentos com `data` mais antiga que N dias")
+    parser.add_argument("--usuario", action="append", help="apaga só documentos deste usuario_id (pode repetir)")
+    parser.add_argument("--tudo", action="store_true", help="sem filtros: apaga todos os documentos da coleção")
+    parser.add_argument("--lote", type=int, default=1000, help="documentos por lote")
+    parser.add_argument("--max-por-segundo", type=int, default=2000, help="teto de documentos apagados por segundo (0 = sem limite)")
+    parser.add_argument("--retomar", action="store_true", help="continua a partir do checkpoint de uma execução interrompida")
+    parser.add_argument("--checkpoint", help="arquivo de checkpoint (padrão: .purga_<colecao>.json)")
+    parser.add_argument("--simular", action="store_true", help="só conta o que seria apagado")
+    args = parser.parse_args()
+
+    filtro = montar_filtro(args.dias, args.usuario)
+    if not filtro and not args.tudo:
+        parser.error("informe --dias e/ou --usuario, ou --tudo para apagar a coleção inteira")
+
+    checkpoint = Checkpoint(args.checkpoint or f".purga_{args.colecao}.json",
+                            {"colecao": args.colecao, "dias": args.dias, "usuarios": sorted(args.usuario or [])})
+    purgar(database[args.colecao], filtro, args.lote, args.max_por_segundo, checkpoint, args.retomar, args.simular)
@@ -1,17 +1,9 @@
-import os
-from pymongo import MongoClient
 from datetime import datetime
-
-mongodb_url = os.getenv("MONGODB_URL")
-client = MongoClient(mongodb_url)
-database = client["polichat"]
-usuarios = database["usuarios"]
-cardapio = database["cardapio"]
-pedidos = database["pedidos"]
+from db.connection import database
 
 # --- Funcoes do cardapio ---
 def listar_cardapio():
-    itens = cardapio.find({"disponivel": True})
+    itens = database.cardapio.find({"disponivel": True})
     return [{"nome": i["nome"], "preco": i["preco"], "categoria": i["categoria"]} for i in itens]
 
 def extrair_nome_item(mensagem):
@@ -22,20 +14,20 @@ def extrair_nome_item(mensagem):
     return mensagem.strip()                                         
 
 def buscar_item_cardapio(nome):
-    item = cardapio.find_one({"nome": {"$regex": nome, "$options": "i"}})
+    item = database.cardapio.find_one({"nome": {"$regex": nome, "$options": "i"}})
     if item:
         return {"nome": item["nome"], "preco": item["preco"], "categoria": item["categoria"]}
     return None
 
 # --- Funcoes dos usuarios ---
 def autenticar_usuario(email, senha):
-    return usuarios.find_one({"email": email, "senha": senha})                          
+    return database.usuarios.find_one({"email": email, "senha": senha})                          
 
 def salvar_pedido(usuario_id, nome_item):
     item = buscar_item_cardapio(nome_item)
     if not item:
         return False
-    pedidos.insert_one({
+    database.pedidos.insert_one({
         "usuario_id": usuario_id,
         "pedido": item["nome"],
         "preco": item["preco"],
@@ -46,7 +38,7 @@ def salvar_pedido(usuario_id, nome_item):
 
 
 def obter_pedidos(usuario_id):
-    registros = pedidos.find({"usuario_id": usuario_id})
+    registros = database.pedidos.find({"usuario_id": usuario_id})
     return [f"{r['pedido']}" for r in registros]
 
 def obter_historico_mensagens(usuario_id, limite=10):
@@ -0,0 +1,115 @@
+# Servidor de produção: gunicorn com workers pré-forkados, cada um com várias threads (gthread).
+#
+# O app é carregado uma vez no processo mestre (preload) e os workers herdam a memória
+# por copy-on-write. O mestre também inicializa o banco (coleções e índices) antes do
+# fork, para que os workers não façam isso N vezes em paralelo; cada worker abre o seu
+# próprio MongoClient logo depois do fork, no hook post_fork (ver app.apos_fork).
+#
+# As conexões do feed de eventos (SSE) ocupam uma thread cada enquanto estão abertas:
+# dimensione WEB_THREADS contando com elas. Com mais de um worker o feed precisa vir do
+# change stream do Mongo (EVENTOS_FONTE=change_stream; exige replica set ou mongos): com a
+# fonte local cada worker só veria os pedidos que ele mesmo tratou. Sem EVENTOS_FONTE, o
+# serve.py consulta o MongoDB na partida: com replica set usa o change stream; com um
+# mongod isolado sobe um único worker com a fonte local.
+#
+# Requer: pip install gunicorn
+# Uso: python serve.py
+#   WEB_WORKERS=4 WEB_THREADS=8 PORT=5000 python serve.py
+import os
+import sys
+
+from dotenv import load_dotenv
+from gunicorn.app.base import BaseApplication
+from pymongo import MongoClient
+from pymongo.server_api import ServerApi
+
+load_dotenv()
+
+
+def opcoes_do_servidor():
+    return {
+        "bind": os.getenv("WEB_BIND", f"0.0.0.0:{os.getenv('PORT', 5000)}"),
+        "workers": int(os.getenv("WEB_WORKERS", 0)) or (os.cpu_count() or 1) * 2 + 1,
+        "threads": int(os.getenv("WEB_THREADS", 8)),
+        "worker_class": "gthread",
+        "preload_app": True,
+        "timeout": int(os.getenv("WEB_TIMEOUT", 30)),
+        "graceful_timeout": int(os.getenv("WEB_GRACEFUL_TIMEOUT", 30)),
+        "keepalive": int(os.getenv("WEB_KEEPALIVE", 5)),
+        # Recicla workers depois de N requisições (0 = nunca); o jitter evita que todos reiniciem juntos.
+        "max_requests": int(os.getenv("WEB_MAX_REQUESTS", 0)),
+        "max_requests_jitter": int(os.getenv("WEB_MAX_REQUESTS_JITTER", 0)),
+    }
+
+
+def _suporta_change_stream():
+    """Se o MongoDB configurado é um replica set ou um mongos (um mongod isolado não tem change streams)."""
+    cliente = MongoClient(os.getenv("MONGODB_URL"), server_api=ServerApi('1'), serverSelectionTimeoutMS=10000)
+    try:
+        hello = cliente.admin.command("hello")
+    except Exception as e:
+        raise SystemExit(f"Não foi possível consultar o MongoDB para escolher a fonte de eventos: {e}")
+    finally:
+        cliente.close()
+    return "setName" in hello or hello.get("msg") == "isdbgrid"
+
+
+def _definir_fonte_de_eventos(opcoes):
+    # Precisa rodar antes do import do app: services.eventos lê EVENTOS_FONTE ao ser importado.
+    fonte = os.getenv("EVENTOS_FONTE")
+    if opcoes["workers"] == 1:
+        os.environ.setdefault("EVENTOS_FONTE", "local")
+        return
+
+    if fonte is None:
+        if _suporta_change_stream():
+            os.environ["EVENTOS_FONTE"] = "change_stream"
+        else:
+            print(f"MongoDB sem replica set: sem change streams, o feed de eventos só funciona num único "
+                  f"processo. Subindo 1 worker (em vez de {opcoes['workers']}) com EVENTOS_FONTE=local.",
+                  file=sys.stderr)
+            os.environ["EVENTOS_FONTE"] = "local"
+            opcoes["workers"] = 1
+    elif fonte == "local":
+        raise SystemExit(
+            f"EVENTOS_FONTE=local com {opcoes['workers']} workers: os clientes do feed de eventos "
+            "perderiam os pedidos tratados pelos outros workers. Use EVENTOS_FONTE=change_stream "
+            "(exige replica set) ou WEB_WORKERS=1."
+        )
+    elif fonte == "change_stream" and not _suporta_change_stream():
+        raise SystemExit(
+            "EVENTOS_FONTE=change_stream, mas o MongoDB não é um replica set: o feed de eventos nunca "
+            "receberia nada. Configure um replica set ou use WEB_WORKERS=1 com EVENTOS_FONTE=local."
+        )
+
+
+def _apos_fork(servidor, worker):
+    # Só nos workers do gunicorn: processos filhos criados de outro jeito (pool de hashing)
+    # não passam por aqui.
+    from app import apos_fork
+    apos_fork()
+
+
+class ServidorPoliChat(BaseApplication):
+
+    def __init__(self, opcoes):
+        self.opcoes = opcoes
+        super().__init__()
+
+    def load_config(self):
+        for chave, valor in self.opcoes.items():
+            self.cfg.set(chave, valor)
+        self.cfg.set("post_fork", _apos_fork)
+
+    def load(self):
+        from app import app
+        from db.connection import Database
+
+        Database()
+        return app
+
+
+if __name__ == "__main__":
+    opcoes = opcoes_do_servidor()
+    _definir_fonte_de_eventos(opcoes)
+    ServidorPoliChat(opcoes).run()
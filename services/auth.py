@@ -0,0 +1,51 @@
+from functools import wraps
+
+from flask import g, jsonify, request
+
+from services.tokens import token_service, TokenInvalido
+
+
+def requer_token(*roles, aceitar_na_url=False):
+    """Exige um token válido em "Authorization: Bearer <token>".
+
+    Preenche g.usuario_id, g.role e g.claims. Com `roles`, o papel do token
+    precisa estar entre eles. Com `aceitar_na_url`, o token também pode vir em
+    ?token=..., para clientes que não enviam cabeçalhos (EventSource do navegador).
+    """
+    def decorador(rota):
+        @wraps(rota)
+        def verificar(*args, **kwargs):
+            cabecalho = request.headers.get("Authorization", "")
+            tipo, _, token = cabecalho.partition(" ")
+            if not cabecalho and aceitar_na_url and request.args.get("token"):
+                tipo, token = "bearer", request.args["token"]
+            if tipo.lower() != "bearer" or not token:
+                return jsonify({"erro": "Token de acesso não fornecido"}), 401
+
+            try:
+                claims = token_service.verificar(token.strip())
+            except TokenInvalido as e:
+                return jsonify({"erro": f"Token inválido: {e}"}), 401
+
+            if roles and claims.get("role") not in roles:
+                return jsonify({"erro": "Acesso negado"}), 403
+
+            g.claims = claims
+            g.usuario_id = claims["sub"]
+            g.role = claims.get("role")
+            return rota(*args, **kwargs)
+        return verificar
+    return decorador
+
+
+def usuario_da_requisicao(usuario_id_informado=None):
+    """Id do usuário dono da requisição.
+
+    O id vem do token; um `usuario_id` enviado pelo cliente só é aceito se for
+    o mesmo do token, ou se quem pede for administrador. Retorna None se não for permitido.
+    """
+    if not usuario_id_informado or usuario_id_informado == g.usuario_id:
+        return g.usuario_id
+    if g.role == "admin":
+        return usuario_id_informado
+    return None
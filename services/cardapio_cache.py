@@ -0,0 +1,107 @@
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import namedtuple
+
+logger = logging.getLogger(__name__)
+
+CardapioSnapshot = namedtuple("CardapioSnapshot", ["versao", "itens", "corpo", "etag"])
+
+CAMPOS_CARDAPIO = {"_id": 1, "nome": 1, "preco": 1, "categoria": 1, "descricao": 1, "disponibilidade": 1}
+
+
+class CardapioCache:
+    """Cópia em memória dos itens disponíveis do cardápio, com contador de versão.
+
+    As rotas de administração chamam `invalidar()` depois de cada alteração, o que
+    incrementa a versão. Com vários processos, `invalidar()` também incrementa um
+    contador compartilhado em `versoes` (documento "cardapio"), que cada processo
+    confere no máximo a cada `intervalo_versao` segundos: uma leitura por _id, e o
+    cardápio só é relido se o contador mudou. Para alterações feitas direto no Mongo,
+    com `ttl` > 0 a cópia é revalidada de tempos em tempos e a versão só muda se o
+    conteúdo mudou.
+
+    O snapshot devolvido é compartilhado entre as requisições e não deve ser alterado.
+    `filtro` escolhe quais documentos contam como disponíveis.
+    """
+
+    def __init__(self, colecao, ttl=0, filtro=None, versoes=None, intervalo_versao=5):
+        self._colecao = colecao
+        self._ttl = ttl
+        self._filtro = filtro if filtro is not None else {"disponibilidade": True}
+        self._versoes = versoes
+        self._intervalo_versao = intervalo_versao
+        self._lock = threading.Lock()
+        self._versao = 0
+        self._snapshot = None
+        self._carregado_em = 0.0
+        self._versao_compartilhada = None
+        self._conferido_em = 0.0
+
+    @property
+    def versao(self):
+        return self._versao
+
+    def invalidar(self):
+        with self._lock:
+            self._versao += 1
+            self._snapshot = None
+        if self._versoes is not None:
+            try:
+                self._versoes.update_one({"_id": "cardapio"}, {"$inc": {"versao": 1}}, upsert=True)
+            except Exception as e:
+                # A alteração do cardápio já foi gravada: os outros processos a veem no próximo ttl.
+                logger.warning("Não foi possível avisar os outros processos da mudança no cardápio: %s", e)
+
+    def _expirado(self):
+        return self._ttl > 0 and (time.monotonic() - self._carregado_em) >= self._ttl
+
+    def _conferir_vencido(self):
+        return self._versoes is not None and (time.monotonic() - self._conferido_em) >= self._intervalo_versao
+
+    def _ler_versao_compartilhada(self):
+        documento = self._versoes.find_one({"_id": "cardapio"}, {"versao": 1})
+        self._conferido_em = time.monotonic()
+        return (documento or {}).get("versao", 0)
+
+    def _carregar(self, versao):
+        itens = list(self._colecao.find(
+            self._filtro,
+            CAMPOS_CARDAPIO
+        ).sort([("categoria", 1), ("nome", 1)]))
+
+        for item in itens:
+            item['_id'] = str(item['_id'])
+
+        corpo = json.dumps(itens, default=str)
+        etag = hashlib.sha1(corpo.encode('utf-8')).hexdigest()
+        return CardapioSnapshot(versao, itens, corpo, etag)
+
+    def obter(self):
+        snapshot = self._snapshot
+        if snapshot is not None and not self._expirado() and not self._conferir_vencido():
+            return snapshot
+
+        with self._lock:
+            snapshot = self._snapshot
+            compartilhada = None
+            if snapshot is not None and not self._expirado():
+                if not self._conferir_vencido():
+                    return snapshot
+                compartilhada = self._ler_versao_compartilhada()
+                if compartilhada == self._versao_compartilhada:
+                    return snapshot
+
+            # Lido antes do cardápio: uma alteração entre as duas leituras só causa mais uma recarga.
+            if self._versoes is not None:
+                self._versao_compartilhada = compartilhada if compartilhada is not None else self._ler_versao_compartilhada()
+            novo = self._carregar(self._versao)
+            if snapshot is not None and novo.etag != snapshot.etag:
+                self._versao += 1
+                novo = novo._replace(versao=self._versao)
+
+            self._snapshot = novo
+            self._carregado_em = time.monotonic()
+            return novo
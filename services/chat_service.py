@@ -3,7 +3,109 @@ from thefuzz import fuzz
 import pytz
 from babel.dates import format_datetime
 from bson.objectid import ObjectId
+from pymongo.errors import DuplicateKeyError
 import re
+import logging
+from services.intent_index import IntentIndex
+from services.menu_matcher import MenuMatcher, normalizar
+from services.logs import AMOSTRA_LOGS
+from services.metricas import chat_mensagens, chat_comparacoes_fuzzy
+from services.totais import calcular_totais
+from services.resumos import registrar_venda
+from services.eventos import publicar_mudanca, resumo_do_pedido
+
+logger = logging.getLogger(__name__)
+
+# Quantas vezes a atualização é repetida quando outra requisição cria o mesmo carrinho ao mesmo tempo.
+TENTATIVAS_CARRINHO = 3
+
+RESPOSTA_SAUDACAO = "Olá! 👋 Como posso te ajudar hoje?"
+RESPOSTA_AGRADECIMENTO = "De nada! 😊 Se precisar de algo, é só chamar."
+RESPOSTA_PADRAO = "Desculpe, não entendi sua mensagem. Você pode tentar reformular ou digitar 'cardápio' para ver o que temos disponível."
+
+# Intenções em ordem de prioridade: quando mais de uma casa, vale a primeira da lista.
+# (nome, padrões, limiar)
+INTENCOES = [
+    ("consultar_pedidos", [
+        "meus pedidos", "meu histórico de pedidos", "pedidos anteriores",
+        "o que eu já pedi", "histórico de pedidos", "consultar pedidos",
+        "ver meus pedidos", "lista de pedidos", "qual meu histórico de pedidos", "pedidos feitos"
+    ], 75),
+    ("cancelar_pedido", [
+        "cancelar pedido", "quero cancelar", "anular pedido", "desistir do pedido",
+        "cancelar meu pedido", "não quero mais", "apagar pedido", "remover pedido"
+    ], 75),
+    ("ver_status_pedido_aberto", [
+        "qual meu pedido atual", "meu pedido agora", "o que estou pedindo", "meu carrinho atual", "ver meu pedido em andamento"
+    ], 75),
+    ("finalizar_pedido", [
+        "só isso", "so isso", "só", "so", "não", "nao", "mais nada", "encerrar",
+        "finalizar", "fechar pedido", "concluído", "concluido",
+        "pedido concluído", "pedido concluido", "concluir", "terminar",
+        "pode fechar", "está bom assim", "pronto", "acabou", "já está bom", "finalizar agora"
+    ], 75),
+    ("fazer_pedido", [
+        "quero pedir", "fazer um pedido", "quero isso", "gostaria de",
+        "me vê", "pode ser", "pedido", "quero", "pedir", "adicionar ao pedido",
+        "colocar no pedido", "escolher", "vou querer", "me traga", "quero fazer um pedido"
+    ], 70),
+    ("saudacao", [
+        "oi", "olá", "ola", "bom dia", "boa tarde", "boa noite", "e aí", "tudo bem", "oi tudo bem",
+        "como vai", "tudo em ordem", "saudações", "eae", "fala"
+    ], 75),
+    ("agradecimento", [
+        "obrigado", "valeu", "agradecido", "muito obrigado", "obrigada", "grato", "agradeço"
+    ], 80),
+    ("ver_cardapio", [
+        "cardapio", "cardápio", "menu", "catalogo", "lista de pratos",
+        "o que tem", "o que vocês têm", "o que voces tem", "o que está disponível",
+        "o que posso pedir", "quero comer", "almoço", "jantar", "refeição", "lanche",
+        "comida", "pratos", "opções", "qual o cardapio", "meu cardapio", "ver o menu",
+        "cardapio do dia", "cardapio completo", "mostrar cardapio", "quero ver o cardapio",
+        "manda o cardapio"
+    ], 70),
+]
+
+
+class _PedidoJaFinalizado(Exception):
+    """O carrinho já tinha virado pedido: levantada dentro da transação para abortá-la."""
+
+    def __init__(self, pedido):
+        super().__init__(pedido["_id"])
+        self.pedido = pedido
+
+
+def _suporta_transacoes(cliente):
+    # Transações só existem em replica set ou cluster shardado; num servidor avulso o
+    # checkout conta com o _id do carrinho como guarda de idempotência.
+    descricao = getattr(cliente, "topology_description", None)
+    return descricao is not None and descricao.topology_type_name in ("ReplicaSetWithPrimary", "Sharded")
+
+
+def _somar_item_na_lista(lista, item):
+    """Expressão de agregação: `lista` com a quantidade de `item` somada, ou com `item` no fim.
+
+    Valores do usuário entram com $literal, para um nome começado por "$" não virar caminho de campo.
+    """
+    return {"$let": {
+        "vars": {"lista": lista},
+        "in": {"$cond": [
+            {"$in": [{"$literal": item["nome"]}, "$$lista.nome"]},
+            {"$map": {
+                "input": "$$lista",
+                "as": "atual",
+                "in": {"$cond": [
+                    {"$eq": ["$$atual.nome", {"$literal": item["nome"]}]},
+                    {"$mergeObjects": ["$$atual", {
+                        "quantidade": {"$add": [{"$ifNull": ["$$atual.quantidade", 0]}, item["quantidade"]]}
+                    }]},
+                    "$$atual"
+                ]}
+            }},
+            {"$concatArrays": ["$$lista", [{"$literal": item}]]}
+        ]}
+    }}
+
 
 class ChatService:
 
@@ -15,31 +117,22 @@ class ChatService:
             "nove": 9, "dez": 10
         }
         self.quantidade_pattern = r"\b(\d+)\b|\b(" + "|".join(re.escape(k) for k in self.numero_para_digito.keys()) + r")\b"
-    
-    def _mensagem_similar(self, mensagem, padroes, limiar=70):
-        mensagem = mensagem.lower()
-        for padrao in padroes:
-            score_partial = fuzz.partial_ratio(mensagem, padrao.lower())
-            score_ratio = fuzz.ratio(mensagem, padrao.lower())
-            score_token_set = fuzz.token_set_ratio(mensagem, padrao.lower())
-            
-            if score_partial >= limiar or score_ratio >= limiar or score_token_set >= limiar:
-                return True
-        return False
+        self.indice_intencoes = IntentIndex(INTENCOES)
+        self._menu_matcher = (None, MenuMatcher([]))
 
-    def _contem_item_do_cardapio(self, mensagem, cardapio_data):
+    def _obter_menu_matcher(self, cardapio_data, versao_cardapio=None):
         if not isinstance(cardapio_data, list):
-            return False 
-        
-        nomes_produtos = [p['nome'].lower() for p in cardapio_data if 'nome' in p]
-        
-        for nome_produto in nomes_produtos:
-            
-            if fuzz.partial_ratio(mensagem, nome_produto) >= 80 or \
-               fuzz.token_sort_ratio(mensagem, nome_produto) >= 80 or \
-               fuzz.token_set_ratio(mensagem, nome_produto) >= 80:
-                return True
-        return False
+            return MenuMatcher([])
+
+        chave = versao_cardapio if versao_cardapio is not None else MenuMatcher.assinatura(cardapio_data)
+        chave_atual, matcher = self._menu_matcher
+        if chave_atual != chave:
+            matcher = MenuMatcher(cardapio_data)
+            self._menu_matcher = (chave, matcher)
+        return matcher
+
+    def _contem_item_do_cardapio(self, mensagem, menu_matcher):
+        return menu_matcher.contem_item(mensagem, limiar=80)
 
     def _responder_status_pedido_aberto(self, pedido_em_aberto_doc):
         if pedido_em_aberto_doc and pedido_em_aberto_doc.get("itens"):
@@ -48,70 +141,69 @@ class ChatService:
         else:
             return "Você ainda não iniciou um pedido."
 
-    def _intencao_ver_status_pedido_aberto(self, mensagem):
-        padroes = ["qual meu pedido atual", "meu pedido agora", "o que estou pedindo", "meu carrinho atual", "ver meu pedido em andamento"]
-        return self._mensagem_similar(mensagem, padroes, limiar=75)
-
     def processar_mensagem(self, usuario_id, mensagem, 
                              pedido_em_aberto_doc, 
                              todos_os_pedidos_finalizados, 
                              cardapio_data, 
                              pedidos_em_aberto_collection, 
-                             pedidos_collection):
+                             pedidos_collection,
+                             versao_cardapio=None):
 
         mensagem_processada = mensagem.lower().strip()
 
-        print(f"DEBUG Processar Mensagem: Mensagem: '{mensagem_processada}'")
-        print(f"DEBUG Processar Mensagem: Pedido em aberto DOC: {pedido_em_aberto_doc}")
-        print(f"DEBUG Processar Mensagem: Pedidos finalizados: {todos_os_pedidos_finalizados}")
+        logger.debug("Processar Mensagem: Mensagem: '%s'", mensagem_processada)
+        logger.debug("Processar Mensagem: Pedido em aberto DOC: %s", pedido_em_aberto_doc, extra={"amostra": AMOSTRA_LOGS})
+        logger.debug("Processar Mensagem: Pedidos finalizados: %s", todos_os_pedidos_finalizados, extra={"amostra": AMOSTRA_LOGS})
+
 
+        intencao = self.indice_intencoes.detectar(mensagem_processada)
+        chat_mensagens.inc(intencao=intencao or "nenhuma")
+        menu_matcher = self._obter_menu_matcher(cardapio_data, versao_cardapio)
 
-        if self._intencao_consultar_pedidos(mensagem_processada):
-            print("DEBUG: Intenção 'consultar pedidos finalizados' detectada.")
+        if intencao == "consultar_pedidos":
+            logger.debug("Intenção 'consultar pedidos finalizados' detectada.")
             return self._consultar_pedidos(usuario_id, todos_os_pedidos_finalizados)
 
-        if self._intencao_cancelar_pedido(mensagem_processada):
-            print("DEBUG: Intenção 'cancelar pedido' detectada.")
+        if intencao == "cancelar_pedido":
+            logger.debug("Intenção 'cancelar pedido' detectada.")
             return self._cancelar_pedido(usuario_id, pedido_em_aberto_doc, pedidos_em_aberto_collection)
         
-        if self._intencao_ver_status_pedido_aberto(mensagem_processada):
-            print("DEBUG: Intenção 'ver status pedido aberto' detectada.")
+        if intencao == "ver_status_pedido_aberto":
+            logger.debug("Intenção 'ver status pedido aberto' detectada.")
             return self._responder_status_pedido_aberto(pedido_em_aberto_doc)
 
-        if self._intencao_finalizar_pedido(mensagem_processada):
-            print("DEBUG: Intenção 'finalizar pedido' detectada.")
-            return self._finalizar_pedido(usuario_id, pedido_em_aberto_doc, pedidos_em_aberto_collection, pedidos_collection)
+        if intencao == "finalizar_pedido":
+            logger.debug("Intenção 'finalizar pedido' detectada.")
+            return self._finalizar_pedido(usuario_id, pedidos_em_aberto_collection, pedidos_collection)
 
-        if self._contem_item_do_cardapio(mensagem_processada, cardapio_data) or \
-           self._intencao_fazer_pedido(mensagem_processada):
-            print("DEBUG: Intenção 'fazer/registrar pedido' ou 'contem item cardápio' detectada.")
-            return self._registrar_pedido(usuario_id, mensagem_processada, pedido_em_aberto_doc, cardapio_data, pedidos_em_aberto_collection)
+        if intencao == "fazer_pedido" or \
+           self._contem_item_do_cardapio(mensagem_processada, menu_matcher):
+            logger.debug("Intenção 'fazer/registrar pedido' ou 'contem item cardápio' detectada.")
+            return self._registrar_pedido(usuario_id, mensagem_processada, menu_matcher, pedidos_em_aberto_collection)
 
-        if self._mensagem_similar(mensagem_processada, ["oi", "olá", "ola", "bom dia", "boa tarde", "boa noite", "e aí", "tudo bem", "oi tudo bem", "como vai", "tudo em ordem", "saudações", "eae", "fala"], limiar=75):
-            print("DEBUG: Intenção 'saudação' detectada.")
-            return "Olá! 👋 Como posso te ajudar hoje?"
+        if intencao == "saudacao":
+            logger.debug("Intenção 'saudação' detectada.")
+            return RESPOSTA_SAUDACAO
 
-        if self._mensagem_similar(mensagem_processada, ["obrigado", "valeu", "agradecido", "muito obrigado", "obrigada", "grato", "agradeço"], limiar=80):
-            print("DEBUG: Intenção 'agradecimento' detectada.")
-            return "De nada! 😊 Se precisar de algo, é só chamar."
+        if intencao == "agradecimento":
+            logger.debug("Intenção 'agradecimento' detectada.")
+            return RESPOSTA_AGRADECIMENTO
         
-        if self._intencao_ver_cardapio(mensagem_processada):
-            print("DEBUG: Intenção 'ver cardápio' detectada.")
+        if intencao == "ver_cardapio":
+            logger.debug("Intenção 'ver cardápio' detectada.")
             return self._responder_cardapio(cardapio_data)
         
-        print("DEBUG: Nenhuma intenção específica detectada. Usando fallback.")
-        return "Desculpe, não entendi sua mensagem. Você pode tentar reformular ou digitar 'cardápio' para ver o que temos disponível."
-
-    def _intencao_ver_cardapio(self, mensagem):
-        padroes = [
-            "cardapio", "cardápio", "menu", "catalogo", "lista de pratos", 
-            "o que tem", "o que vocês têm", "o que voces tem", "o que está disponível",
-            "o que posso pedir", "quero comer", "almoço", "jantar", "refeição", "lanche", 
-            "comida", "pratos", "opções", "qual o cardapio", "meu cardapio", "ver o menu",
-            "cardapio do dia", "cardapio completo", "mostrar cardapio", "quero ver o cardapio",
-            "manda o cardapio"
-        ]
-        return self._mensagem_similar(mensagem, padroes, limiar=70) 
+        logger.debug("Nenhuma intenção específica detectada. Usando fallback.")
+        return RESPOSTA_PADRAO
+
+    def responder_sem_llm(self, mensagem):
+        """Resposta por regras para conversa livre, usada quando o LLM não está disponível."""
+        intencao = self.indice_intencoes.detectar(mensagem.lower().strip())
+        if intencao == "saudacao":
+            return RESPOSTA_SAUDACAO
+        if intencao == "agradecimento":
+            return RESPOSTA_AGRADECIMENTO
+        return RESPOSTA_PADRAO
 
     def _responder_cardapio(self, cardapio_data):
         try:
@@ -139,102 +231,137 @@ class ChatService:
             return resposta.strip()
 
         except Exception as e:
-            print(f"Erro ao montar cardápio: {e}")
+            logger.exception("Erro ao montar cardápio: %s", e)
             return "Houve um problema ao acessar o cardápio. Tente novamente mais tarde. 😕"
 
-    def _intencao_fazer_pedido(self, mensagem):
-        padroes = [
-            "quero pedir", "fazer um pedido", "quero isso", "gostaria de", 
-            "me vê", "pode ser", "pedido", "quero", "pedir", "adicionar ao pedido",
-            "colocar no pedido", "escolher", "vou querer", "me traga", "quero fazer um pedido"
-        ]
-        return self._mensagem_similar(mensagem, padroes, limiar=70)
-
-    def _intencao_finalizar_pedido(self, mensagem):
-        padroes = [
-            "só isso", "so isso", "só", "so", "não", "nao", "mais nada", "encerrar",
-            "finalizar", "fechar pedido", "concluído", "concluido",
-            "pedido concluído", "pedido concluido", "concluir", "terminar",
-            "pode fechar", "está bom assim", "pronto", "acabou", "já está bom", "finalizar agora"
-        ]
-        return self._mensagem_similar(mensagem, padroes, limiar=75)
-            
-    def _finalizar_pedido(self, usuario_id, pedido_em_aberto_doc, pedidos_em_aberto_collection, pedidos_collection):
+    def _finalizar_pedido(self, usuario_id, pedidos_em_aberto_collection, pedidos_collection):
         try:
-            if not pedido_em_aberto_doc or not pedido_em_aberto_doc.get("itens"):
-                print(f"DEBUG Finalizar Pedido: Nenhum pedido em aberto ou sem itens para o usuario_id: {usuario_id}")
-                return "Você ainda não iniciou um pedido ou não há itens para finalizar."
+            cliente = pedidos_collection.database.client
+            if _suporta_transacoes(cliente):
+                try:
+                    with cliente.start_session() as sessao:
+                        pedido_final, gravado = sessao.with_transaction(lambda s: self._mover_carrinho_para_pedidos(
+                            usuario_id, pedidos_em_aberto_collection, pedidos_collection, s))
+                except _PedidoJaFinalizado as e:
+                    # A transação foi abortada e o carrinho voltou: é uma sobra de um checkout que
+                    # já gravou o pedido, então só o remove (fora da transação).
+                    pedidos_em_aberto_collection.delete_one({"_id": e.pedido["_id"]})
+                    pedido_final, gravado = e.pedido, False
+            else:
+                pedido_final, gravado = self._mover_carrinho_para_pedidos(usuario_id, pedidos_em_aberto_collection, pedidos_collection)
 
-            total_calculado_no_fechamento = 0
-            for item in pedido_em_aberto_doc.get("itens", []):
-                item_preco = float(item.get("preco", 0.00))
-                item_quantidade = int(item.get("quantidade", 1))
-                total_calculado_no_fechamento += (item_preco * item_quantidade)
-
-            nomes_dos_itens_para_resposta = [item['nome'] for item in pedido_em_aberto_doc['itens']]
-
-            pedido_final = {
-                "usuario_id": usuario_id,
-                "itens": pedido_em_aberto_doc["itens"],
-                "data": datetime.utcnow(), 
-                "status": "em preparo",
-                "total": total_calculado_no_fechamento
-            }
-            
-            pedidos_collection.insert_one(pedido_final)
-            print(f"DEBUG Finalizar Pedido: Pedido finalizado salvo na coleção 'pedidos': {pedido_final}")
-            
-            pedidos_em_aberto_collection.delete_one({"_id": pedido_em_aberto_doc["_id"]})
-            print(f"DEBUG Finalizar Pedido: Pedido em aberto deletado da coleção 'pedidos_em_aberto' para _id: {pedido_em_aberto_doc['_id']}")
+            if pedido_final is None:
+                logger.debug("Finalizar Pedido: Nenhum pedido em aberto ou sem itens para o usuario_id: %s", usuario_id)
+                return "Você ainda não iniciou um pedido ou não há itens para finalizar."
 
+            # Fora da transação: todo checkout soma nos mesmos documentos de resumo (o status
+            # "em preparo", o dia/item), e dentro dela checkouts simultâneos teriam WriteConflict
+            # e refariam o checkout inteiro. O pedido já está gravado: uma falha aqui só
+            # desatualiza os resumos, e python -m db.reconstruir_resumos corrige.
+            if gravado:
+                try:
+                    registrar_venda(pedidos_collection.database, pedido_final)
+                except Exception:
+                    logger.exception("Finalizar Pedido: resumos não atualizados para o pedido %s (python -m db.reconstruir_resumos corrige).", pedido_final["_id"])
+
+            # Publicado só depois do commit; as telas identificam o pedido pelo _id, então uma
+            # retentativa que republique o mesmo pedido não gera duplicata na tela.
+            publicar_mudanca("pedido_criado", resumo_do_pedido(pedido_final))
+
+            nomes_dos_itens_para_resposta = [item['nome'] for item in pedido_final['itens']]
             return f"✅ Pedido finalizado com os itens: {', '.join(nomes_dos_itens_para_resposta)}. Em breve entraremos em contato para confirmar."
 
         except Exception as e:
-            print(f"ERRO ao finalizar pedido: {e}")
+            logger.exception("Erro ao finalizar pedido: %s", e)
             return "❌ Ocorreu um erro ao finalizar seu pedido. Tente novamente."
+
+    def _mover_carrinho_para_pedidos(self, usuario_id, pedidos_em_aberto_collection, pedidos_collection, sessao=None):
+        """Retira o carrinho de pedidos_em_aberto e grava o pedido final: duas idas ao banco.
+
+        O carrinho é lido e removido no mesmo find_one_and_delete, então duas mensagens
+        de "finalizar" simultâneas não fecham o mesmo carrinho duas vezes. O pedido herda
+        o _id do carrinho: se o mesmo carrinho for gravado de novo (retentativa), o
+        DuplicateKeyError indica que ele já foi finalizado e nada é duplicado.
+        Retorna (pedido, gravado): gravado é False se o pedido já existia, e o pedido é
+        None se não havia carrinho com itens. Os resumos do painel ficam com quem chama.
+        """
+        carrinho = pedidos_em_aberto_collection.find_one_and_delete(
+            {"usuario_id": usuario_id, "itens.0": {"$exists": True}}, session=sessao
+        )
+        if carrinho is None:
+            return None, False
+
+        # Subtotais e total ficam gravados com os preços do fechamento; as leituras só os projetam.
+        itens, total = calcular_totais(carrinho["itens"])
+
+        pedido_final = {
+            "_id": carrinho["_id"],
+            "usuario_id": usuario_id,
+            "itens": itens,
+            "data": datetime.utcnow(), 
+            "status": "em preparo",
+            "total": total
+        }
+
+        try:
+            pedidos_collection.insert_one(pedido_final, session=sessao)
+            logger.debug("Finalizar Pedido: Pedido %s finalizado para usuario_id: %s", pedido_final["_id"], usuario_id)
+        except DuplicateKeyError:
+            logger.info("Finalizar Pedido: carrinho %s já tinha sido finalizado; nada a gravar.", carrinho["_id"])
+            if sessao is not None:
+                # O servidor já abortou a transação: retornar daqui faria o commit falhar.
+                raise _PedidoJaFinalizado(pedido_final)
+            return pedido_final, False
+        except Exception:
+            if sessao is None:
+                # Sem transação o carrinho já saiu de pedidos_em_aberto: devolve-o para o usuário tentar de novo.
+                try:
+                    pedidos_em_aberto_collection.insert_one(carrinho)
+                except Exception:
+                    logger.exception("Finalizar Pedido: não foi possível devolver o carrinho %s: %s", carrinho["_id"], carrinho)
+            raise
+        return pedido_final, True
         
-    def _intencao_cancelar_pedido(self, mensagem):
-        padroes = [
-            "cancelar pedido", "quero cancelar", "anular pedido", "desistir do pedido",
-            "cancelar meu pedido", "não quero mais", "apagar pedido", "remover pedido"
-        ]
-        return self._mensagem_similar(mensagem, padroes, limiar=75)
-    
     def _cancelar_pedido(self, usuario_id, pedido_em_aberto_doc, pedidos_em_aberto_collection):
         try:
             if not pedido_em_aberto_doc:
-                print(f"DEBUG Cancelar Pedido: Nenhum pedido em aberto para o usuario_id: {usuario_id}.")
+                logger.debug("Cancelar Pedido: Nenhum pedido em aberto para o usuario_id: %s.", usuario_id)
                 return "Você não tem nenhum pedido em andamento para ser cancelado."
             
             resultado = pedidos_em_aberto_collection.delete_one({"_id": pedido_em_aberto_doc["_id"]})
 
             if resultado.deleted_count > 0:
-                print(f"DEBUG Cancelar Pedido: Pedido em aberto para o usuario_id: {usuario_id} (ID: {pedido_em_aberto_doc['_id']}) cancelado com sucesso.")
+                logger.debug("Cancelar Pedido: Pedido em aberto para o usuario_id: %s (ID: %s) cancelado com sucesso.", usuario_id, pedido_em_aberto_doc['_id'])
                 return "✅ Seu pedido em andamento foi cancelado com sucesso."
             else:
-                print(f"DEBUG Cancelar Pedido: Falha ao cancelar pedido (não encontrado após verificação) para o usuario_id: {usuario_id}.")
+                logger.debug("Cancelar Pedido: Falha ao cancelar pedido (não encontrado após verificação) para o usuario_id: %s.", usuario_id)
                 return "Não foi possível cancelar o pedido. Parece que ele já foi finalizado ou não existe mais."
 
         except Exception as e:
-            print(f"ERRO ao cancelar pedido: {e}")
+            logger.exception("Erro ao cancelar pedido: %s", e)
             return "❌ Ocorreu um erro ao tentar cancelar seu pedido. Tente novamente mais tarde."
         
-    def _extrair_quantidade_e_item(self, mensagem, cardapio_map_por_nome):
-        original_mensagem = mensagem.lower().strip()
+    def _extrair_quantidade_e_item(self, mensagem, menu_matcher):
+        original_mensagem = normalizar(mensagem)
         temp_mensagem = original_mensagem
         itens_detectados_com_quantidade = []
 
-        print(f"DEBUG: _extrair_quantidade_e_item - Mensagem original: '{original_mensagem}'")
+        logger.debug("_extrair_quantidade_e_item - Mensagem original: '%s'", original_mensagem, extra={"amostra": AMOSTRA_LOGS})
 
-        sorted_cardapio_names = sorted(cardapio_map_por_nome.keys(), key=len, reverse=True)
+        # Só os candidatos do índice são avaliados, já na ordem do maior nome para o menor.
+        comparacoes = 0
+        for posicao in menu_matcher.candidatos(original_mensagem):
+            nome_produto_cardapio = menu_matcher.nomes[posicao]
+            item_cardapio_data = menu_matcher.itens[posicao]
 
-        for nome_produto_cardapio in sorted_cardapio_names:
-            item_cardapio_data = cardapio_map_por_nome[nome_produto_cardapio]
+            encontrado = nome_produto_cardapio in temp_mensagem
+            if not encontrado:
+                comparacoes += 1
+                encontrado = fuzz.token_set_ratio(temp_mensagem, nome_produto_cardapio) >= 75
 
-            if nome_produto_cardapio in temp_mensagem or \
-               fuzz.token_set_ratio(temp_mensagem, nome_produto_cardapio) >= 75:
+            if encontrado:
 
-                print(f"DEBUG: Item '{nome_produto_cardapio}' (do cardápio) detectado potencialmente em '{temp_mensagem}'.")
+                logger.debug("Item '%s' (do cardápio) detectado potencialmente em '%s'.", nome_produto_cardapio, temp_mensagem, extra={"amostra": AMOSTRA_LOGS})
 
                 quantidade = 1 
 
@@ -244,7 +371,7 @@ class ChatService:
                 end_index = min(len(temp_mensagem), item_pos + len(nome_produto_cardapio) + 20)
                 search_window = temp_mensagem[start_index:end_index]
 
-                print(f"DEBUG: Janela de busca para quantidade: '{search_window}'")
+                logger.debug("Janela de busca para quantidade: '%s'", search_window, extra={"amostra": AMOSTRA_LOGS})
 
                 qtd_match = re.search(self.quantidade_pattern, search_window)
 
@@ -252,13 +379,13 @@ class ChatService:
                     if qtd_match.group(1): 
                         try:
                             quantidade = int(qtd_match.group(1))
-                            print(f"DEBUG: Quantidade (dígito) detectada: {quantidade}")
+                            logger.debug("Quantidade (dígito) detectada: %s", quantidade, extra={"amostra": AMOSTRA_LOGS})
                         except ValueError:
                             pass
                     elif qtd_match.group(2): 
                         quantidade_str = qtd_match.group(2)
                         quantidade = self.numero_para_digito.get(quantidade_str, 1)
-                        print(f"DEBUG: Quantidade (palavra) detectada: {quantidade_str} -> {quantidade}")
+                        logger.debug("Quantidade (palavra) detectada: %s -> %s", quantidade_str, quantidade, extra={"amostra": AMOSTRA_LOGS})
 
                 itens_detectados_com_quantidade.append({
                     "nome_cardapio": item_cardapio_data['nome'],
@@ -267,26 +394,25 @@ class ChatService:
                 })
 
                 temp_mensagem = temp_mensagem.replace(nome_produto_cardapio, "", 1).strip()
-                print(f"DEBUG: Mensagem após remover item '{nome_produto_cardapio}': '{temp_mensagem}'")
+                logger.debug("Mensagem após remover item '%s': '%s'", nome_produto_cardapio, temp_mensagem, extra={"amostra": AMOSTRA_LOGS})
 
                 if qtd_match:
                     matched_qty_string = qtd_match.group(0) 
                     temp_mensagem = temp_mensagem.replace(matched_qty_string, "", 1).strip()
-                    print(f"DEBUG: Mensagem após remover quantidade '{matched_qty_string}': '{temp_mensagem}'")
+                    logger.debug("Mensagem após remover quantidade '%s': '%s'", matched_qty_string, temp_mensagem, extra={"amostra": AMOSTRA_LOGS})
 
+        chat_comparacoes_fuzzy.inc(comparacoes, etapa="itens_do_pedido")
         return itens_detectados_com_quantidade
 
-    def _registrar_pedido(self, usuario_id, mensagem, pedido_em_aberto_doc, cardapio_data, pedidos_em_aberto_collection):
+    def _registrar_pedido(self, usuario_id, mensagem, menu_matcher, pedidos_em_aberto_collection):
         try:
             itens_para_adicionar_ao_banco = []
             resposta_itens_adicionados_ao_usuario = []
 
-            cardapio_map_por_nome = {item['nome'].lower(): item for item in cardapio_data if 'nome' in item}
-
-            itens_encontrados = self._extrair_quantidade_e_item(mensagem, cardapio_map_por_nome)
+            itens_encontrados = self._extrair_quantidade_e_item(mensagem, menu_matcher)
 
             if not itens_encontrados:
-                print(f"DEBUG Registrar Pedido: Nenhum item do cardápio detectado na mensagem: '{mensagem}'")
+                logger.debug("Registrar Pedido: Nenhum item do cardápio detectado na mensagem: '%s'", mensagem)
                 return ("Não consegui identificar os itens do seu pedido. "
                         "Por favor, diga exatamente o que deseja pedir, "
                         "por exemplo: 'quero um sanduíche natural e um suco'.")
@@ -304,50 +430,55 @@ class ChatService:
                 itens_para_adicionar_ao_banco.append(item_formatado)
                 resposta_itens_adicionados_ao_usuario.append(f"{quantidade}x {item_cardapio['nome']}")
 
+            self._adicionar_ao_carrinho(usuario_id, itens_para_adicionar_ao_banco, pedidos_em_aberto_collection)
+            logger.debug("Registrar Pedido: Itens adicionados ao pedido em aberto de usuario_id: %s, itens: %s", usuario_id, itens_para_adicionar_ao_banco)
 
-            if pedido_em_aberto_doc:
-                itens_existentes = pedido_em_aberto_doc.get("itens", [])
-                itens_existentes_map = {item['nome'].lower(): item for item in itens_existentes}
-
-                for novo_item_obj in itens_para_adicionar_ao_banco:
-                    if novo_item_obj['nome'].lower() in itens_existentes_map:
-
-                        itens_existentes_map[novo_item_obj['nome'].lower()]['quantidade'] += novo_item_obj['quantidade']
-                    else:
-
-                        itens_existentes.append(novo_item_obj)
-                
-                pedidos_em_aberto_collection.update_one(
-                    {"_id": pedido_em_aberto_doc["_id"]},
-                    {"$set": {"itens": itens_existentes, "data_atualizacao": datetime.utcnow()}}
-                )
-                print(f"DEBUG Registrar Pedido: Pedido em aberto atualizado para usuario_id: {usuario_id}, itens: {itens_existentes}")
-            else:
-                pedidos_em_aberto_collection.insert_one(
-                    {"usuario_id": usuario_id, "itens": itens_para_adicionar_ao_banco, "data_inicio": datetime.utcnow()}
-                )
-                print(f"DEBUG Registrar Pedido: Novo pedido em aberto criado para usuario_id: {usuario_id}, itens: {itens_para_adicionar_ao_banco}")
-            
             return f"✅ Adicionei ao seu pedido: {', '.join(resposta_itens_adicionados_ao_usuario)}. Deseja pedir mais alguma coisa?"
 
         except Exception as e:
-            print(f"ERRO ao registrar pedido: {str(e)}")
+            logger.exception("Erro ao registrar pedido: %s", e)
             return "❌ Ocorreu um erro ao processar seu pedido. Tente novamente."
-                
-    def _intencao_consultar_pedidos(self, mensagem):
-        padroes = [
-            "meus pedidos", "meu histórico de pedidos", "pedidos anteriores",
-            "o que eu já pedi", "histórico de pedidos", "consultar pedidos",
-            "ver meus pedidos", "lista de pedidos", "qual meu histórico de pedidos", "pedidos feitos"
-        ]
-        return self._mensagem_similar(mensagem, padroes, limiar=75)
+
+    def _adicionar_ao_carrinho(self, usuario_id, itens, pedidos_em_aberto_collection):
+        """Soma os itens ao pedido em aberto do usuário numa única atualização atômica no servidor.
+
+        Sem leitura prévia nem ida ao banco por item: um update com pipeline, com upsert,
+        recalcula a lista do carrinho dentro do Mongo (item já presente tem a quantidade
+        somada, item novo vai para o fim) e cria o carrinho se ele não existir. Uma
+        mensagem com N itens custa uma ida ao banco. Se outra requisição criar o carrinho
+        no meio do caminho, o upsert esbarra no índice único de usuario_id e é repetido,
+        já como atualização, sem perder quantidades.
+        """
+        if not itens:
+            return
+        agora = datetime.utcnow()
+        lista = {"$ifNull": ["$itens", []]}
+        for item in itens:
+            lista = _somar_item_na_lista(lista, item)
+
+        for tentativa in range(TENTATIVAS_CARRINHO):
+            try:
+                pedidos_em_aberto_collection.update_one(
+                    {"usuario_id": usuario_id},
+                    [{"$set": {
+                        "itens": lista,
+                        "data_atualizacao": agora,
+                        "data_inicio": {"$ifNull": ["$data_inicio", agora]}
+                    }}],
+                    upsert=True
+                )
+                return
+            except DuplicateKeyError:
+                if tentativa == TENTATIVAS_CARRINHO - 1:
+                    raise
+                logger.debug("Carrinho de %s criado em paralelo; repetindo a atualização.", usuario_id)
 
     def _consultar_pedidos(self, usuario_id, pedidos_list):
         try:
             usuario_pedidos = pedidos_list
 
             if not usuario_pedidos:
-                print(f"DEBUG Consultar Pedidos: Nenhum pedido finalizado encontrado para usuario_id: {usuario_id}")
+                logger.debug("Consultar Pedidos: Nenhum pedido finalizado encontrado para usuario_id: %s", usuario_id)
                 return "Você ainda não fez nenhum pedido."
 
             resposta = "Seu histórico de pedidos:\n\n"
@@ -371,21 +502,21 @@ class ChatService:
                         elif isinstance(item, str):
                             itens_para_exibir.append(item)
                         else:
-                            print(f"AVISO: Item de pedido mal formatado no histórico: {item}")
+                            logger.warning("Item de pedido mal formatado no histórico: %s", item)
                             itens_para_exibir.append("Item Desconhecido")
                 else:
-                    print(f"AVISO: Campo 'itens' do pedido não é uma lista: {pedido.get('itens')}")
+                    logger.warning("Campo 'itens' do pedido não é uma lista: %s", pedido.get('itens'))
                     itens_para_exibir.append("Itens indisponíveis")
 
                 itens_str = ", ".join(itens_para_exibir)
                 
                 status_str = pedido.get('status', 'desconhecido')
                 resposta += f"📅 {data_formatada}: {itens_str} (Status: {status_str})\n"
-            print(f"DEBUG Consultar Pedidos: Retornando histórico para usuario_id: {usuario_id}")
+            logger.debug("Consultar Pedidos: Retornando histórico para usuario_id: %s", usuario_id)
             return resposta.strip()
 
         except Exception as e:
-            print(f"ERRO ao consultar pedidos: {e}")
+            logger.exception("Erro ao consultar pedidos: %s", e)
             return "Ocorreu um erro ao consultar seu histórico de pedidos. Tente novamente mais tarde."
 
 chat_service = ChatService()
\ No newline at end of file
@@ -0,0 +1,201 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+class Evento:
+    __slots__ = ("id", "tipo", "dados", "sequencia")
+
+    def __init__(self, id, tipo, dados, sequencia=0):
+        self.id = id
+        self.tipo = tipo
+        self.dados = dados
+        self.sequencia = sequencia
+
+    def formatar(self):
+        """O evento no formato de texto do Server-Sent Events."""
+        return f"id: {self.id}\nevent: {self.tipo}\ndata: {self.dados}\n\n"
+
+
+class EventBus:
+    """Pub/sub em memória para as telas da cozinha e do administrador.
+
+    Cada evento publicado recebe um id "<início do processo>-<sequência>" e fica num
+    buffer circular com os últimos `tamanho_buffer` eventos. Um cliente que reconecta
+    com Last-Event-ID recebe só o que perdeu; se o id for de outro processo (reinício)
+    ou já tiver saído do buffer, recebe um evento "reset" e deve recarregar a lista.
+
+    Os dados são serializados uma única vez, na publicação, e compartilhados por todos
+    os assinantes.
+    """
+
+    def __init__(self, tamanho_buffer=1000):
+        self._tamanho_buffer = tamanho_buffer
+        self._reiniciar()
+
+    def _reiniciar(self):
+        # O pid entra no id: com vários workers, um Last-Event-ID de outro processo gera reset.
+        self._inicio = f"{int(time.time())}.{os.getpid()}"
+        self._sequencia = 0
+        self._buffer = deque(maxlen=self._tamanho_buffer)
+        self._condicao = threading.Condition()
+        self.assinantes = 0
+
+    def apos_fork(self):
+        """No processo filho: começa vazio, com lock novo e ids próprios deste processo."""
+        self._reiniciar()
+
+    def publicar(self, tipo, dados):
+        texto = json.dumps(dados, default=str, separators=(",", ":"))
+        with self._condicao:
+            self._sequencia += 1
+            evento = Evento(f"{self._inicio}-{self._sequencia}", tipo, texto, self._sequencia)
+            self._buffer.append(evento)
+            self._condicao.notify_all()
+        return evento
+
+    def _sequencia_do_id(self, ultimo_id):
+        # None: o cliente não tem como continuar de onde parou e precisa de um reset.
+        inicio, _, sequencia = (ultimo_id or "").partition("-")
+        if inicio != self._inicio or not sequencia.isdigit():
+            return None
+        sequencia = int(sequencia)
+        return sequencia if sequencia <= self._sequencia else None
+
+    def _pendentes(self, a_partir_de):
+        # Chamado com a condição adquirida; o buffer está em ordem de sequência.
+        if not self._buffer or self._sequencia <= a_partir_de:
+            return []
+        primeira = self._sequencia - len(self._buffer) + 1
+        return list(self._buffer)[max(0, a_partir_de + 1 - primeira):]
+
+    def assinar(self, ultimo_id=None, espera=15.0):
+        """Gera os eventos posteriores a `ultimo_id`, e depois os novos à medida que chegam.
+
+        Sem evento novo em `espera` segundos gera None, para a rota mandar um keepalive.
+        """
+        with self._condicao:
+            self.assinantes += 1
+            visto = self._sequencia
+            precisa_reset = False
+            if ultimo_id:
+                anterior = self._sequencia_do_id(ultimo_id)
+                primeira = self._sequencia - len(self._buffer) + 1
+                if anterior is None or anterior + 1 < primeira:
+                    precisa_reset = True
+                else:
+                    visto = anterior
+            id_reset = self.ultimo_id()
+
+        try:
+            if precisa_reset:
+                yield Evento(id_reset, "reset", "{}")
+
+            while True:
+                with self._condicao:
+                    eventos = self._pendentes(visto)
+                    if not eventos:
+                        self._condicao.wait(espera)
+                        eventos = self._pendentes(visto)
+                if not eventos:
+                    yield None
+                    continue
+                if eventos[0].sequencia > visto + 1:
+                    # O cliente ficou tão para trás que o buffer já descartou eventos dele.
+                    yield Evento(eventos[-1].id, "reset", "{}")
+                else:
+                    for evento in eventos:
+                        yield evento
+                visto = eventos[-1].sequencia
+        finally:
+            with self._condicao:
+                self.assinantes -= 1
+
+    def ultimo_id(self):
+        return f"{self._inicio}-{self._sequencia}"
+
+
+def resumo_do_pedido(pedido):
+    """Campos que as telas precisam para desenhar um pedido novo."""
+    return {
+        "_id": str(pedido["_id"]),
+        "usuario_id": pedido.get("usuario_id"),
+        "itens": [
+            {"nome": item.get("nome"), "quantidade": item.get("quantidade", 1)}
+            for item in pedido.get("itens", []) if isinstance(item, dict)
+        ],
+        "total": pedido.get("total"),
+        "status": pedido.get("status"),
+        "data": pedido["data"].isoformat() + "Z" if pedido.get("data") else None,
+    }
+
+
+class EventosDoBanco:
+    """Alimenta o barramento a partir de um change stream de `pedidos`.
+
+    Útil com vários processos: cada um recebe todas as mudanças pelo Mongo, e não só
+    as que ele mesmo fez. Exige replica set. Em caso de erro reconecta a partir do
+    último resume token.
+    """
+
+    def __init__(self, colecao, barramento, espera_reconexao=2.0):
+        self._colecao = colecao
+        self._barramento = barramento
+        self._espera_reconexao = espera_reconexao
+        self._resume_token = None
+        self._thread = None
+        self._parar = threading.Event()
+
+    def iniciar(self):
+        self._thread = threading.Thread(target=self._executar, name="eventos-change-stream", daemon=True)
+        self._thread.start()
+
+    def parar(self):
+        self._parar.set()
+
+    def _executar(self):
+        pipeline = [{"$match": {"operationType": {"$in": ["insert", "update", "replace", "delete"]}}}]
+        while not self._parar.is_set():
+            try:
+                with self._colecao.watch(pipeline, full_document="updateLookup",
+                                         resume_after=self._resume_token, max_await_time_ms=1000) as stream:
+                    while not self._parar.is_set():
+                        mudanca = stream.try_next()
+                        if mudanca is None:
+                            continue
+                        self._resume_token = stream.resume_token
+                        self._publicar(mudanca)
+            except Exception as e:
+                logger.warning("Change stream de pedidos interrompido (%s); reconectando.", e)
+                self._parar.wait(self._espera_reconexao)
+
+    def _publicar(self, mudanca):
+        operacao = mudanca["operationType"]
+        pedido_id = str(mudanca["documentKey"]["_id"])
+        if operacao == "insert":
+            self._barramento.publicar("pedido_criado", resumo_do_pedido(mudanca["fullDocument"]))
+        elif operacao == "delete":
+            self._barramento.publicar("pedido_removido", {"_id": pedido_id})
+        else:
+            campos = mudanca.get("updateDescription", {}).get("updatedFields", {})
+            if operacao == "replace" or "status" in campos:
+                status = (mudanca.get("fullDocument") or {}).get("status", campos.get("status"))
+                self._barramento.publicar("status_alterado", {"_id": pedido_id, "status": status})
+
+
+# "local": checkout e rotas de administração publicam direto no barramento deste processo.
+# "change_stream": só o EventosDoBanco publica (use com vários processos; exige replica set).
+EVENTOS_FONTE = os.getenv("EVENTOS_FONTE", "local")
+
+barramento = EventBus(tamanho_buffer=int(os.getenv("EVENTOS_BUFFER", 1000)))
+
+
+def publicar_mudanca(tipo, dados):
+    """Publica uma mudança feita por este processo, a menos que o change stream já cuide disso."""
+    if EVENTOS_FONTE == "local":
+        barramento.publicar(tipo, dados)
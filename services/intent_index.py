@@ -0,0 +1,82 @@
+from rapidfuzz import fuzz, process
+from thefuzz import utils
+
+from services.metricas import chat_comparacoes_fuzzy
+
+
+class IntentIndex:
+    """Índice de intenções montado uma única vez a partir dos padrões de cada intenção.
+
+    Os padrões de todas as intenções ficam numa lista única, em minúsculas e já
+    pré-processados para o token_set_ratio, agrupados na ordem de prioridade.
+    Cada scorer compara a mensagem com a lista inteira numa só chamada em lote
+    do rapidfuzz (o motor por trás do thefuzz), em vez de um padrão por vez.
+    """
+
+    # Scorers usados pelo antigo _mensagem_similar, do mais barato ao mais caro.
+    # O segundo elemento indica se o scorer recebe as strings pré-processadas.
+    SCORERS = ((fuzz.ratio, False), (fuzz.token_set_ratio, True), (fuzz.partial_ratio, False))
+
+    def __init__(self, intencoes):
+        self._nomes = []
+        self._padroes = []
+        self._padroes_processados = []
+        self._posicao_do_padrao = []
+        self._limiar_do_padrao = []
+        self._fim_da_intencao = []
+
+        for posicao, (nome, padroes, limiar) in enumerate(intencoes):
+            self._nomes.append(nome)
+            for padrao in dict.fromkeys(padrao.lower() for padrao in padroes):
+                self._padroes.append(padrao)
+                self._padroes_processados.append(utils.full_process(padrao, force_ascii=True))
+                self._posicao_do_padrao.append(posicao)
+                self._limiar_do_padrao.append(limiar)
+            self._fim_da_intencao.append(len(self._padroes))
+
+        # O thefuzz arredonda os scores, então 69.5 já conta como 70.
+        self._corte = min(self._limiar_do_padrao, default=0) - 0.5
+
+    @property
+    def nomes(self):
+        return list(self._nomes)
+
+    def _pontuar(self, scorer, consulta, escolhas, melhores):
+        for _, score, indice in process.extract(consulta, escolhas, scorer=scorer,
+                                                limit=None, score_cutoff=self._corte):
+            score = int(round(score))
+            if score >= self._limiar_do_padrao[indice]:
+                posicao = self._posicao_do_padrao[indice]
+                if score > melhores.get(posicao, -1):
+                    melhores[posicao] = score
+
+    def classificar(self, mensagem, limite=None):
+        """Retorna [(intencao, score), ...] das intenções detectadas, em ordem de prioridade.
+
+        Com `limite=1` só interessa a intenção mais prioritária, então depois de cada
+        scorer a busca se restringe aos padrões das intenções que vêm antes dela.
+        """
+        mensagem = mensagem.lower()
+        consultas = (mensagem, utils.full_process(mensagem, force_ascii=True))
+
+        melhores = {}
+        fim = len(self._padroes)
+        comparacoes = 0
+        for scorer, processado in self.SCORERS:
+            if fim == 0:
+                break
+            escolhas = self._padroes_processados if processado else self._padroes
+            self._pontuar(scorer, consultas[processado], escolhas[:fim], melhores)
+            comparacoes += fim
+            if limite == 1 and melhores:
+                primeira = min(melhores)
+                fim = self._fim_da_intencao[primeira - 1] if primeira > 0 else 0
+        chat_comparacoes_fuzzy.inc(comparacoes, etapa="intencoes")
+
+        detectadas = [(self._nomes[posicao], melhores[posicao]) for posicao in sorted(melhores)]
+        return detectadas[:limite] if limite else detectadas
+
+    def detectar(self, mensagem):
+        """Retorna a intenção de maior prioridade presente na mensagem, ou None."""
+        detectadas = self.classificar(mensagem, limite=1)
+        return detectadas[0][0] if detectadas else None
@@ -0,0 +1,78 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import jsonify
+
+from services.metricas import limite_rejeicoes
+
+
+class LimitadorDeTaxa:
+    """Token bucket por chave (usuário, e-mail, IP), em memória.
+
+    Cada chave tem um balde com até `rajada` fichas que se repõe a `por_segundo`
+    fichas por segundo; cada requisição gasta uma. Os baldes ficam num LRU de no
+    máximo `max_chaves`: ao passar disso o balde usado há mais tempo é descartado,
+    e a chave volta com o balde cheio se aparecer de novo. Assim a memória não cresce
+    com o número de usuários ou IPs vistos.
+
+    Os limites valem por processo: com N workers, cada chave pode chegar a N vezes a taxa.
+    `por_segundo` = 0 desliga o limitador: toda requisição passa.
+    """
+
+    def __init__(self, nome, rajada, por_segundo, max_chaves=10000):
+        if por_segundo < 0:
+            raise ValueError(f"Taxa do limite '{nome}' não pode ser negativa: {por_segundo}")
+        self.nome = nome
+        self.rajada = rajada
+        self.por_segundo = por_segundo
+        self.max_chaves = max_chaves
+        self._baldes = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._baldes)
+
+    def consumir(self, chave):
+        """0 se a requisição pode seguir; senão, segundos até haver uma ficha."""
+        if not self.por_segundo:
+            return 0.0
+        agora = time.monotonic()
+        with self._lock:
+            balde = self._baldes.get(chave)
+            if balde is None:
+                fichas = self.rajada
+                if len(self._baldes) >= self.max_chaves:
+                    self._baldes.popitem(last=False)
+            else:
+                fichas = min(self.rajada, balde[0] + (agora - balde[1]) * self.por_segundo)
+                self._baldes.move_to_end(chave)
+
+            if fichas >= 1:
+                self._baldes[chave] = (fichas - 1, agora)
+                return 0.0
+            self._baldes[chave] = (fichas, agora)
+            return (1 - fichas) / self.por_segundo
+
+
+def limitar(limitador, chave_da_requisicao):
+    """Responde 429 com Retry-After quando o balde da chave da requisição está vazio.
+
+    `chave_da_requisicao()` é chamada dentro da requisição; se retornar None a
+    requisição não é limitada por este limitador (ex.: corpo sem e-mail, que a rota rejeita).
+    """
+    def decorador(rota):
+        @wraps(rota)
+        def verificar(*args, **kwargs):
+            chave = chave_da_requisicao()
+            if chave is not None:
+                espera = limitador.consumir(chave)
+                if espera > 0:
+                    limite_rejeicoes.inc(limite=limitador.nome)
+                    return (jsonify({"erro": "Muitas requisições, tente novamente em instantes"}), 429,
+                            {"Retry-After": str(max(1, math.ceil(espera)))})
+            return rota(*args, **kwargs)
+        return verificar
+    return decorador
@@ -0,0 +1,259 @@
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from contextlib import contextmanager
+
+from services.menu_matcher import normalizar
+from services.metricas import llm_cache, llm_chamadas, llm_latencia
+
+logger = logging.getLogger(__name__)
+
+# Mesmo formato do que o ChatOpenAI devolve: o chat só lê `.content`.
+RespostaLLM = namedtuple("RespostaLLM", ["content"])
+
+
+def estimar_tokens(texto):
+    """Estimativa barata de tokens (~4 caracteres por token em português), sem tokenizer."""
+    return len(texto or "") // 4 + 1
+
+
+def cortar_historico(historico, orcamento_tokens):
+    """Mantém as mensagens mais recentes do histórico que cabem em `orcamento_tokens`.
+
+    `historico` vem em ordem cronológica; o corte é feito pelo começo, sempre em
+    mensagens inteiras, e a ordem cronológica é preservada.
+    """
+    mantidas = []
+    usados = 0
+    for msg in reversed(historico):
+        custo = estimar_tokens(msg.get("mensagem"))
+        if usados + custo > orcamento_tokens:
+            break
+        mantidas.append(msg)
+        usados += custo
+    return mantidas[::-1]
+
+
+def chave_da_resposta(mensagem, contexto, versao_cardapio):
+    """Chave do cache: mensagem normalizada + hash do contexto enviado + versão do cardápio."""
+    contexto_hash = hashlib.sha1(
+        json.dumps([(msg.get("origem"), msg.get("mensagem")) for msg in contexto], ensure_ascii=False).encode("utf-8")
+    ).hexdigest()
+    return (" ".join(normalizar(mensagem).split()), contexto_hash, versao_cardapio)
+
+
+class RespostaCache:
+    """Cache de respostas do LLM com validade (`ttl` em segundos) e descarte LRU.
+
+    Guarda no máximo `capacidade` respostas; ao passar disso descarta a usada há
+    mais tempo. Com `capacidade` 0 o cache fica desligado.
+    """
+
+    def __init__(self, capacidade=1000, ttl=3600):
+        self._capacidade = capacidade
+        self._ttl = ttl
+        self._itens = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._itens)
+
+    def obter(self, chave):
+        with self._lock:
+            entrada = self._itens.get(chave)
+            if entrada is not None and entrada[1] <= time.monotonic():
+                del self._itens[chave]
+                entrada = None
+            if entrada is None:
+                llm_cache.inc(resultado="falta")
+                return None
+            self._itens.move_to_end(chave)
+        llm_cache.inc(resultado="acerto")
+        return entrada[0]
+
+    def guardar(self, chave, resposta):
+        if self._capacidade <= 0:
+            return
+        with self._lock:
+            self._itens[chave] = (resposta, time.monotonic() + self._ttl)
+            self._itens.move_to_end(chave)
+            while len(self._itens) > self._capacidade:
+                self._itens.popitem(last=False)
+
+    def limpar(self):
+        with self._lock:
+            self._itens.clear()
+
+
+class LLMIndisponivel(Exception):
+    """O LLM não pode responder agora: circuito aberto, limite de chamadas, tempo esgotado ou erro."""
+
+
+class CircuitBreaker:
+    """Para de chamar o LLM depois de `falhas_para_abrir` falhas seguidas.
+
+    Aberto, recusa as chamadas por `espera` segundos; depois deixa passar uma única
+    chamada de teste (meio aberto). Se ela der certo o circuito fecha, senão reabre.
+    """
+
+    FECHADO, ABERTO, MEIO_ABERTO = "fechado", "aberto", "meio_aberto"
+
+    def __init__(self, falhas_para_abrir=5, espera=30.0):
+        self._falhas_para_abrir = falhas_para_abrir
+        self._espera = espera
+        self._lock = threading.Lock()
+        self._estado = self.FECHADO
+        self._falhas = 0
+        self._aberto_ate = 0.0
+        self._testando = False
+
+    @property
+    def estado(self):
+        with self._lock:
+            if self._estado == self.ABERTO and time.monotonic() >= self._aberto_ate:
+                return self.MEIO_ABERTO
+            return self._estado
+
+    def permitir(self):
+        with self._lock:
+            if self._estado == self.ABERTO:
+                if time.monotonic() < self._aberto_ate:
+                    return False
+                self._estado = self.MEIO_ABERTO
+            if self._estado == self.MEIO_ABERTO:
+                if self._testando:
+                    return False
+                self._testando = True
+            return True
+
+    def sucesso(self):
+        with self._lock:
+            self._estado = self.FECHADO
+            self._falhas = 0
+            self._testando = False
+
+    def falha(self):
+        with self._lock:
+            self._falhas += 1
+            self._testando = False
+            if self._estado == self.MEIO_ABERTO or self._falhas >= self._falhas_para_abrir:
+                if self._estado != self.ABERTO:
+                    logger.warning("Circuito do LLM aberto por %.0fs após %d falha(s).", self._espera, self._falhas)
+                self._estado = self.ABERTO
+                self._aberto_ate = time.monotonic() + self._espera
+
+    def desistir(self):
+        """A chamada terminou sem resultado (cliente desconectou): libera a vaga de teste."""
+        with self._lock:
+            self._testando = False
+
+
+class LLMProtegido:
+    """Envolve o LLM com limite de chamadas simultâneas, prazo por chamada e circuit breaker.
+
+    Qualquer recusa ou falha vira LLMIndisponivel, para quem chama usar a resposta
+    por regras. `timeout` é o prazo total da chamada; o cliente HTTP do LLM deve ser
+    criado com o mesmo timeout para não ficar preso numa leitura.
+    """
+
+    def __init__(self, llm, max_simultaneas=4, timeout=20.0, espera_vaga=0.5, breaker=None):
+        self.llm = llm
+        self.timeout = timeout
+        self.breaker = breaker or CircuitBreaker()
+        self._vagas = threading.BoundedSemaphore(max_simultaneas)
+        self._espera_vaga = espera_vaga
+
+    @contextmanager
+    def _reservar(self):
+        if not self._vagas.acquire(timeout=self._espera_vaga):
+            llm_chamadas.inc(resultado="limite_simultaneas")
+            raise LLMIndisponivel("limite de chamadas simultâneas ao LLM")
+        try:
+            if not self.breaker.permitir():
+                llm_chamadas.inc(resultado="circuito_aberto")
+                raise LLMIndisponivel("circuito do LLM aberto")
+            yield time.monotonic() + self.timeout
+        finally:
+            self._vagas.release()
+
+    def _falhou(self, resultado, erro):
+        self.breaker.falha()
+        llm_chamadas.inc(resultado=resultado)
+        logger.warning("Chamada ao LLM falhou (%s): %s", resultado, erro)
+
+    def invoke(self, messages):
+        with self._reservar() as prazo:
+            inicio = time.monotonic()
+            try:
+                resposta = self.llm.invoke(messages)
+            except Exception as e:
+                self._falhou("erro", e)
+                raise LLMIndisponivel(str(e)) from e
+            if time.monotonic() > prazo:
+                self._falhou("tempo_esgotado", f"mais de {self.timeout}s")
+                raise LLMIndisponivel("tempo esgotado")
+            self.breaker.sucesso()
+            llm_chamadas.inc(resultado="sucesso")
+            llm_latencia.observar(time.monotonic() - inicio)
+            return resposta
+
+    def stream(self, messages):
+        """Gera os pedaços de texto da resposta à medida que o LLM os envia."""
+        with self._reservar() as prazo:
+            inicio = time.monotonic()
+            resultado = None
+            try:
+                for pedaco in self.llm.stream(messages):
+                    if time.monotonic() > prazo:
+                        resultado = "tempo_esgotado"
+                        break
+                    if pedaco.content:
+                        yield pedaco.content
+                else:
+                    resultado = "sucesso"
+            except Exception as e:
+                resultado = "erro"
+                self._falhou("erro", e)
+                raise LLMIndisponivel(str(e)) from e
+            finally:
+                # Sem resultado: o consumidor parou de ler no meio (cliente desconectou).
+                if resultado is None:
+                    self.breaker.desistir()
+
+            if resultado == "tempo_esgotado":
+                self._falhou("tempo_esgotado", f"mais de {self.timeout}s")
+                raise LLMIndisponivel("tempo esgotado")
+            self.breaker.sucesso()
+            llm_chamadas.inc(resultado="sucesso")
+            llm_latencia.observar(time.monotonic() - inicio)
+
+
+class LLMStub:
+    """LLM local e determinístico para testes e desenvolvimento sem chave da OpenRouter.
+
+    Responde com a última mensagem do usuário e conta as chamadas recebidas. Com
+    `atraso` espera esse tanto de segundos por palavra; com `falhar` levanta erro.
+    """
+
+    def __init__(self, prefixo="[stub] ", atraso=0.0, falhar=False):
+        self.prefixo = prefixo
+        self.atraso = atraso
+        self.falhar = falhar
+        self.chamadas = 0
+
+    def stream(self, messages):
+        self.chamadas += 1
+        if self.falhar:
+            raise ConnectionError("LLM stub configurado para falhar")
+        ultima = messages[-1][1] if messages else ""
+        palavras = f"{self.prefixo}{ultima}".split(" ")
+        for i, palavra in enumerate(palavras):
+            if self.atraso:
+                time.sleep(self.atraso)
+            yield RespostaLLM(palavra if i == len(palavras) - 1 else palavra + " ")
+
+    def invoke(self, messages):
+        return RespostaLLM("".join(pedaco.content for pedaco in self.stream(messages)))
@@ -0,0 +1,127 @@
+import atexit
+import itertools
+import logging
+import os
+import queue
+import sys
+from logging.handlers import QueueHandler, QueueListener
+
+FORMATO = "%(asctime)s %(levelname)s [%(name)s] %(message)s"
+
+# Linhas barulhentas usam extra={"amostra": AMOSTRA_LOGS}: só 1 em cada N é registrada.
+AMOSTRA_LOGS = int(os.getenv("LOG_AMOSTRA", 10))
+
+_listener = None
+_handler = None
+
+
+class AmostragemFilter(logging.Filter):
+    """Deixa passar 1 de cada N registros das chamadas marcadas com extra={"amostra": N}.
+
+    A contagem é por ponto de chamada (arquivo e linha), então uma linha barulhenta
+    não consome a cota das outras.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._contadores = {}
+
+    def filter(self, record):
+        amostra = getattr(record, "amostra", None)
+        if not amostra or amostra <= 1:
+            return True
+        chave = (record.pathname, record.lineno)
+        contador = self._contadores.get(chave)
+        if contador is None:
+            contador = self._contadores.setdefault(chave, itertools.count())
+        return next(contador) % amostra == 0
+
+
+class _QueueHandlerSemBloqueio(QueueHandler):
+    """Só enfileira o registro: formatação e escrita acontecem na thread do QueueListener.
+
+    Com a fila cheia o registro é descartado em vez de travar a requisição.
+    """
+
+    def __init__(self, fila):
+        super().__init__(fila)
+        self.descartados = 0
+
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.descartados += 1
+
+
+class TemposFormatados:
+    """Formata {"etapa": ms} só quando o registro é de fato escrito."""
+
+    def __init__(self, tempos):
+        self.tempos = tempos
+
+    def __str__(self):
+        return ", ".join(f"{etapa}={ms:.1f}ms" for etapa, ms in self.tempos.items())
+
+
+def _niveis_por_modulo(texto):
+    # "services.chat_service=DEBUG,app=INFO" -> {"services.chat_service": "DEBUG", "app": "INFO"}
+    niveis = {}
+    for parte in filter(None, (p.strip() for p in texto.split(","))):
+        nome, _, nivel = parte.partition("=")
+        if nivel:
+            niveis[nome.strip()] = nivel.strip().upper()
+    return niveis
+
+
+def configurar_logging():
+    """Configura o logging da aplicação uma única vez.
+
+    LOG_LEVEL define o nível geral (INFO por padrão, DEBUG desligado) e LOG_LEVELS
+    ajusta módulos específicos, ex.: LOG_LEVELS="services.chat_service=DEBUG".
+    """
+    global _listener, _handler
+    if _listener is not None:
+        return
+
+    saida = logging.StreamHandler(sys.stderr)
+    saida.setFormatter(logging.Formatter(FORMATO))
+
+    fila = queue.Queue(maxsize=int(os.getenv("LOG_FILA_MAXIMA", 10000)))
+    handler = _handler = _QueueHandlerSemBloqueio(fila)
+    handler.addFilter(AmostragemFilter())
+
+    raiz = logging.getLogger()
+    raiz.handlers[:] = [handler]
+    raiz.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+    for nome, nivel in _niveis_por_modulo(os.getenv("LOG_LEVELS", "")).items():
+        logging.getLogger(nome).setLevel(nivel)
+
+    _listener = QueueListener(fila, saida, respect_handler_level=True)
+    _listener.start()
+
+
+def _parar_listener():
+    if _listener is not None:
+        _listener.stop()
+
+
+def apos_fork():
+    # No processo filho a thread do QueueListener não existe, e a fila pode ter sido copiada
+    # com um lock preso: recomeça com fila, handler e listener novos.
+    global _listener, _handler
+    if _listener is None:
+        return
+    _listener = _handler = None
+    configurar_logging()
+
+
+def logs_descartados():
+    """Quantos registros foram descartados por fila cheia desde o início do processo."""
+    return _handler.descartados if _handler is not None else 0
+
+
+atexit.register(_parar_listener)
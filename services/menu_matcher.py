@@ -0,0 +1,139 @@
+import re
+import unicodedata
+
+from thefuzz import fuzz
+
+from services.metricas import chat_comparacoes_fuzzy
+
+_TOKEN_PATTERN = re.compile(r"\w+")
+_TAMANHO_MINIMO_TOKEN = 3
+_TAMANHO_PREFIXO = 4
+_SCORERS_CONTEM_ITEM = (fuzz.partial_ratio, fuzz.token_sort_ratio, fuzz.token_set_ratio)
+
+
+def normalizar(texto):
+    """Minúsculas e sem acentos: "Pão de Queijo" -> "pao de queijo"."""
+    decomposto = unicodedata.normalize("NFKD", texto.lower())
+    return "".join(c for c in decomposto if not unicodedata.combining(c)).strip()
+
+
+def _chaves_do_token(token):
+    # Além do token inteiro, indexa o prefixo para tolerar plural e erros de
+    # digitação no final da palavra ("coxinhas", "coxinah" -> "coxi").
+    if len(token) < _TAMANHO_MINIMO_TOKEN:
+        return ()
+    if len(token) > _TAMANHO_PREFIXO:
+        return (token, token[:_TAMANHO_PREFIXO])
+    return (token,)
+
+
+class _Automato:
+    """Aho-Corasick: acha todas as ocorrências de vários padrões numa só varredura do texto."""
+
+    def __init__(self, padroes):
+        self._transicoes = [{}]
+        self._falha = [0]
+        self._saidas = [[]]
+
+        for indice, padrao in enumerate(padroes):
+            estado = 0
+            for caractere in padrao:
+                proximo = self._transicoes[estado].get(caractere)
+                if proximo is None:
+                    proximo = len(self._transicoes)
+                    self._transicoes.append({})
+                    self._falha.append(0)
+                    self._saidas.append([])
+                    self._transicoes[estado][caractere] = proximo
+                estado = proximo
+            self._saidas[estado].append(indice)
+
+        fila = list(self._transicoes[0].values())
+        for estado in fila:
+            for caractere, proximo in self._transicoes[estado].items():
+                fila.append(proximo)
+                falha = self._falha[estado]
+                while falha and caractere not in self._transicoes[falha]:
+                    falha = self._falha[falha]
+                candidato = self._transicoes[falha].get(caractere, 0)
+                self._falha[proximo] = candidato if candidato != proximo else 0
+                self._saidas[proximo] = self._saidas[proximo] + self._saidas[self._falha[proximo]]
+
+    def buscar(self, texto):
+        """Retorna o conjunto de índices dos padrões que aparecem em `texto`."""
+        encontrados = set()
+        estado = 0
+        for caractere in texto:
+            while estado and caractere not in self._transicoes[estado]:
+                estado = self._falha[estado]
+            estado = self._transicoes[estado].get(caractere, 0)
+            if self._saidas[estado]:
+                encontrados.update(self._saidas[estado])
+        return encontrados
+
+
+class MenuMatcher:
+    """Índices sobre os nomes do cardápio, montados uma vez por versão do cardápio.
+
+    - nomes normalizados (minúsculas, sem acento), ordenados do maior para o menor;
+    - um autômato Aho-Corasick para achar os nomes que aparecem literalmente na mensagem;
+    - um índice invertido de tokens, para que só os itens que compartilham alguma
+      palavra com a mensagem passem pelos scorers fuzzy.
+
+    Assim o custo por mensagem depende do tamanho da mensagem e do número de
+    candidatos, não do tamanho do cardápio.
+    """
+
+    def __init__(self, cardapio_data):
+        itens = [item for item in cardapio_data if 'nome' in item]
+        por_nome = {}
+        for item in itens:
+            por_nome.setdefault(normalizar(item['nome']), item)
+
+        # Mesma ordem usada na extração: nomes mais longos primeiro.
+        self.nomes = sorted(por_nome, key=len, reverse=True)
+        self.itens = [por_nome[nome] for nome in self.nomes]
+        self._automato = _Automato(self.nomes)
+
+        self._indice_tokens = {}
+        for posicao, nome in enumerate(self.nomes):
+            for token in _TOKEN_PATTERN.findall(nome):
+                for chave in _chaves_do_token(token):
+                    self._indice_tokens.setdefault(chave, set()).add(posicao)
+
+    @staticmethod
+    def assinatura(cardapio_data):
+        """Identifica uma versão do cardápio quando não há um contador de versão disponível."""
+        return tuple((str(item.get('_id')), item.get('nome'), item.get('preco')) for item in cardapio_data)
+
+    def __len__(self):
+        return len(self.nomes)
+
+    def exatos(self, mensagem_normalizada):
+        """Posições dos nomes que aparecem literalmente na mensagem."""
+        return self._automato.buscar(mensagem_normalizada)
+
+    def candidatos(self, mensagem_normalizada):
+        """Posições (em ordem de prioridade) dos itens que podem estar na mensagem."""
+        posicoes = self.exatos(mensagem_normalizada)
+        for token in _TOKEN_PATTERN.findall(mensagem_normalizada):
+            for chave in _chaves_do_token(token):
+                posicoes.update(self._indice_tokens.get(chave, ()))
+        return sorted(posicoes)
+
+    def contem_item(self, mensagem, limiar=80):
+        mensagem_normalizada = normalizar(mensagem)
+        if self.exatos(mensagem_normalizada):
+            return True
+
+        comparacoes = 0
+        try:
+            for posicao in self.candidatos(mensagem_normalizada):
+                nome = self.nomes[posicao]
+                for scorer in _SCORERS_CONTEM_ITEM:
+                    comparacoes += 1
+                    if scorer(mensagem_normalizada, nome) >= limiar:
+                        return True
+            return False
+        finally:
+            chat_comparacoes_fuzzy.inc(comparacoes, etapa="cardapio")
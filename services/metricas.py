@@ -0,0 +1,271 @@
+import bisect
+import threading
+import time
+
+from pymongo import monitoring
+
+BUCKETS_LATENCIA = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escapar(valor):
+    return str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _formatar_labels(nomes, valores, extra=""):
+    pares = [f'{nome}="{_escapar(valor)}"' for nome, valor in zip(nomes, valores)]
+    if extra:
+        pares.append(extra)
+    return "{" + ",".join(pares) + "}" if pares else ""
+
+
+class Contador:
+    tipo = "counter"
+
+    def __init__(self, nome, ajuda, labels=()):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.labels = tuple(labels)
+        self._valores = {}
+        self._lock = threading.Lock()
+
+    def inc(self, valor=1, **labels):
+        chave = tuple(labels.get(nome, "") for nome in self.labels)
+        with self._lock:
+            self._valores[chave] = self._valores.get(chave, 0) + valor
+
+    def amostras(self):
+        with self._lock:
+            itens = list(self._valores.items())
+        return [f"{self.nome}{_formatar_labels(self.labels, chave)} {valor}" for chave, valor in itens]
+
+
+class Histograma:
+    tipo = "histogram"
+
+    def __init__(self, nome, ajuda, labels=(), buckets=BUCKETS_LATENCIA):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observar(self, valor, **labels):
+        chave = tuple(labels.get(nome, "") for nome in self.labels)
+        posicao = bisect.bisect_left(self.buckets, valor)
+        with self._lock:
+            serie = self._series.get(chave)
+            if serie is None:
+                serie = self._series[chave] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            serie[0][posicao] += 1
+            serie[1] += valor
+            serie[2] += 1
+
+    def amostras(self):
+        with self._lock:
+            itens = [(chave, list(contagens), soma, total) for chave, (contagens, soma, total) in self._series.items()]
+
+        linhas = []
+        for chave, contagens, soma, total in itens:
+            acumulado = 0
+            for limite, contagem in zip(self.buckets + ("+Inf",), contagens):
+                acumulado += contagem
+                labels = _formatar_labels(self.labels, chave, 'le="%s"' % limite)
+                linhas.append(f"{self.nome}_bucket{labels} {acumulado}")
+            linhas.append(f"{self.nome}_sum{_formatar_labels(self.labels, chave)} {soma}")
+            linhas.append(f"{self.nome}_count{_formatar_labels(self.labels, chave)} {total}")
+        return linhas
+
+
+class Gauge:
+    """Valor lido na hora da coleta, a partir de uma função que retorna {labels: valor}."""
+    tipo = "gauge"
+
+    def __init__(self, nome, ajuda, ler, labels=()):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.labels = tuple(labels)
+        self._ler = ler
+
+    def amostras(self):
+        return [f"{self.nome}{_formatar_labels(self.labels, chave)} {valor}" for chave, valor in self._ler().items()]
+
+
+class ContadorLido(Gauge):
+    """Como o Gauge, mas para um total que só cresce e é mantido fora do registro."""
+    tipo = "counter"
+
+
+class Registro:
+    def __init__(self):
+        self._metricas = []
+
+    def registrar(self, metrica):
+        self._metricas.append(metrica)
+        return metrica
+
+    def contador(self, nome, ajuda, labels=()):
+        return self.registrar(Contador(nome, ajuda, labels))
+
+    def histograma(self, nome, ajuda, labels=(), buckets=BUCKETS_LATENCIA):
+        return self.registrar(Histograma(nome, ajuda, labels, buckets))
+
+    def gauge(self, nome, ajuda, ler, labels=()):
+        return self.registrar(Gauge(nome, ajuda, ler, labels))
+
+    def contador_lido(self, nome, ajuda, ler, labels=()):
+        return self.registrar(ContadorLido(nome, ajuda, ler, labels))
+
+    def apos_fork(self):
+        """No processo filho: locks novos, porque os herdados podem ter sido copiados presos."""
+        for metrica in self._metricas:
+            if hasattr(metrica, "_lock"):
+                metrica._lock = threading.Lock()
+
+    def exposicao(self):
+        """Todas as métricas no formato texto do Prometheus (versão 0.0.4)."""
+        linhas = []
+        for metrica in self._metricas:
+            linhas.append(f"# HELP {metrica.nome} {metrica.ajuda}")
+            linhas.append(f"# TYPE {metrica.nome} {metrica.tipo}")
+            linhas.extend(metrica.amostras())
+        return "\n".join(linhas) + "\n"
+
+
+registro = Registro()
+
+# --- Rotas HTTP ---
+http_requisicoes = registro.contador(
+    "polichat_http_requisicoes_total", "Requisições HTTP por rota, método e status.", ("rota", "metodo", "status"))
+http_latencia = registro.histograma(
+    "polichat_http_latencia_segundos", "Latência das rotas HTTP.", ("rota", "metodo"))
+
+# --- MongoDB ---
+mongo_comandos = registro.contador(
+    "polichat_mongo_comandos_total", "Comandos enviados ao MongoDB por coleção, comando e resultado.", ("colecao", "comando", "resultado"))
+mongo_latencia = registro.histograma(
+    "polichat_mongo_latencia_segundos", "Duração dos comandos do MongoDB.", ("colecao", "comando"))
+mongo_pool_espera = registro.histograma(
+    "polichat_mongo_pool_espera_segundos", "Tempo de espera por uma conexão livre no pool do MongoDB (checkout).")
+mongo_pool_falhas = registro.contador(
+    "polichat_mongo_pool_falhas_total", "Checkouts do pool do MongoDB que falharam, por motivo.", ("motivo",))
+
+# --- Limites de taxa ---
+limite_rejeicoes = registro.contador(
+    "polichat_limite_rejeicoes_total", "Requisições recusadas com 429 pelos limites de taxa, por limite.", ("limite",))
+
+# --- Chat ---
+chat_mensagens = registro.contador(
+    "polichat_chat_mensagens_total", "Mensagens processadas pelo ChatService por intenção detectada.", ("intencao",))
+chat_comparacoes_fuzzy = registro.contador(
+    "polichat_chat_comparacoes_fuzzy_total", "Comparações feitas pelos scorers fuzzy, por etapa.", ("etapa",))
+llm_cache = registro.contador(
+    "polichat_llm_cache_total", "Consultas ao cache de respostas do LLM por resultado (acerto, falta).", ("resultado",))
+llm_chamadas = registro.contador(
+    "polichat_llm_chamadas_total",
+    "Chamadas ao LLM por resultado (sucesso, erro, tempo_esgotado, circuito_aberto, limite_simultaneas).", ("resultado",))
+llm_latencia = registro.histograma(
+    "polichat_llm_latencia_segundos", "Duração das chamadas ao LLM que terminaram com sucesso.")
+
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """Registra a duração de cada comando do pymongo por coleção e nome do comando."""
+
+    def __init__(self):
+        self._colecoes = {}
+
+    def started(self, event):
+        colecao = event.command.get(event.command_name)
+        self._colecoes[(event.connection_id, event.request_id)] = colecao if isinstance(colecao, str) else ""
+
+    def _registrar(self, event, resultado):
+        colecao = self._colecoes.pop((event.connection_id, event.request_id), "")
+        mongo_comandos.inc(colecao=colecao, comando=event.command_name, resultado=resultado)
+        mongo_latencia.observar(event.duration_micros / 1_000_000, colecao=colecao, comando=event.command_name)
+
+    def succeeded(self, event):
+        self._registrar(event, "sucesso")
+
+    def failed(self, event):
+        self._registrar(event, "falha")
+
+
+class MongoPoolMetrics(monitoring.ConnectionPoolListener):
+    """Conexões do pool do pymongo e o tempo que cada operação espera por uma conexão livre.
+
+    Um tempo de espera alto com `em_uso` igual ao maxPoolSize indica pool pequeno
+    para a carga; `esperando` é quantas operações estão na fila neste momento.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._inicio = threading.local()
+        self._abertas = 0
+        self._em_uso = 0
+        self._esperando = 0
+
+    def estatisticas(self):
+        with self._lock:
+            return {"abertas": self._abertas, "em_uso": self._em_uso, "esperando": self._esperando}
+
+    def reiniciar(self):
+        """Zera as contagens (o pool foi recriado, por exemplo num processo filho).
+
+        Só com uma thread (logo depois do fork): o lock é trocado em vez de adquirido.
+        """
+        self._lock = threading.Lock()
+        self._inicio = threading.local()
+        self._abertas = self._em_uso = self._esperando = 0
+
+    def connection_check_out_started(self, event):
+        # O checkout acontece na thread da própria operação.
+        self._inicio.valor = time.monotonic()
+        with self._lock:
+            self._esperando += 1
+
+    def _fim_da_espera(self, event):
+        with self._lock:
+            self._esperando = max(0, self._esperando - 1)
+        duracao = getattr(event, "duration", None)  # pymongo >= 4.7 já mede
+        inicio = getattr(self._inicio, "valor", None)
+        if duracao is None and inicio is not None:
+            duracao = time.monotonic() - inicio
+        return duracao
+
+    def connection_checked_out(self, event):
+        duracao = self._fim_da_espera(event)
+        with self._lock:
+            self._em_uso += 1
+        if duracao is not None:
+            mongo_pool_espera.observar(duracao)
+
+    def connection_check_out_failed(self, event):
+        self._fim_da_espera(event)
+        mongo_pool_falhas.inc(motivo=event.reason)
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self._em_uso = max(0, self._em_uso - 1)
+
+    def connection_created(self, event):
+        with self._lock:
+            self._abertas += 1
+
+    def connection_closed(self, event):
+        with self._lock:
+            self._abertas = max(0, self._abertas - 1)
+
+    def connection_ready(self, event):
+        pass
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
@@ -0,0 +1,88 @@
+import base64
+
+from bson import json_util
+from flask import Response, jsonify, json as flask_json, stream_with_context
+
+LIMITE_MAXIMO = 500
+TAMANHO_LOTE_STREAM = 200
+
+
+class CursorInvalido(ValueError):
+    pass
+
+
+def ler_parametros(args):
+    """Lê `limit`, `after` e `stream` da query string. Sem `limit`, devolve tudo."""
+    limite = args.get("limit")
+    if limite is not None:
+        limite = int(limite)
+        if limite <= 0:
+            raise ValueError("limit deve ser positivo")
+        limite = min(limite, LIMITE_MAXIMO)
+
+    stream = args.get("stream", "").lower() in ("1", "true", "sim")
+    return limite, args.get("after") or None, stream
+
+
+def codificar_cursor(valores):
+    return base64.urlsafe_b64encode(json_util.dumps(valores).encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decodificar_cursor(cursor, ordenacao):
+    try:
+        preenchimento = "=" * (-len(cursor) % 4)
+        valores = json_util.loads(base64.urlsafe_b64decode(cursor + preenchimento))
+    except Exception as e:
+        raise CursorInvalido(f"Cursor inválido: {cursor}") from e
+
+    if not isinstance(valores, list) or len(valores) != len(ordenacao):
+        raise CursorInvalido(f"Cursor inválido: {cursor}")
+    return valores
+
+
+def filtro_apos(cursor, ordenacao):
+    """Filtro keyset: documentos que vêm depois do cursor na ordenação dada.
+
+    Para [("data", -1), ("_id", -1)] gera
+    {"$or": [{"data": {"$lt": d}}, {"data": d, "_id": {"$lt": i}}]}.
+    """
+    valores = decodificar_cursor(cursor, ordenacao)
+    condicoes = []
+    for posicao, (campo, direcao) in enumerate(ordenacao):
+        condicao = {anterior: valor for (anterior, _), valor in zip(ordenacao[:posicao], valores[:posicao])}
+        condicao[campo] = {"$gt" if direcao == 1 else "$lt": valores[posicao]}
+        condicoes.append(condicao)
+    return {"$or": condicoes}
+
+
+def resposta_paginada(documentos, ordenacao, formatar, limite):
+    """Lista JSON com a página; se a página veio cheia, o próximo cursor vai no header X-Proximo-Cursor."""
+    itens = []
+    ultimo = None
+    for documento in documentos:
+        ultimo = [documento.get(campo) for campo, _ in ordenacao]
+        itens.append(formatar(documento))
+
+    resposta = jsonify(itens)
+    if limite and len(itens) == limite and ultimo is not None:
+        resposta.headers["X-Proximo-Cursor"] = codificar_cursor(ultimo)
+    return resposta
+
+
+def resposta_em_stream(documentos, formatar, tamanho_lote=TAMANHO_LOTE_STREAM):
+    """Gera a lista JSON direto do cursor, em blocos, sem montar o resultado inteiro em memória."""
+    def gerar():
+        yield "["
+        bloco = []
+        primeiro = True
+        for documento in documentos:
+            bloco.append(flask_json.dumps(formatar(documento)))
+            if len(bloco) >= tamanho_lote:
+                yield ("" if primeiro else ",") + ",".join(bloco)
+                primeiro = False
+                bloco = []
+        if bloco:
+            yield ("" if primeiro else ",") + ",".join(bloco)
+        yield "]"
+
+    return Response(stream_with_context(gerar()), mimetype="application/json")
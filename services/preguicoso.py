@@ -0,0 +1,51 @@
+import threading
+
+
+class Preguicoso:
+    """Representa um objeto que só é criado no primeiro uso.
+
+    Atributos e itens são repassados ao objeto criado por `fabrica()`; a criação
+    acontece uma única vez, mesmo com várias threads usando o proxy ao mesmo tempo.
+    Serve para adiar conexões e imports pesados até a primeira requisição que precisa deles.
+    """
+
+    __slots__ = ("_fabrica", "_objeto", "_lock")
+
+    def __init__(self, fabrica):
+        self._fabrica = fabrica
+        self._objeto = None
+        self._lock = threading.Lock()
+
+    def _obter(self):
+        objeto = self._objeto
+        if objeto is None:
+            with self._lock:
+                if self._objeto is None:
+                    self._objeto = self._fabrica()
+                objeto = self._objeto
+        return objeto
+
+    def __getattr__(self, nome):
+        return getattr(self._obter(), nome)
+
+    def __getitem__(self, chave):
+        return self._obter()[chave]
+
+    def __repr__(self):
+        estado = repr(self._objeto) if self._objeto is not None else "ainda não criado"
+        return f"<Preguicoso: {estado}>"
+
+
+def criado(proxy):
+    """Se o objeto por trás do proxy já foi criado (sem criá-lo)."""
+    return proxy._objeto is not None
+
+
+def descartar(proxy):
+    """Esquece o objeto criado; o próximo uso chama a fábrica de novo.
+
+    Feito para o processo filho logo depois de um fork, quando só há uma thread: o lock
+    também é trocado, porque o herdado pode ter sido copiado preso.
+    """
+    proxy._lock = threading.Lock()
+    proxy._objeto = None
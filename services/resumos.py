@@ -0,0 +1,104 @@
+from datetime import datetime
+
+from pymongo import UpdateOne
+
+# Resumos do painel administrativo, mantidos com $inc a cada pedido em vez de varrer `pedidos`:
+# - vendas_diarias: um documento por (dia, item) com quantidade vendida, pedidos e receita;
+# - pedidos_por_status: um documento por status (_id) com a quantidade atual de pedidos.
+# A receita fica em centavos inteiros para que os $inc não acumulem erro de ponto flutuante.
+# Se os resumos divergirem de `pedidos`, python -m db.reconstruir_resumos recalcula tudo.
+# Descontos só valem sobre linhas que já existem e não as deixam negativas: um pedido anterior
+# aos resumos (nunca somado) excluído ou mudado de status não leva os totais abaixo de zero.
+
+FUSO_RELATORIOS = "America/Sao_Paulo"
+
+
+def dia_do_pedido(data):
+    """Dia (AAAA-MM-DD, no fuso da escola) em que o pedido entra nos relatórios."""
+    # Import adiado: o pytz só é carregado no primeiro pedido, não no import do app.
+    import pytz
+
+    data = data or datetime.utcnow()
+    if data.tzinfo is None:
+        data = pytz.utc.localize(data)
+    return data.astimezone(pytz.timezone(FUSO_RELATORIOS)).strftime("%Y-%m-%d")
+
+
+def _centavos(valor):
+    try:
+        return int(round(float(valor) * 100))
+    except (TypeError, ValueError):
+        return 0
+
+
+def _quantidade(item):
+    try:
+        return int(item.get("quantidade", 1))
+    except (TypeError, ValueError):
+        return 0
+
+
+def registrar_venda(banco, pedido, sinal=1, sessao=None):
+    """Soma (sinal=1) ou desconta (sinal=-1) um pedido finalizado dos resumos."""
+    dia = dia_do_pedido(pedido.get("data"))
+    linhas = {}
+    for item in pedido.get("itens") or []:
+        if not isinstance(item, dict) or not item.get("nome"):
+            continue
+        quantidade, centavos = linhas.get(item["nome"], (0, 0))
+        # Itens antigos podem não ter subtotal (ou ter preço e quantidade mal formados):
+        # o cálculo de reserva só roda sem subtotal, e nunca levanta exceção.
+        if "subtotal" in item:
+            centavos_item = _centavos(item["subtotal"])
+        else:
+            centavos_item = _centavos(item.get("preco")) * _quantidade(item)
+        linhas[item["nome"]] = (quantidade + _quantidade(item), centavos + centavos_item)
+
+    if linhas:
+        banco.vendas_diarias.bulk_write([
+            UpdateOne(
+                {"dia": dia, "item": nome} if sinal > 0 else
+                {"dia": dia, "item": nome, "pedidos": {"$gte": 1}, "quantidade": {"$gte": quantidade}},
+                {"$inc": {"quantidade": sinal * quantidade, "pedidos": sinal, "receita_centavos": sinal * centavos}},
+                upsert=sinal > 0
+            )
+            for nome, (quantidade, centavos) in linhas.items()
+        ], ordered=False, session=sessao)
+
+    if sinal > 0:
+        registrar_mudanca_status(banco, None, pedido.get("status"), sessao=sessao)
+    else:
+        registrar_mudanca_status(banco, pedido.get("status"), None, sessao=sessao)
+
+
+def registrar_mudanca_status(banco, status_anterior, status_novo, sessao=None):
+    """Move um pedido de um status para outro nas contagens (None = pedido criado/removido)."""
+    operacoes = []
+    if status_anterior:
+        operacoes.append(UpdateOne({"_id": status_anterior, "quantidade": {"$gte": 1}}, {"$inc": {"quantidade": -1}}))
+    if status_novo:
+        operacoes.append(UpdateOne({"_id": status_novo}, {"$inc": {"quantidade": 1}}, upsert=True))
+    if operacoes:
+        banco.pedidos_por_status.bulk_write(operacoes, ordered=False, session=sessao)
+
+
+def vendas_por_dia(banco, de, ate):
+    """Linhas de vendas_diarias entre os dias `de` e `ate` (inclusive), por dia e item."""
+    return [
+        {
+            "dia": linha["dia"],
+            "item": linha["item"],
+            "quantidade": linha.get("quantidade", 0),
+            "pedidos": linha.get("pedidos", 0),
+            "receita": linha.get("receita_centavos", 0) / 100
+        }
+        for linha in banco.vendas_diarias.find(
+            {"dia": {"$gte": de, "$lte": ate}},
+            {"_id": 0}
+        ).sort([("dia", 1), ("item", 1)])
+        if linha.get("pedidos")
+    ]
+
+
+def pedidos_por_status(banco):
+    return {linha["_id"]: linha.get("quantidade", 0) for linha in banco.pedidos_por_status.find() if linha.get("quantidade")}
@@ -0,0 +1,132 @@
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", 12))
+
+
+class FilaDeSenhasCheia(Exception):
+    """Todas as vagas do pool de hashing estão ocupadas; a rota deve responder 503."""
+
+
+# As duas funções rodam nos processos do pool: o bcrypt é importado lá, nunca no processo do app.
+
+def _gerar_hash(senha, rounds):
+    import bcrypt
+
+    inicio = time.time()
+    return bcrypt.hashpw(senha.encode('utf-8'), bcrypt.gensalt(rounds)).decode('utf-8'), inicio
+
+
+def _verificar(senha, senha_hash):
+    import bcrypt
+
+    inicio = time.time()
+    return bcrypt.checkpw(senha.encode('utf-8'), senha_hash.encode('utf-8')), inicio
+
+
+def custo_do_hash(senha_hash):
+    """Cost factor de um hash bcrypt ("$2b$12$..." -> 12), ou None se não der para ler."""
+    try:
+        return int(senha_hash.split("$")[2])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+
+class PasswordHasher:
+    """Executa bcrypt num pool de processos dedicado, fora das threads do Flask.
+
+    O número de operações pendentes (na fila ou executando) é limitado: quem não
+    consegue uma vaga em `espera_maxima` segundos recebe FilaDeSenhasCheia, em vez
+    de prender o worker esperando atrás de um pico de logins.
+    """
+
+    def __init__(self, workers=None, fila_maxima=32, espera_maxima=0.5, rounds=BCRYPT_ROUNDS):
+        self.workers = workers or os.cpu_count() or 2
+        self.fila_maxima = fila_maxima
+        self.espera_maxima = espera_maxima
+        self.rounds = rounds
+
+        self._reiniciar()
+
+    def _reiniciar(self):
+        self._executor = None
+        self._vagas = threading.BoundedSemaphore(self.fila_maxima)
+        self._lock = threading.Lock()
+        self._pendentes = 0
+        self._concluidas = 0
+        self._rejeitadas = 0
+        self._espera_total = 0.0
+        self._espera_maxima_observada = 0.0
+
+    def apos_fork(self):
+        """No processo filho: o pool de processos do pai não pode ser usado; cria outro no primeiro uso."""
+        self._reiniciar()
+
+    def _obter_executor(self):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    # "spawn": os processos de hashing começam limpos, sem herdar o estado do app
+                    # (MongoClient, threads, locks) como aconteceria com fork.
+                    self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                         mp_context=multiprocessing.get_context("spawn"))
+        return self._executor
+
+    def _executar(self, funcao, *args):
+        if not self._vagas.acquire(timeout=self.espera_maxima):
+            with self._lock:
+                self._rejeitadas += 1
+            raise FilaDeSenhasCheia()
+
+        with self._lock:
+            self._pendentes += 1
+        enviado_em = time.time()
+        try:
+            resultado, iniciado_em = self._obter_executor().submit(funcao, *args).result()
+        finally:
+            self._vagas.release()
+            with self._lock:
+                self._pendentes -= 1
+
+        espera = max(0.0, iniciado_em - enviado_em)
+        with self._lock:
+            self._concluidas += 1
+            self._espera_total += espera
+            self._espera_maxima_observada = max(self._espera_maxima_observada, espera)
+        return resultado
+
+    def gerar_hash(self, senha):
+        return self._executar(_gerar_hash, senha, self.rounds)
+
+    def verificar(self, senha, senha_hash):
+        if isinstance(senha_hash, bytes):
+            senha_hash = senha_hash.decode('utf-8')
+        return self._executar(_verificar, senha, senha_hash)
+
+    def precisa_rehash(self, senha_hash):
+        if isinstance(senha_hash, bytes):
+            senha_hash = senha_hash.decode('utf-8')
+        return custo_do_hash(senha_hash) != self.rounds
+
+    def estatisticas(self):
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "rounds": self.rounds,
+                "fila_maxima": self.fila_maxima,
+                "pendentes": self._pendentes,
+                "concluidas": self._concluidas,
+                "rejeitadas": self._rejeitadas,
+                "espera_media_ms": (self._espera_total / self._concluidas * 1000) if self._concluidas else 0.0,
+                "espera_maxima_ms": self._espera_maxima_observada * 1000,
+            }
+
+
+password_hasher = PasswordHasher(
+    workers=int(os.getenv("SENHAS_WORKERS", 0)) or None,
+    fila_maxima=int(os.getenv("SENHAS_FILA_MAXIMA", 32)),
+    espera_maxima=float(os.getenv("SENHAS_ESPERA_MAXIMA", 0.5))
+)
@@ -0,0 +1,208 @@
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+from db.connection import database
+from services.preguicoso import Preguicoso
+
+logger = logging.getLogger(__name__)
+
+
+class TokenInvalido(Exception):
+    pass
+
+
+def _b64_codificar(dados):
+    return base64.urlsafe_b64encode(dados).rstrip(b"=")
+
+
+def _b64_decodificar(texto):
+    return base64.urlsafe_b64decode(texto + b"=" * (-len(texto) % 4))
+
+
+_CABECALHO = _b64_codificar(json.dumps({"alg": "HS256", "typ": "JWT"}, separators=(",", ":")).encode("utf-8"))
+
+
+class TokenService:
+    """Emite e verifica tokens JWT (HS256) de curta duração com o id e o papel do usuário.
+
+    A verificação usa só HMAC: nenhum bcrypt e nenhuma consulta ao Mongo por requisição.
+    Logout e mudanças de papel são gravados em `colecao` (compartilhada entre os workers,
+    com índice TTL em `exp`) e mantidos numa cópia em memória:
+    - `revogar(claims)` invalida um token específico até ele expirar;
+    - `revogar_usuario(id)` invalida todos os tokens emitidos antes daquele instante.
+
+    A cópia local é atualizada com as revogações feitas em outros processos no máximo a
+    cada `intervalo_sincronia` segundos; as feitas no próprio processo valem na hora.
+    Sem `colecao`, as revogações ficam só em memória.
+    """
+
+    def __init__(self, segredo, ttl=3600, tamanho_cache=10000, colecao=None, intervalo_sincronia=5):
+        self._chave = segredo.encode("utf-8")
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._revogados = {}
+        self._emitidos_a_partir_de = {}
+        self._verificados = OrderedDict()
+        self._tamanho_cache = tamanho_cache
+        self._colecao = colecao
+        self._intervalo_sincronia = intervalo_sincronia
+        self._lock_sincronia = threading.Lock()
+        self._proxima_sincronia = 0.0
+        self._sincronizado_ate = None
+
+    def _assinar(self, conteudo):
+        return _b64_codificar(hmac.new(self._chave, conteudo, hashlib.sha256).digest())
+
+    def emitir(self, usuario_id, role):
+        agora = time.time()
+        claims = {
+            "sub": str(usuario_id),
+            "role": role,
+            "iat": agora,
+            "exp": int(agora + self.ttl),
+            "jti": secrets.token_hex(8)
+        }
+        corpo = _b64_codificar(json.dumps(claims, separators=(",", ":")).encode("utf-8"))
+        conteudo = _CABECALHO + b"." + corpo
+        return (conteudo + b"." + self._assinar(conteudo)).decode("ascii")
+
+    def _decodificar(self, token):
+        claims = self._verificados.get(token)
+        if claims is not None:
+            return claims
+
+        try:
+            cabecalho, corpo, assinatura = token.encode("ascii").split(b".")
+        except (UnicodeEncodeError, ValueError):
+            raise TokenInvalido("Token mal formado")
+
+        if cabecalho != _CABECALHO or not hmac.compare_digest(assinatura, self._assinar(cabecalho + b"." + corpo)):
+            raise TokenInvalido("Assinatura inválida")
+
+        try:
+            claims = json.loads(_b64_decodificar(corpo))
+        except ValueError:
+            raise TokenInvalido("Token mal formado")
+
+        with self._lock:
+            self._verificados[token] = claims
+            if len(self._verificados) > self._tamanho_cache:
+                self._verificados.popitem(last=False)
+        return claims
+
+    def verificar(self, token):
+        claims = self._decodificar(token)
+        self._sincronizar()
+
+        if claims.get("exp", 0) <= time.time():
+            raise TokenInvalido("Token expirado")
+        if claims.get("jti") in self._revogados:
+            raise TokenInvalido("Token revogado")
+        if claims.get("iat", 0) < self._emitidos_a_partir_de.get(claims.get("sub"), 0):
+            raise TokenInvalido("Token revogado")
+        return claims
+
+    def revogar(self, claims):
+        with self._lock:
+            self._limpar_expirados()
+            self._revogados[claims["jti"]] = claims["exp"]
+        if self._colecao is not None:
+            self._colecao.update_one(
+                {"_id": "jti:" + claims["jti"]},
+                {"$set": {"exp": _data(claims["exp"]), "criado": _agora()}},
+                upsert=True
+            )
+
+    def revogar_usuario(self, usuario_id):
+        instante = time.time()
+        with self._lock:
+            self._limpar_expirados()
+            self._emitidos_a_partir_de[str(usuario_id)] = instante
+        if self._colecao is not None:
+            self._colecao.update_one(
+                {"_id": "usuario:" + str(usuario_id)},
+                {"$max": {"desde": instante}, "$set": {"exp": _data(instante + self.ttl), "criado": _agora()}},
+                upsert=True
+            )
+
+    def _sincronizar(self):
+        # Traz as revogações gravadas pelos outros workers desde a última leitura. Só uma
+        # thread consulta o Mongo por vez; as demais seguem com a cópia local.
+        if self._colecao is None or time.monotonic() < self._proxima_sincronia:
+            return
+        if not self._lock_sincronia.acquire(blocking=False):
+            return
+        try:
+            inicio = _agora()
+            filtro = {}
+            if self._sincronizado_ate is not None:
+                # Margem para gravações com o relógio de outra máquina um pouco atrasado.
+                filtro = {"criado": {"$gte": datetime.fromtimestamp(self._sincronizado_ate.timestamp() - 60, timezone.utc)}}
+            try:
+                documentos = list(self._colecao.find(filtro, {"desde": 1, "exp": 1}))
+            except Exception as e:
+                logger.warning("Não foi possível ler as revogações de tokens: %s", e)
+                documentos = []
+            else:
+                self._sincronizado_ate = inicio
+
+            with self._lock:
+                for documento in documentos:
+                    tipo, _, chave = documento["_id"].partition(":")
+                    if tipo == "jti":
+                        self._revogados[chave] = _timestamp(documento["exp"])
+                    elif tipo == "usuario":
+                        desde = documento.get("desde", 0)
+                        if desde > self._emitidos_a_partir_de.get(chave, 0):
+                            self._emitidos_a_partir_de[chave] = desde
+            self._proxima_sincronia = time.monotonic() + self._intervalo_sincronia
+        finally:
+            self._lock_sincronia.release()
+
+    def _limpar_expirados(self):
+        agora = time.time()
+        for jti in [jti for jti, exp in self._revogados.items() if exp <= agora]:
+            del self._revogados[jti]
+        limite = agora - self.ttl
+        for usuario_id in [u for u, instante in self._emitidos_a_partir_de.items() if instante <= limite]:
+            del self._emitidos_a_partir_de[usuario_id]
+
+
+def _agora():
+    return datetime.now(timezone.utc)
+
+
+def _data(timestamp):
+    return datetime.fromtimestamp(timestamp, timezone.utc)
+
+
+def _timestamp(data):
+    # O pymongo devolve datas sem fuso (em UTC) por padrão.
+    if data.tzinfo is None:
+        data = data.replace(tzinfo=timezone.utc)
+    return data.timestamp()
+
+
+def _segredo():
+    segredo = os.getenv("JWT_SECRET")
+    if not segredo:
+        logger.warning("JWT_SECRET não definido; usando um segredo aleatório (tokens não sobrevivem a reinícios).")
+        segredo = secrets.token_hex(32)
+    return segredo
+
+
+token_service = TokenService(
+    _segredo(),
+    ttl=int(os.getenv("TOKEN_TTL_SEGUNDOS", 3600)),
+    colecao=Preguicoso(lambda: database.tokens_revogados),
+    intervalo_sincronia=float(os.getenv("TOKEN_REVOGACAO_SINCRONIA", 5))
+)
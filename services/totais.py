@@ -0,0 +1,19 @@
+def calcular_totais(itens):
+    """Retorna (itens, total) com o "subtotal" (preço x quantidade) gravado em cada linha.
+
+    É chamado no fechamento do pedido, com os preços daquele momento, para que as
+    leituras não precisem recalcular nada nem consultar o cardápio de hoje.
+    Itens mal formatados (sem preço, ou que nem são dicionários) valem 0.
+    """
+    linhas = []
+    total = 0.0
+    for item in itens or []:
+        if isinstance(item, dict):
+            try:
+                subtotal = round(float(item.get("preco", 0)) * int(item.get("quantidade", 1)), 2)
+            except (TypeError, ValueError):
+                subtotal = 0.0
+            item = {**item, "subtotal": subtotal}
+            total += subtotal
+        linhas.append(item)
+    return linhas, round(total, 2)